@@ -0,0 +1,51 @@
+"""
+看板统计数据的版本化缓存
+所有统计只依赖任务数据，而任务数据只在保存时变化：每次保存都让数据版本号递增并清空缓存，
+两次修改之间的读请求直接复用缓存结果；缓存按LRU策略限制条目数量
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class VersionedCache:
+    """按数据版本号整体失效的LRU缓存"""
+
+    def __init__(self, maxsize=128, enabled=True):
+        self.maxsize = maxsize
+        self.enabled = enabled
+        self.version = 0
+        # 最近一次失效（即数据最近一次修改）的时间戳
+        self.modified_at = time.time()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """数据发生修改时调用：版本号递增并丢弃所有缓存结果"""
+        with self._lock:
+            self.version += 1
+            self.modified_at = time.time()
+            self._entries.clear()
+
+    def get_or_compute(self, key, compute):
+        """返回key对应的缓存结果，不存在时调用compute()计算并缓存"""
+        if not self.enabled:
+            return compute()
+
+        with self._lock:
+            version = self.version
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+        value = compute()
+
+        with self._lock:
+            # 计算期间数据被修改时不缓存这个可能已过期的结果
+            if self.version == version:
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return value
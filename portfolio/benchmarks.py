@@ -0,0 +1,414 @@
+"""
+性能基准测试
+按"N个项目 × 每个项目M个任务 × 每个任务K张步骤图片"生成合成数据，在临时目录和测试数据库中
+通过Django测试客户端计时各页面、数据文件读写、portfolio_filters中的每个过滤器以及图片上传和删除，
+结果以JSON保存（各项耗时的百分位数，单位毫秒），并可与之前的结果比较找出性能回退。
+由 manage.py benchmark 调用，不会修改正式的data.json、媒体目录和数据库
+"""
+
+import io
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import tempfile
+import time
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timezone
+from unittest import mock
+
+import django
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+try:
+    from PIL import Image
+except ImportError:  # 未安装Pillow时上传固定的1x1图片
+    Image = None
+
+RESULT_FORMAT_VERSION = 1
+PERCENTILES = (50, 90, 95, 99)
+CATEGORIES = ('R&D', 'UAT', 'Support')
+WORKSHOPS = (1, 2, 3, 4, 5)
+STEPS_PER_TASK = 5
+# 过滤器耗时很短，每个样本连续调用多次后取平均
+FILTER_CALLS_PER_SAMPLE = 200
+# 等待后台图片任务完成的最长时间（秒）
+IMAGE_JOB_TIMEOUT = 30
+# 未安装Pillow时使用的1x1 PNG
+BLANK_PNG = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6300010000000500010d0a2db40000000049454e44ae426082'
+)
+
+
+def generate_dataset(projects=5, tasks=40, images=3, seed=0):
+    """
+    生成与data.json结构相同的合成数据
+
+    Args:
+        projects: 项目数
+        tasks: 每个项目的任务数
+        images: 每个任务的步骤图片数（依次分配到各步骤，正文中引用对应的图片）
+        seed: 随机数种子，相同参数生成相同数据
+
+    Returns:
+        dict: 包含projects、next_task_id、next_project_id
+    """
+    rng = random.Random(seed)
+    data = {'projects': [], 'next_task_id': 1, 'next_project_id': projects + 1}
+    task_id = 1000
+    for project_id in range(1, projects + 1):
+        project = {
+            'id': project_id,
+            'name': f'项目{project_id}',
+            'description': f'合成数据中的第{project_id}个项目。' * 3,
+            'tasks': [],
+        }
+        for _ in range(tasks):
+            task_id += 1
+            step_images = []
+            for index in range(images):
+                step = index % STEPS_PER_TASK + 1
+                file_name = f'task_{task_id}_step_{step}_{index}_bench.jpg'
+                image = {
+                    'step': step,
+                    'url': f'/media/task_step_images/{file_name}',
+                    'file_name': file_name,
+                    'filename': file_name,
+                    'description': f'图片{index + 1}',
+                    'id': task_id * 100 + index,
+                }
+                if index % 2 == 0:
+                    # 一半图片带有缩略图和多尺寸版本
+                    image.update({
+                        'width': 1600,
+                        'height': 900,
+                        'thumbnail_url': f'/media/task_step_images/variants/{file_name[:-4]}_thumb.jpg',
+                        'variants': [
+                            {'width': width, 'url': f'/media/task_step_images/variants/{file_name[:-4]}_{width}w.jpg'}
+                            for width in (320, 640, 1280)
+                        ],
+                    })
+                step_images.append(image)
+            process = []
+            for step in range(1, STEPS_PER_TASK + 1):
+                references = ' '.join(f"[image:{img['file_name']}]" for img in step_images if img['step'] == step)
+                process.append({
+                    'title': f'步骤 {step}',
+                    'content': f'第{step}步的操作说明，' * rng.randint(2, 8) + references,
+                })
+            project['tasks'].append({
+                'id': task_id,
+                'title': f'任务{task_id}',
+                'category': rng.choice(CATEGORIES),
+                'workshop': rng.choice(WORKSHOPS),
+                'description': '合成任务描述。' * rng.randint(1, 5),
+                'process': process,
+                'results': '合成任务结果。',
+                'progress': rng.choice((0, 25, 50, 75, 90, 100)),
+                'pain_points': '1. 痛点一\r\n2. 痛点二',
+                'step_images': step_images,
+            })
+        data['projects'].append(project)
+    data['next_task_id'] = task_id + 1
+    return data
+
+
+def percentile(ordered, percent):
+    """已排序样本的百分位数（线性插值）"""
+    if not ordered:
+        return None
+    position = (len(ordered) - 1) * percent / 100
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    if lower == upper:
+        return ordered[lower]
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(samples, errors=0):
+    """把以秒为单位的样本汇总为毫秒统计"""
+    ordered = sorted(sample * 1000 for sample in samples)
+    summary = {'count': len(ordered), 'errors': errors}
+    if ordered:
+        summary.update({
+            'min_ms': ordered[0],
+            'mean_ms': statistics.fmean(ordered),
+            'stdev_ms': statistics.stdev(ordered) if len(ordered) > 1 else 0.0,
+            'max_ms': ordered[-1],
+        })
+        summary.update({f'p{p}_ms': percentile(ordered, p) for p in PERCENTILES})
+    return summary
+
+
+def _measure(func, iterations, warmup, calls=1):
+    """调用func，返回(每次调用的耗时列表, 出错次数)；func返回False或抛出异常视为出错，出错的调用不计入耗时"""
+    def call():
+        try:
+            return func() is not False
+        except Exception:
+            return False
+
+    errors = 0
+    for _ in range(warmup):
+        call()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        ok = all([call() for _ in range(calls)])
+        if ok:
+            samples.append((time.perf_counter() - start) / calls)
+        else:
+            errors += 1
+    return samples, errors
+
+
+def _filter_arguments(data):
+    """每个过滤器的代表性参数，使用合成数据中的第一个项目和任务"""
+    projects = data['projects']
+    tasks = projects[0]['tasks']
+    task = tasks[0]
+    content = ' '.join(step['content'] for step in task['process'])
+    image = task['step_images'][0] if task['step_images'] else {}
+    return {
+        'split': (content, '，'),
+        'lines': ('\r\n'.join(step['content'] for step in task['process']),),
+        'render_with_images': (content, task),
+        'image_srcset': (image,),
+        'get': ({category: {'color': '#000'} for category in CATEGORIES}, 'UAT'),
+        'task_stats': (projects,),
+        'sum_project_tasks': (projects,),
+        'count_completed_tasks': (projects,),
+        'count_tasks_by_category': (projects, 'R&D'),
+        'filter_tasks_by_category': (tasks, 'R&D'),
+        'filter_tasks_by_workshop': (tasks, 2),
+        'count_tasks_for_project': (tasks, 'UAT'),
+        'count_completed_tasks_for_project': (tasks,),
+        'count_tasks_by_workshop': (projects, 2),
+        'count_tasks_by_workshop_for_project': (tasks, 2),
+        'count_completed_tasks_by_workshop_for_project': (tasks, 2),
+        'get_workshop_completion_rate': (tasks, 2),
+    }
+
+
+def synthetic_png(index):
+    """生成一张内容互不相同的PNG图片，避免按内容去重后只增加引用计数"""
+    if Image is None:
+        return BLANK_PNG
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), (index * 37 % 256, index * 91 % 256, index % 256)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def wait_for_image_jobs():
+    """等待后台图片任务全部完成，之后的请求和检查看到的是处理完成后的数据"""
+    from .image_jobs import ImageJob
+
+    deadline = time.monotonic() + IMAGE_JOB_TIMEOUT
+    while ImageJob.objects.filter(status__in=(ImageJob.PENDING, ImageJob.RUNNING)).exists():
+        if time.monotonic() > deadline:
+            raise RuntimeError('等待图片任务超时')
+        time.sleep(0.01)
+
+
+@contextmanager
+def isolated_environment(data, page_cache=False):
+    """在测试数据库、临时数据文件和临时媒体目录中运行，结束后恢复views的全局数据"""
+    from django.core.cache import caches
+
+    from . import image_handlers, views
+
+    with ExitStack() as stack:
+        work_dir = stack.enter_context(tempfile.TemporaryDirectory(prefix='portfolio-bench-'))
+        media_dir = os.path.join(work_dir, 'media')
+        data_file = os.path.join(work_dir, 'data.json')
+        with open(data_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+
+        setup_test_environment()
+        stack.callback(teardown_test_environment)
+        if connection.vendor == 'sqlite':
+            # 使用文件数据库而不是内存数据库：共享缓存的内存数据库在多线程写入时直接报表被锁定，不会等待
+            stack.enter_context(mock.patch.dict(connection.settings_dict['TEST'], {'NAME': os.path.join(work_dir, 'test.sqlite3')}))
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        stack.callback(connection.creation.destroy_test_db, old_name, verbosity=0)
+
+        stack.enter_context(override_settings(MEDIA_ROOT=media_dir, PORTFOLIO_PAGE_CACHE_ENABLED=page_cache))
+        stack.enter_context(mock.patch.object(image_handlers.image_blobs, 'root_dir', os.path.join(media_dir, 'blobs')))
+        stack.enter_context(mock.patch.object(image_handlers, 'STEP_IMAGE_DIR', os.path.join(media_dir, 'task_step_images')))
+        stack.enter_context(mock.patch.object(views, 'DATA_FILE', data_file))
+        stack.enter_context(mock.patch.object(views, 'data_journal', None))
+        stack.enter_context(mock.patch.object(views, 'shared_data', None))
+
+        original = dict(views.global_data)
+
+        def restore():
+            views.global_data.clear()
+            views.global_data.update(original)
+            views.task_store.rebuild()
+            views.dashboard_cache.invalidate()
+
+        stack.callback(restore)
+        views.global_data.clear()
+        views.global_data.update(json.loads(json.dumps(data)))
+        views.task_store.rebuild()
+        views.dashboard_cache.invalidate()
+        try:
+            caches['pages'].clear()
+        except Exception:
+            pass
+        yield work_dir
+
+
+def run_benchmarks(projects=5, tasks=40, images=3, iterations=30, warmup=3, groups=None, page_cache=False, seed=0):
+    """
+    生成合成数据并运行基准测试
+
+    Args:
+        groups: 只运行的分组（view、persistence、filter、image），None表示全部
+        page_cache: 是否启用整页缓存；默认关闭，测量的是实际渲染耗时
+
+    Returns:
+        dict: 可直接保存为JSON的结果
+    """
+    from . import views
+    from .templatetags.portfolio_filters import register
+
+    groups = set(groups or ('view', 'persistence', 'filter', 'image'))
+    data = generate_dataset(projects, tasks, images, seed)
+    results = {}
+
+    with isolated_environment(data, page_cache=page_cache):
+        # 视图出错时返回500响应而不是抛出异常，出错的页面记入errors，其余测试继续运行
+        client = Client(raise_request_exception=False)
+        first_project = views.global_data['projects'][0]
+        first_task = first_project['tasks'][0]
+        task_url = f"/projects/{first_project['id']}/tasks/{first_task['id']}/"
+
+        if 'view' in groups:
+            pages = {
+                'view:home': '/',
+                'view:task_list': '/tasks/',
+                'view:task_list?category': '/tasks/?category=R%26D',
+                'view:task_list?workshop': '/tasks/?workshop=2',
+                'view:task_list?category&workshop': '/tasks/?category=UAT&workshop=2',
+                'view:project_tasks': f"/projects/{first_project['id']}/tasks/",
+                'view:project_detail': f"/projects/{first_project['id']}/",
+                'view:task_detail': task_url,
+                'view:task_steps': f'{task_url}steps/?start=1&count={STEPS_PER_TASK}',
+                'view:task_related': f'{task_url}related/',
+            }
+            for name, url in pages.items():
+                def request_page(url=url):
+                    response = client.get(url)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                    return response.status_code == 200
+                results[name] = summarize(*_measure(request_page, iterations, warmup))
+
+        if 'persistence' in groups:
+            results['persistence:save_data'] = summarize(
+                *_measure(lambda: views.save_data(views.global_data), iterations, warmup))
+            results['persistence:load_data'] = summarize(
+                *_measure(lambda: bool(views.load_data()['projects']), iterations, warmup))
+
+        if 'filter' in groups:
+            arguments = _filter_arguments(views.global_data)
+            for name, func in sorted(register.filters.items()):
+                if name not in arguments:
+                    results[f'filter:{name}'] = {'count': 0, 'errors': 1, 'skipped': '没有对应的测试参数'}
+                    continue
+                args = arguments[name]
+                results[f'filter:{name}'] = summarize(
+                    *_measure(lambda func=func, args=args: func(*args), iterations, warmup, FILTER_CALLS_PER_SAMPLE))
+
+        if 'image' in groups:
+            results.update(_image_benchmarks(client, task_url, first_task['id'], iterations))
+
+    return {
+        'format': RESULT_FORMAT_VERSION,
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'environment': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'platform': platform.platform(),
+        },
+        'parameters': {
+            'projects': projects, 'tasks': tasks, 'images': images, 'iterations': iterations,
+            'warmup': warmup, 'page_cache': page_cache, 'seed': seed,
+        },
+        'results': results,
+    }
+
+
+def _image_benchmarks(client, task_url, task_id, iterations):
+    """通过update-process-content接口计时上传一张图片和删除一张图片（handle_image_upload/handle_image_deletion）"""
+    from . import views
+
+    url = f'{task_url}update-process-content/'
+    upload_samples, delete_samples = [], []
+    upload_errors = delete_errors = 0
+    for index in range(iterations):
+        task = views.task_store.get_task(views.global_data['projects'][0]['id'], task_id)
+        process_content = '\n'.join(step['content'] for step in task['process'])
+        upload = SimpleUploadedFile(f'bench_{index}.png', synthetic_png(index), content_type='image/png')
+        start = time.perf_counter()
+        response = client.post(url, {'process_content': process_content, 'step_image_1_0': upload})
+        upload_samples.append(time.perf_counter() - start)
+        if response.status_code != 200 or response.json().get('status') != 'success':
+            upload_errors += 1
+            continue
+        wait_for_image_jobs()
+
+        task = views.task_store.get_task(views.global_data['projects'][0]['id'], task_id)
+        file_name = task['step_images'][-1]['file_name']
+        start = time.perf_counter()
+        response = client.post(url, {'process_content': process_content, 'delete_step_image[]': file_name})
+        delete_samples.append(time.perf_counter() - start)
+        if response.status_code != 200 or response.json().get('status') != 'success':
+            delete_errors += 1
+    return {
+        'image:upload': summarize(upload_samples, upload_errors),
+        'image:delete': summarize(delete_samples, delete_errors),
+    }
+
+
+def compare_results(baseline, current, metric='p50_ms', threshold=0.1, min_delta_ms=0.05):
+    """
+    比较两次基准测试结果
+
+    Args:
+        metric: 比较的统计项，例如 p50_ms、p95_ms、mean_ms
+        threshold: 相对变化超过该比例才视为回退或改进
+        min_delta_ms: 绝对变化小于该值（毫秒）时视为测量噪声
+
+    Returns:
+        list: 每项为 {name, baseline, current, change, status}，status为
+              regression、improvement、unchanged、new、missing或error
+    """
+    rows = []
+    base_results = baseline.get('results', {})
+    current_results = current.get('results', {})
+    for name in sorted(set(base_results) | set(current_results)):
+        before = base_results.get(name, {}).get(metric)
+        after = current_results.get(name, {}).get(metric)
+        row = {'name': name, 'baseline': before, 'current': after, 'change': None}
+        if current_results.get(name, {}).get('errors'):
+            row['status'] = 'error'
+        elif before is None and after is not None:
+            row['status'] = 'new'
+        elif after is None:
+            row['status'] = 'missing'
+        else:
+            row['change'] = (after - before) / before if before else 0.0
+            if abs(after - before) < min_delta_ms or abs(row['change']) <= threshold:
+                row['status'] = 'unchanged'
+            else:
+                row['status'] = 'regression' if after > before else 'improvement'
+        rows.append(row)
+    return rows
@@ -0,0 +1,152 @@
+"""
+响应压缩中间件
+根据Accept-Encoding在brotli和gzip之间选择，只压缩超过大小阈值的文本类响应；
+流式响应按块压缩并在每块之后flush，已经生成的部分可以立即发送给浏览器
+"""
+
+import re
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:  # 未安装brotli时只使用gzip
+    brotli = None
+
+# 值得压缩的Content-Type，图片等二进制内容已经压缩过
+COMPRESSIBLE_TYPES = re.compile(r'^(text/|application/(json|javascript|xml|.*\+json|.*\+xml)|image/svg\+xml)')
+ACCEPT_ENCODING_PATTERN = re.compile(r'\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([\d.]+))?\s*')
+# 动态内容的压缩级别：兼顾压缩率和CPU耗时
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def compression_min_size():
+    """小于该字节数的响应不压缩"""
+    return getattr(settings, 'PORTFOLIO_COMPRESSION_MIN_SIZE', 1024)
+
+
+def compression_enabled():
+    return getattr(settings, 'PORTFOLIO_COMPRESSION_ENABLED', True)
+
+
+def accepted_encodings(header):
+    """解析Accept-Encoding，返回q值大于0的编码集合"""
+    accepted = set()
+    for item in (header or '').split(','):
+        match = ACCEPT_ENCODING_PATTERN.fullmatch(item)
+        if not match:
+            continue
+        name, quality = match.groups()
+        try:
+            if quality is not None and float(quality) <= 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(name.lower())
+    return accepted
+
+
+def choose_encoding(header):
+    """优先brotli，其次gzip，客户端都不支持时返回None"""
+    accepted = accepted_encodings(header)
+    if brotli is not None and ('br' in accepted or '*' in accepted):
+        return 'br'
+    if 'gzip' in accepted or '*' in accepted:
+        return 'gzip'
+    return None
+
+
+def compress_stream(chunks, encoding):
+    """逐块压缩流式响应，每块之后flush，保证已渲染的内容不会滞留在压缩器中"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+    else:
+        # wbits=31 输出带gzip头的数据
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+async def compress_async_stream(chunks, encoding):
+    """异步流式响应的逐块压缩"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        async for chunk in chunks:
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        async for chunk in chunks:
+            data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """按Accept-Encoding压缩HTML和JSON响应
+
+    与Django自带的GZipMiddleware相比增加了brotli、可配置的大小阈值，
+    以及流式响应的逐块flush；已经设置Content-Encoding的响应（例如预压缩的静态文件）保持不变
+    """
+
+    def process_response(self, request, response):
+        if not compression_enabled() or not self._should_compress(response):
+            return response
+        if not response.streaming and len(response.content) < compression_min_size():
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = compress_async_stream(response.streaming_content, encoding)
+            else:
+                response.streaming_content = compress_stream(response.streaming_content, encoding)
+            del response.headers['Content-Length']
+        else:
+            content = response.content
+            if encoding == 'br':
+                compressed = brotli.compress(content, quality=BROTLI_QUALITY)
+            else:
+                # 与GZipMiddleware相同，在gzip头中加入随机长度的文件名以缓解BREACH攻击
+                compressed = compress_string(content, max_random_bytes=100)
+            if len(compressed) >= len(content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        # 压缩后的内容与原内容字节不同，强ETag改为弱ETag
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
+
+    def _should_compress(self, response):
+        if response.status_code != 200 or response.has_header('Content-Encoding'):
+            return False
+        if getattr(response, 'file_to_stream', None) is not None:
+            # 文件响应交给服务器的sendfile发送，不经过压缩
+            return False
+        if 'no-transform' in response.get('Cache-Control', ''):
+            return False
+        return bool(COMPRESSIBLE_TYPES.match(response.get('Content-Type', '')))
@@ -0,0 +1,158 @@
+"""
+data.json 的追加式预写日志（journal）
+每次修改只向日志文件追加一条紧凑的JSON记录，写入开销与改动大小成正比；
+后台线程定期把日志合并进快照（data.json），快照通过临时文件加重命名原子写入；
+启动时先加载快照，再按顺序回放日志得到最新数据
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+from contextlib import nullcontext
+
+logger = logging.getLogger(__name__)
+
+
+def atomic_write_json(path, data, **dump_kwargs):
+    """先写入同目录下的临时文件再重命名覆盖，避免写到一半的文件被读取"""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f'.{os.path.basename(path)}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            if isinstance(data, str):
+                f.write(data)
+            else:
+                json.dump(data, f, ensure_ascii=False, **dump_kwargs)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def apply_record(store, record):
+    """将一条日志记录应用到TaskStore上，记录本身是幂等的，可以重复回放"""
+    op = record.get('op')
+    project = store.get_project(record['project_id'])
+    if project is None:
+        return
+
+    if op == 'put_task':
+        new_task = record['task']
+        task = store.get_task(project['id'], new_task['id'])
+        if task is None:
+            store.add_task(project, new_task)
+        else:
+            task.clear()
+            task.update(new_task)
+            store.update_task(task)
+    elif op == 'delete_task':
+        store.delete_task(project, record['task_id'])
+
+    if 'next_task_id' in record:
+        store.data['next_task_id'] = max(store.data.get('next_task_id', 0), record['next_task_id'])
+
+
+class DataJournal:
+    """data.json 的日志持久化，配合TaskStore使用"""
+
+    def __init__(self, data_file, compact_threshold=200, lock=nullcontext):
+        self.data_file = data_file
+        self.log_file = f'{data_file}.journal'
+        # 正在合并中的日志，合并完成前崩溃时启动会一并回放
+        self.pending_file = f'{self.log_file}.compacting'
+        self.compact_threshold = compact_threshold
+        # 修改数据时持有的锁，后台合并在锁内序列化数据，与本进程（共享模式下还有其他进程）的修改互斥
+        self.lock = lock
+        self.store = None
+        self._lock = threading.Lock()
+        self._record_count = 0
+        self._compacting = False
+
+    def _read_records(self, path):
+        """逐行读取日志记录，忽略崩溃时可能残留的不完整末行"""
+        if not os.path.exists(path):
+            return []
+        records = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logger.warning('跳过损坏的日志记录: %s', path)
+        return records
+
+    def replay(self, store):
+        """在已加载快照的store上回放日志，并绑定该store用于后续合并"""
+        self.store = store
+        self._record_count = 0
+        for path in (self.pending_file, self.log_file):
+            for record in self._read_records(path):
+                apply_record(store, record)
+                self._record_count += 1
+        return self._record_count
+
+    def append(self, record):
+        """追加一条修改记录，返回是否写入成功"""
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+        try:
+            with self._lock:
+                with open(self.log_file, 'a', encoding='utf-8') as f:
+                    f.write(line)
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._record_count += 1
+                should_compact = self._record_count >= self.compact_threshold and not self._compacting
+                if should_compact:
+                    self._compacting = True
+        except OSError as e:
+            logger.error('写入日志失败: %s', e)
+            return False
+
+        if should_compact:
+            threading.Thread(target=self._compact_in_background, daemon=True).start()
+        return True
+
+    def _compact_in_background(self):
+        try:
+            self.compact()
+        except Exception as e:
+            logger.exception('日志合并失败: %s', e)
+        finally:
+            self._compacting = False
+
+    def compact(self):
+        """把当前内存数据写成新快照，并清理已经合并进快照的日志"""
+        if self.store is None:
+            return False
+        with self.lock():
+            return self._compact()
+
+    def _compact(self):
+        with self._lock:
+            snapshot = json.dumps(self.store.data, ensure_ascii=False, indent=2)
+
+            # 把当前日志转为待合并日志，之后的新记录写入新的日志文件
+            if os.path.exists(self.log_file):
+                if os.path.exists(self.pending_file):
+                    with open(self.log_file, 'r', encoding='utf-8') as src, \
+                            open(self.pending_file, 'a', encoding='utf-8') as dst:
+                        dst.write(src.read())
+                    os.remove(self.log_file)
+                else:
+                    os.replace(self.log_file, self.pending_file)
+            self._record_count = 0
+
+        atomic_write_json(self.data_file, snapshot)
+        if os.path.exists(self.pending_file):
+            os.remove(self.pending_file)
+        logger.info('日志已合并到快照: %s', self.data_file)
+        return True
@@ -0,0 +1,186 @@
+"""
+任务数据的内存索引层
+在 data.json 加载出的数据之上维护项目ID、任务ID和(分类, workshop)三类索引，
+视图通过索引完成O(1)查找，任务新增、编辑、删除时增量更新索引而不是整体重建
+"""
+
+import bisect
+
+# 分页使用的筛选结果缓存最多保留的条目数
+SORTED_CACHE_SIZE = 256
+
+
+class TaskStore:
+    """带索引的内存任务存储，直接包装load_data()返回的数据字典"""
+
+    def __init__(self, data):
+        self.data = data
+        self.rebuild()
+
+    def rebuild(self):
+        """根据当前数据完整重建所有索引（仅在加载或重新加载数据时调用）"""
+        self._projects = {}
+        self._project_order = {}
+        self._tasks = {}
+        self._task_project = {}
+        self._task_groups = {}
+        self._groups = {}
+        self._sorted_cache = {}
+
+        for index, project in enumerate(self.data.get('projects', [])):
+            project.setdefault('tasks', [])
+            self._projects[project['id']] = project
+            self._project_order[project['id']] = index
+            for task in project['tasks']:
+                self._index_task(project, task)
+
+    @property
+    def projects(self):
+        """按原始顺序返回所有项目"""
+        return self.data.get('projects', [])
+
+    def _index_task(self, project, task):
+        """将单个任务加入各个索引"""
+        self._sorted_cache.clear()
+        group_key = (task.get('category'), task.get('workshop'))
+        self._tasks[task['id']] = task
+        self._task_project[task['id']] = project
+        self._task_groups[task['id']] = group_key
+        self._groups.setdefault(group_key, {})[task['id']] = task
+
+    def _unindex_task(self, task_id):
+        """将单个任务从各个索引中移除"""
+        self._sorted_cache.clear()
+        self._tasks.pop(task_id, None)
+        self._task_project.pop(task_id, None)
+        group_key = self._task_groups.pop(task_id, None)
+        group = self._groups.get(group_key)
+        if group is not None:
+            group.pop(task_id, None)
+            if not group:
+                del self._groups[group_key]
+
+    def get_project(self, project_id):
+        """按项目ID查找项目，不存在时返回None"""
+        return self._projects.get(int(project_id))
+
+    def get_task(self, project_id, task_id):
+        """按任务ID查找任务，并确认任务属于指定项目"""
+        task_id = int(task_id)
+        project = self._task_project.get(task_id)
+        if project is None or project['id'] != int(project_id):
+            return None
+        return self._tasks[task_id]
+
+    def has_project(self, project_id):
+        return int(project_id) in self._projects
+
+    def get_task_project(self, task_id):
+        """返回任务所属的项目"""
+        return self._task_project.get(int(task_id))
+
+    def allocate_task_id(self):
+        """分配新的任务ID"""
+        task_id = self.data.get('next_task_id', 1)
+        self.data['next_task_id'] = task_id + 1
+        return task_id
+
+    def add_task(self, project, task):
+        """向项目追加新任务并更新索引"""
+        project['tasks'].append(task)
+        self._index_task(project, task)
+
+    def update_task(self, task):
+        """任务的分类或workshop被修改后调用，只调整该任务所在的分组"""
+        group_key = (task.get('category'), task.get('workshop'))
+        if self._task_groups.get(task['id']) == group_key:
+            return
+        project = self._task_project[task['id']]
+        self._unindex_task(task['id'])
+        self._index_task(project, task)
+
+    def delete_task(self, project, task_id):
+        """从项目中删除任务并更新索引，返回是否删除成功"""
+        task = self.get_task(project['id'], task_id)
+        if task is None:
+            return False
+        project['tasks'].remove(task)
+        self._unindex_task(task['id'])
+        return True
+
+    def filter_tasks(self, project_id=None, category=None, workshop=None):
+        """按项目、分类和workshop筛选任务，结果保持项目及任务的原始顺序
+
+        category和workshop为None时表示不筛选该条件
+        """
+        if category is None and workshop is None:
+            if project_id is not None:
+                return list(self._projects[int(project_id)]['tasks'])
+            return [task for project in self.projects for task in project['tasks']]
+
+        tasks = []
+        for (group_category, group_workshop), group in self._groups.items():
+            if category is not None and group_category != category:
+                continue
+            if workshop is not None and group_workshop != workshop:
+                continue
+            tasks.extend(group.values())
+
+        if project_id is not None:
+            project_id = int(project_id)
+            tasks = [t for t in tasks if self._task_project[t['id']]['id'] == project_id]
+
+        tasks.sort(key=lambda t: (self._project_order.get(self._task_project[t['id']]['id'], 0), t['id']))
+        return tasks
+
+    def task_sort_key(self, task):
+        """任务列表的排序键：(项目的原始位置, 任务ID)"""
+        return (self._project_order.get(self._task_project[task['id']]['id'], 0), task['id'])
+
+    def page_tasks(self, project_id=None, category=None, workshop=None, after=None, limit=50):
+        """按filter_tasks的顺序返回排在after之后的最多limit + 1个任务
+
+        排好序的筛选结果按筛选条件缓存，任务增删或分组变化时清空；
+        翻页只需在排序键上二分查找，与已翻过的页数无关
+        """
+        if project_id is not None:
+            project_id = int(project_id)
+        cache_key = (project_id, category, workshop)
+        entry = self._sorted_cache.get(cache_key)
+        if entry is None:
+            tasks = self.filter_tasks(project_id, category, workshop)
+            entry = ([self.task_sort_key(t) for t in tasks], tasks)
+            if len(self._sorted_cache) >= SORTED_CACHE_SIZE:
+                self._sorted_cache.clear()
+            self._sorted_cache[cache_key] = entry
+        keys, tasks = entry
+        start = bisect.bisect_right(keys, tuple(after)) if after is not None else 0
+        return tasks[start:start + limit + 1]
+
+    def group_by_project(self, tasks):
+        """按所属项目分组任务，返回[{'id', 'name', 'tasks'}]"""
+        grouped = {}
+        for task in tasks:
+            project = self._task_project.get(task['id'])
+            if project is None:
+                continue
+            if project['id'] not in grouped:
+                grouped[project['id']] = {'id': project['id'], 'name': project['name'], 'tasks': []}
+            grouped[project['id']]['tasks'].append(task)
+        return list(grouped.values())
+
+    def workshop_stats(self, project, workshops):
+        """按workshop统计项目任务总数和完成数，只遍历一次项目任务"""
+        stats = {i: {'total_tasks': 0, 'completed_tasks': 0, 'completion_rate': 0, 'tasks': []} for i in workshops}
+        for task in project['tasks']:
+            entry = stats.get(task.get('workshop'))
+            if entry is None:
+                continue
+            entry['total_tasks'] += 1
+            entry['tasks'].append(task)
+            if task.get('progress') == 100:
+                entry['completed_tasks'] += 1
+        for entry in stats.values():
+            if entry['total_tasks'] > 0:
+                entry['completion_rate'] = round((entry['completed_tasks'] / entry['total_tasks']) * 100)
+        return stats
@@ -0,0 +1,117 @@
+"""
+多进程共享 data.json 的一致性支持
+每个请求前用 stat() 检查数据文件是否被其他进程修改，只在发生变化时才重新解析JSON；
+修改数据时持有 data.json.lock 上的建议性文件锁，保证"读取-修改-写入"期间不会覆盖其他进程的修改
+"""
+
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def _lock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+
+
+def _unlock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class SharedDataFile:
+    """跟踪一组数据文件的状态，并提供跨进程的互斥修改"""
+
+    def __init__(self, data_file, reload_callback, watched_files=()):
+        self.data_file = data_file
+        self.lock_file = f'{data_file}.lock'
+        self.watched_files = (data_file, *watched_files)
+        self.reload_callback = reload_callback
+        # 文件锁只在进程之间互斥，同一进程内的线程还需要一把线程锁
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._signature = self._stat()
+
+    def _stat(self):
+        """返回被监视文件的(修改时间, 大小, inode)，文件不存在时为None"""
+        signature = []
+        for path in self.watched_files:
+            try:
+                st = os.stat(path)
+                signature.append((st.st_mtime_ns, st.st_size, st.st_ino))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def refresh(self):
+        """数据文件在磁盘上发生变化时重新加载，返回是否进行了重新加载
+
+        本进程有其他线程正在修改或加载数据时直接跳过：新数据在加载完成后才整体替换，
+        跳过的请求继续使用替换前完整的旧数据
+        """
+        if not self._thread_lock.acquire(blocking=False):
+            return False
+        try:
+            return self._refresh()
+        finally:
+            self._thread_lock.release()
+
+    def _refresh(self):
+        signature = self._stat()
+        if signature == self._signature:
+            return False
+        self.reload_callback()
+        # 数据替换完成后才更新版本标识，页面缓存不会把旧数据渲染的页面存到新版本下；
+        # 记录的是加载前的状态，加载期间的新修改会在下一次检查时被发现
+        self._signature = signature
+        return True
+
+    def version_token(self):
+        """根据文件状态生成的数据版本标识，已同步的各个进程得到的标识相同"""
+        return hashlib.md5(repr(self._signature).encode('utf-8')).hexdigest()[:16]
+
+    def last_modified(self):
+        """被监视文件中最新的修改时间戳（秒）"""
+        mtimes = [entry[0] for entry in self._signature if entry is not None]
+        return max(mtimes) / 1e9 if mtimes else None
+
+    def mark_clean(self):
+        """本进程写入数据后调用，避免把自己的写入当成外部修改重新加载"""
+        self._signature = self._stat()
+
+    @contextmanager
+    def locked(self):
+        """持有跨进程的排他锁，进入时先同步磁盘上的最新数据，支持同一线程内嵌套"""
+        with self._thread_lock:
+            if self._depth:
+                self._depth += 1
+                try:
+                    yield
+                finally:
+                    self._depth -= 1
+                return
+
+            os.makedirs(os.path.dirname(self.lock_file) or '.', exist_ok=True)
+            with open(self.lock_file, 'a+') as f:
+                _lock_file(f)
+                self._depth = 1
+                try:
+                    self._refresh()
+                    yield
+                finally:
+                    self.mark_clean()
+                    self._depth = 0
+                    _unlock_file(f)
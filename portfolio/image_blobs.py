@@ -0,0 +1,238 @@
+"""
+按内容寻址的图片存储
+上传的图片按SHA-256存放为 blobs/<前两位>/<哈希><扩展名>，相同内容只保存一份；
+ImageBlob表记录每个文件的引用计数，删除图片时只减少引用，最后一个引用消失时才删除文件及其缩略图
+"""
+
+import glob
+import hashlib
+import logging
+import os
+import tempfile
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+from .image_variants import VARIANTS_DIR
+from .instrumentation import record_image_io
+
+logger = logging.getLogger(__name__)
+
+
+def unlink_files(paths, max_workers=8):
+    """并行删除一组文件，已经不存在的文件视为删除成功，返回删除失败的路径列表"""
+    def unlink(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning('文件删除失败: %s: %s', path, e)
+            return path
+        return None
+
+    paths = list(paths)
+    if len(paths) <= 1:
+        results = map(unlink, paths)
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as executor:
+            results = list(executor.map(unlink, paths))
+    return [path for path in results if path is not None]
+
+
+# 已写入存储目录、尚未登记到数据库的文件；owned为True时临时文件由BlobStore创建，登记后负责删除
+StagedFile = namedtuple('StagedFile', 'temp_path sha256 size extension owned')
+
+
+class ImageBlob(models.Model):
+    """按内容哈希存储的图片文件"""
+    sha256 = models.CharField(max_length=64, unique=True, help_text="文件内容的SHA-256")
+    path = models.CharField(max_length=255, help_text="相对于存储目录的文件路径")
+    size = models.BigIntegerField(default=0)
+    ref_count = models.IntegerField(default=0, help_text="引用该文件的图片数量")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.ref_count})"
+
+
+class BlobStore:
+    """内容寻址的文件存储，root_dir对应的URL前缀为url_prefix"""
+
+    def __init__(self, root_dir, url_prefix):
+        self.root_dir = root_dir
+        self.url_prefix = url_prefix.rstrip('/')
+
+    def relative_path(self, sha256, extension):
+        return f'{sha256[:2]}/{sha256}{extension.lower()}'
+
+    def full_path(self, relative_path):
+        return os.path.join(self.root_dir, *relative_path.split('/'))
+
+    def url(self, relative_path):
+        return f'{self.url_prefix}/{relative_path}'
+
+    def store(self, chunks, extension):
+        """边写临时文件边计算哈希，内容已存在时只增加引用计数
+
+        Args:
+            chunks: 文件内容的字节块迭代器，例如UploadedFile.chunks()
+            extension: 文件扩展名（包含点号）
+
+        Returns:
+            ImageBlob: 存储后的记录
+        """
+        staged = self._spool(chunks, extension)
+        record_image_io('store', staged.size)
+        return self.commit_staged([staged])[0]
+
+    def store_upload(self, uploaded_file, extension):
+        """保存上传文件；流式上传处理器已经算好哈希时直接移动临时文件，不再复制和重新计算"""
+        staged = self._stage_upload(uploaded_file, extension)
+        if staged.owned:
+            record_image_io('store', staged.size)
+        return self.commit_staged([staged])[0]
+
+    def stage_uploads(self, uploads, max_workers=4):
+        """用有界线程池并行把一批上传文件写入临时文件并计算哈希，不访问数据库
+
+        Args:
+            uploads: (UploadedFile, 扩展名) 列表
+
+        Returns:
+            list: 与uploads一一对应的StagedFile，写入失败的位置为对应的异常
+        """
+        def stage(upload):
+            try:
+                return self._stage_upload(*upload)
+            except Exception as e:
+                return e
+
+        uploads = list(uploads)
+        if len(uploads) <= 1:
+            results = [stage(upload) for upload in uploads]
+        else:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(uploads)), thread_name_prefix='portfolio-upload') as executor:
+                results = list(executor.map(stage, uploads))
+        record_image_io('store', sum(item.size for item in results if isinstance(item, StagedFile) and item.owned))
+        return results
+
+    def store_file(self, file_path):
+        """把磁盘上已有的文件纳入存储（用于整理历史图片），原文件保持不变"""
+        def chunks():
+            with open(file_path, 'rb') as f:
+                while True:
+                    chunk = f.read(64 * 1024)
+                    if not chunk:
+                        return
+                    yield chunk
+        return self.store(chunks(), os.path.splitext(file_path)[1])
+
+    def _stage_upload(self, uploaded_file, extension):
+        sha256 = getattr(uploaded_file, 'sha256', None)
+        if sha256 and hasattr(uploaded_file, 'temporary_file_path'):
+            extension = getattr(uploaded_file, 'image_extension', '') or extension
+            return StagedFile(uploaded_file.temporary_file_path(), sha256, uploaded_file.size, extension, False)
+        return self._spool(uploaded_file.chunks(), extension)
+
+    def _spool(self, chunks, extension):
+        os.makedirs(self.root_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=self.root_dir, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        return StagedFile(temp_path, digest.hexdigest(), size, extension, True)
+
+    def commit_staged(self, staged):
+        """在一个事务中登记一批暂存文件：增加已有内容的引用计数，用一条bulk_create创建新记录，再放置文件
+
+        可以在调用方的事务中执行，与引用这些文件的记录一起提交；SQLite的写事务保证与release互斥。
+        同一内容在批内出现多次时只保留一份文件，引用计数按出现次数增加
+
+        Returns:
+            list: 与staged一一对应的ImageBlob
+        """
+        if not staged:
+            return []
+        counts = Counter(item.sha256 for item in staged)
+        first = {}
+        for item in staged:
+            first.setdefault(item.sha256, item)
+        try:
+            for _ in range(2):
+                try:
+                    with transaction.atomic():
+                        ImageBlob.objects.filter(sha256__in=counts).update(ref_count=F('ref_count') + Case(
+                            *[When(sha256=sha256, then=Value(count)) for sha256, count in counts.items()],
+                            output_field=IntegerField()
+                        ))
+                        blobs = {blob.sha256: blob for blob in ImageBlob.objects.filter(sha256__in=counts)}
+                        created = ImageBlob.objects.bulk_create([
+                            ImageBlob(
+                                sha256=sha256,
+                                path=self.relative_path(sha256, first[sha256].extension),
+                                size=first[sha256].size,
+                                ref_count=count
+                            )
+                            for sha256, count in counts.items() if sha256 not in blobs
+                        ])
+                        blobs.update((blob.sha256, blob) for blob in created)
+                        for sha256, blob in blobs.items():
+                            final_path = self.full_path(blob.path)
+                            if not os.path.exists(final_path):
+                                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                                os.replace(first[sha256].temp_path, final_path)
+                        return [blobs[item.sha256] for item in staged]
+                except IntegrityError:
+                    # 其他线程或进程同时创建了同一内容的记录，重试时走增加引用计数的分支
+                    continue
+            raise IntegrityError(f'无法保存图片文件: {", ".join(counts)}')
+        finally:
+            for item in staged:
+                if item.owned and os.path.exists(item.temp_path):
+                    os.remove(item.temp_path)
+
+    def release(self, sha256):
+        """减少一次引用，引用计数归零时删除文件及其缩略图，返回是否删除了文件"""
+        return bool(self.release_many([sha256]))
+
+    def release_many(self, sha256_list):
+        """批量减少引用（同一哈希出现几次就减几次），返回引用计数归零而被删除的文件路径
+
+        引用计数的更新和记录的删除各只需一条SQL，文件在事务提交之前并行删除，
+        避免同一内容的新上传在此期间被误删
+        """
+        counts = Counter(sha256_list)
+        if not counts:
+            return []
+        with transaction.atomic():
+            ImageBlob.objects.filter(sha256__in=counts).update(ref_count=F('ref_count') - Case(
+                *[When(sha256=sha256, then=Value(count)) for sha256, count in counts.items()],
+                output_field=IntegerField()
+            ))
+            released = list(ImageBlob.objects.filter(sha256__in=counts, ref_count__lte=0).values_list('id', 'path'))
+            if not released:
+                return []
+            ImageBlob.objects.filter(id__in=[blob_id for blob_id, _ in released]).delete()
+            paths = [path for _, path in released]
+            unlink_files(file_path for path in paths for file_path in self._blob_files(path))
+        return paths
+
+    def exists(self, sha256):
+        return ImageBlob.objects.filter(sha256=sha256).exists()
+
+    def _blob_files(self, relative_path):
+        """文件本身及其所有缩略图和多尺寸版本"""
+        file_path = self.full_path(relative_path)
+        stem = os.path.splitext(os.path.basename(file_path))[0]
+        return [file_path, *glob.glob(os.path.join(os.path.dirname(file_path), VARIANTS_DIR, f'{stem}_*'))]
@@ -3,12 +3,33 @@
 包含图片模型定义、上传、删除、查询等功能
 """
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.http import JsonResponse
 from django.conf import settings
+from .image_variants import generate_image_variants, delete_image_variants, image_variant_paths
+from .image_jobs import image_job_queue
+from .image_blobs import BlobStore, unlink_files
+from .pagination import decode_cursor, paginate, parse_page_size
 import os
-import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 步骤图片的存储目录和对应的URL前缀（按内容存储之前上传的图片仍在此目录）
+STEP_IMAGE_DIR = os.path.join(settings.BASE_DIR, 'media', 'task_step_images')
+STEP_IMAGE_URL = '/media/task_step_images'
+
+# 按内容哈希去重的图片存储，步骤图片和任务图片共用
+BLOB_URL = '/media/blobs'
+image_blobs = BlobStore(os.path.join(settings.BASE_DIR, 'media', 'blobs'), BLOB_URL)
+
+
+def upload_workers():
+    """一次请求中并行写入上传文件的线程数"""
+    return getattr(settings, 'PORTFOLIO_UPLOAD_WORKERS', 4)
 
 
 def task_image_upload_path(instance, filename):
@@ -26,12 +47,138 @@ class TaskImage(models.Model):
     task_id = models.IntegerField(help_text="关联的任务ID")
     image = models.ImageField(upload_to=task_image_upload_path, help_text="上传的图片")
     description = models.CharField(max_length=200, blank=True, null=True, help_text="图片描述")
+    content_hash = models.CharField(max_length=64, blank=True, default='', db_index=True, help_text="图片内容的SHA-256")
     uploaded_at = models.DateTimeField(auto_now_add=True, help_text="上传时间")
+    # 后台任务生成的缩略图和多尺寸版本: {'width', 'height', 'thumbnail_url', 'variants': [...]}
+    variants = models.JSONField(default=dict, blank=True, help_text="缩略图和多尺寸版本")
+    
+    class Meta:
+        indexes = [
+            # 删除步骤图片时按任务和存储路径精确查找
+            models.Index(fields=['task_id', 'image'], name='portfolio_taskimg_task_img_idx'),
+            # 按任务查询图片并按上传时间排序
+            models.Index(fields=['task_id', 'uploaded_at'], name='portfolio_taskimg_time_idx'),
+        ]
     
     def __str__(self):
         return f"Task {self.task_id} - {self.uploaded_at}"
 
 
+class ImageMetadataStore:
+    """
+    任务图片元数据的统一读取入口
+    
+    task_detail和get_task_images_view都通过这里读取图片：每次只发出一条按(task_id, uploaded_at)索引的查询，
+    只取需要的列；返回新建的字典，不会写回任务数据
+    """
+    
+    FIELDS = ('id', 'task_id', 'image', 'description', 'uploaded_at', 'variants')
+    
+    def _to_dict(self, row):
+        return {
+            'id': row['id'],
+            'task_id': row['task_id'],
+            'file_name': os.path.basename(row['image']),
+            'image_url': TaskImage.image.field.storage.url(row['image']),
+            'description': row['description'] or '',
+            'uploaded_at': row['uploaded_at'].strftime('%Y-%m-%d %H:%M:%S'),
+            'thumbnail_url': row['variants'].get('thumbnail_url'),
+            'variants': row['variants'].get('variants', [])
+        }
+    
+    def images_for_task(self, task_id):
+        """任务的所有图片，按上传时间从新到旧排列"""
+        rows = (
+            TaskImage.objects.filter(task_id=task_id)
+            .order_by('-uploaded_at', '-id')
+            .values(*self.FIELDS)
+        )
+        return [self._to_dict(row) for row in rows]
+    
+    def page_for_task(self, task_id, after=None, limit=50):
+        """
+        按(uploaded_at, id)倒序的一页图片
+        
+        Args:
+            task_id: 任务ID
+            after: 上一页最后一张图片的排序键 [上传时间ISO字符串, 图片ID]，None表示第一页
+            limit: 每页条数
+        
+        Returns:
+            tuple: (本页图片列表, 下一页游标)
+        """
+        return self._page_result(list(self._page_query(task_id, after, limit)), limit)
+    
+    async def apage_for_task(self, task_id, after=None, limit=50):
+        """page_for_task的异步版本，供异步视图使用"""
+        rows = [row async for row in self._page_query(task_id, after, limit)]
+        return self._page_result(rows, limit)
+    
+    def _page_query(self, task_id, after, limit):
+        rows = TaskImage.objects.filter(task_id=task_id)
+        if after is not None:
+            try:
+                uploaded_at = parse_datetime(after[0])
+                image_id = int(after[1])
+            except (IndexError, TypeError, ValueError):
+                raise ValueError('无效的分页游标')
+            if uploaded_at is None:
+                raise ValueError('无效的分页游标')
+            rows = rows.filter(Q(uploaded_at__lt=uploaded_at) | Q(uploaded_at=uploaded_at, id__lt=image_id))
+        return rows.order_by('-uploaded_at', '-id').values(*self.FIELDS)[:limit + 1]
+    
+    def _page_result(self, rows, limit):
+        page, next_cursor = paginate(rows, limit, lambda row: [row['uploaded_at'].isoformat(), row['id']])
+        return [self._to_dict(row) for row in page], next_cursor
+    
+    def step_images_for_task(self, task, db_images):
+        """
+        任务详情页使用的步骤图片列表
+        
+        优先使用任务数据中的step_images；没有时用数据库中的图片补充展示（归入步骤1），但不写回任务数据
+        """
+        if task.get('step_images'):
+            return task['step_images']
+        return [{
+            'step': 1,
+            'url': image['image_url'],
+            'image_url': image['image_url'],
+            'description': image['description'],
+            'file_name': image['file_name']
+        } for image in db_images]
+
+
+image_metadata = ImageMetadataStore()
+
+
+def build_step_image_index(step_images):
+    """
+    为任务的步骤图片建立删除键索引
+    
+    前端发送的删除键有三种形式：文件名、"步骤号_文件名"和"步骤号_图片ID"，
+    每种形式都精确对应到图片在step_images中的位置
+    
+    Args:
+        step_images: 任务的步骤图片列表
+    
+    Returns:
+        dict: 删除键 -> 图片位置列表
+    """
+    index = {}
+    for position, img in enumerate(step_images):
+        step_num = str(img.get('step', ''))
+        filename = img.get('file_name', img.get('filename', ''))
+        keys = set()
+        if filename:
+            keys.add(filename)
+            keys.add(f"{step_num}_{filename}")
+        if img.get('id'):
+            keys.add(f"{step_num}_{img['id']}")
+        for key in keys:
+            index.setdefault(key, []).append(position)
+    return index
+
+
 def handle_image_deletion(task, images_to_delete, DATA_FILE):
     """
     处理图片删除逻辑
@@ -44,8 +191,8 @@ def handle_image_deletion(task, images_to_delete, DATA_FILE):
     Returns:
         dict: 包含删除结果的字典
     """
-    print(f"接收到的删除请求: {images_to_delete}")
-    print(f"删除前图片列表长度: {len(task['step_images'])}")
+    logger.debug('收到 %d 个删除键，删除前图片 %d 张', len(images_to_delete or ()), len(task['step_images']),
+                 extra={'task_id': task['id']})
     
     if not images_to_delete:
         return {
@@ -55,92 +202,70 @@ def handle_image_deletion(task, images_to_delete, DATA_FILE):
             'remaining_count': len(task['step_images'])
         }
     
-    MEDIA_ROOT = os.path.join(settings.BASE_DIR, 'media', 'task_step_images')
-    new_step_images = []
-    deleted_count = 0
+    # 按删除键精确查找要删除的图片位置，不再做子串匹配
+    index = build_step_image_index(task['step_images'])
+    delete_positions = set()
+    for delete_key in images_to_delete:
+        positions = index.get(delete_key)
+        if positions:
+            delete_positions.update(positions)
+            logger.debug('匹配成功: %s', delete_key)
+        else:
+            logger.warning('没有与删除键对应的图片: %s', delete_key, extra={'task_id': task['id']})
+    
+    deleted_images = [img for i, img in enumerate(task['step_images']) if i in delete_positions]
+    new_step_images = [img for i, img in enumerate(task['step_images']) if i not in delete_positions]
+    deleted_count = len(deleted_images)
     failed_to_delete = 0
     
-    # 创建一个包含所有文件名的集合，用于快速匹配
-    delete_filenames = set()
-    for delete_key in images_to_delete:
-        # 提取文件名部分（如果是step_filename格式）
-        parts = delete_key.split('_')
-        if len(parts) > 1:
-            # 尝试提取可能的文件名
-            potential_filename = '_'.join(parts[1:])
-            if '.' in potential_filename:  # 文件名通常包含扩展名
-                delete_filenames.add(potential_filename)
-        # 也添加原始键作为匹配项
-        delete_filenames.add(delete_key)
-    
-    print(f"用于匹配的文件名集合: {delete_filenames}")
-    
-    # 预先收集需要从数据库中删除的图片ID
-    db_images_to_delete = []
-    
-    for img in task['step_images']:
-        step_num = str(img.get('step', ''))
-        # 同时检查'file_name'和'filename'键
+    # 收集需要删除的文件和数据库记录
+    legacy_files = {}
+    variant_paths = []
+    content_hashes = []
+    db_image_ids = []
+    db_image_names = []
+    for img in deleted_images:
         filename = img.get('file_name', img.get('filename', ''))
-        
-        # 构建当前图片的标识
-        current_key = f"{step_num}_{filename}"
-        
-        # 多维度检查是否应该删除
-        should_delete = False
-        
-        # 1. 检查是否在删除集合中
-        if filename in delete_filenames or current_key in delete_filenames:
-            should_delete = True
-            print(f"直接匹配成功: {filename} 或 {current_key} 在删除集合中")
-        # 2. 检查是否与任何删除键部分匹配
-        else:
-            for delete_key in images_to_delete:
-                if filename in delete_key or delete_key in filename:
-                    should_delete = True
-                    print(f"部分匹配成功: {filename} 与 {delete_key}")
-                    break
-        
-        if should_delete:
-            deleted_count += 1
-            # 删除物理文件
-            try:
-                file_path = os.path.join(MEDIA_ROOT, filename)
-                print(f"尝试删除文件: {file_path}")
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                    print(f"✓ 成功删除文件: {file_path}")
-                else:
-                    print(f"⚠ 文件不存在，跳过删除: {file_path}")
-                
-                # 记录需要从数据库删除的图片文件名，用于后续批量删除
-                db_images_to_delete.append(filename)
-            except Exception as e:
-                failed_to_delete += 1
-                print(f"✗ 文件删除失败: {e}")
-                # 即使文件删除失败，仍然从数据中移除该条目
-        else:
-            # 只有不删除的图片才添加到新列表
-            new_step_images.append(img)
+        if img.get('id'):
+            db_image_ids.append(img['id'])
+        if img.get('content_hash'):
+            # 按内容存储的文件可能被其他图片共用，只在最后一个引用删除时才删除文件
+            content_hashes.append(img['content_hash'])
+        elif filename:
+            legacy_files[os.path.join(STEP_IMAGE_DIR, filename)] = img
+            variant_paths.extend(image_variant_paths(img, STEP_IMAGE_DIR))
+            db_image_names.append(os.path.join('task_step_images', filename))
+    
+    # 并行删除按文件名保存的旧图片及其缩略图；即使文件删除失败，仍然从数据中移除该条目
+    failed_paths = set(unlink_files([*legacy_files, *variant_paths]))
+    failed_to_delete += sum(1 for path in legacy_files if path in failed_paths)
+    
+    if content_hashes:
+        try:
+            released = image_blobs.release_many(content_hashes)
+            logger.info('减少 %d 个文件引用，删除了 %d 个不再被引用的文件', len(content_hashes), len(released))
+        except Exception as e:
+            failed_to_delete += len(content_hashes)
+            logger.exception('释放图片文件失败: %s', e)
     
-    # 从数据库中删除对应的图片记录
-    if db_images_to_delete:
+    # 用一条查询删除对应的数据库记录：按主键，或按旧图片的完整存储路径
+    if db_image_ids or db_image_names:
         try:
-            # 查找并删除匹配文件名的数据库记录
-            for filename in db_images_to_delete:
-                # 使用包含查询，因为数据库中的文件名可能包含路径前缀
-                TaskImage.objects.filter(image__contains=filename, task_id=task['id']).delete()
-                print(f"✓ 从数据库中删除图片记录: {filename}")
+            deleted_rows, _ = TaskImage.objects.filter(task_id=task['id']).filter(
+                Q(id__in=db_image_ids) | Q(image__in=db_image_names)
+            ).delete()
+            logger.debug('从数据库中删除 %d 条图片记录', deleted_rows)
         except Exception as e:
-            print(f"✗ 从数据库删除图片记录时出错: {e}")
+            logger.exception('从数据库删除图片记录时出错: %s', e)
     
     # 更新图片列表
     task['step_images'] = new_step_images
-    print(f"删除处理完成: 标记删除 {deleted_count} 张，文件删除失败 {failed_to_delete} 张，剩余 {len(new_step_images)} 张")
+    logger.info('删除了 %d 张图片，文件删除失败 %d 张，剩余 %d 张', deleted_count, failed_to_delete, len(new_step_images),
+                extra={'task_id': task['id']})
     
     # 如果删除操作出现问题，确保至少数据层面的一致性
     if deleted_count > 0 and failed_to_delete > 0:
-        print("警告: 部分文件删除失败，但数据已更新")
+        logger.warning('部分文件删除失败，但数据已更新', extra={'task_id': task['id']})
     
     return {
         'success': True,
@@ -165,8 +290,10 @@ def handle_image_upload(task, request_files, request_post, DATA_FILE):
     """
     uploaded_steps = set()
     uploaded_count = 0
-    print(f"开始处理文件上传，总共收到 {len(request_files)} 个文件")
-    print(f"上传前step_images列表长度: {len(task['step_images'])}")
+    # 需要后台处理的图片，任务数据保存之后再提交到任务队列
+    queued_images = []
+    logger.debug('开始处理文件上传，收到 %d 个文件，已有图片 %d 张', len(request_files), len(task['step_images']),
+                 extra={'task_id': task['id']})
     
     # 先收集所有需要处理的文件，按步骤分组
     files_by_step = {}
@@ -180,11 +307,12 @@ def handle_image_upload(task, request_files, request_post, DATA_FILE):
                         files_by_step[step_num] = []
                     files_by_step[step_num].append((key, image_file))
                 except ValueError:
-                    print(f"解析键名失败: {key}, parts[2]不是有效的步骤号")
+                    logger.warning('解析键名失败: %s，parts[2]不是有效的步骤号', key)
     
-    print(f"按步骤分组后的文件: {json.dumps({k: len(v) for k, v in files_by_step.items()})}")
+    logger.debug('按步骤分组后的文件数: %s', {k: len(v) for k, v in files_by_step.items()})
     
-    # 为每个步骤处理文件
+    # 为每个步骤确定要保存的文件、文件名和描述
+    planned = []
     for step_num, files in files_by_step.items():
         uploaded_steps.add(step_num)
         
@@ -194,89 +322,169 @@ def handle_image_upload(task, request_files, request_post, DATA_FILE):
         max_allowed = 3  # 每个步骤最多3张图片
         remaining_slots = max_allowed - current_count
         
-        print(f"步骤{step_num}: 当前已有{current_count}张图片, 剩余{remaining_slots}个槽位")
+        logger.debug('步骤%d: 当前已有%d张图片，剩余%d个槽位', step_num, current_count, remaining_slots)
         
         # 限制每个步骤的图片数量
         files_to_process = files[:remaining_slots]
         if len(files) > remaining_slots:
-            print(f"警告: 步骤{step_num}超过图片限制，只处理前{remaining_slots}张")
+            logger.warning('步骤%d超过图片限制，只处理前%d张', step_num, remaining_slots, extra={'task_id': task['id']})
         
-        # 处理该步骤的文件
         for index, (key, image_file) in enumerate(files_to_process):
-            try:
-                # 生成唯一文件名，确保包含步骤号
-                file_extension = os.path.splitext(image_file.name)[1].lower()
-                base_name = os.path.splitext(image_file.name)[0]
-                unique_filename = f"task_{task['id']}_step_{step_num}_{index}_{base_name.replace(' ', '_')}{file_extension}"
-                
-                # 保存文件
-                MEDIA_ROOT = os.path.join(settings.BASE_DIR, 'media', 'task_step_images')
-                os.makedirs(MEDIA_ROOT, exist_ok=True)
-                file_path = os.path.join(MEDIA_ROOT, unique_filename)
-                
-                with open(file_path, 'wb+') as destination:
-                    for chunk in image_file.chunks():
-                        destination.write(chunk)
-                
-                # 获取描述，支持两种格式的键名
-                description_key = f"step_description_{step_num}_{index}"
-                description = request_post.get(description_key, '')
-                # 如果找不到带索引的描述，尝试不带索引的
-                if not description:
-                    description_key = f"step_description_{step_num}"
-                    description = request_post.get(description_key, '')
-                
-                # 构建URL
-                image_url = f'/media/task_step_images/{unique_filename}'
-                
-                # 创建图片数据对象，明确关联到当前步骤
-                image_data = {
-                    'step': step_num,
-                    'url': image_url,
-                    'file_name': unique_filename,
-                    'filename': unique_filename,
-                    'description': description
-                }
-                
-                # 添加到任务的步骤图片列表
-                task['step_images'].append(image_data)
-                uploaded_count += 1
-                print(f"成功上传图片到步骤{step_num}: {unique_filename} (第{uploaded_count}张)")
-                
-                # 同时将图片保存到数据库
-                try:
-                    task_image = TaskImage(
+            # 生成唯一文件名，确保包含步骤号
+            file_extension = os.path.splitext(image_file.name)[1].lower()
+            base_name = os.path.splitext(image_file.name)[0]
+            unique_filename = f"task_{task['id']}_step_{step_num}_{index}_{base_name.replace(' ', '_')}{file_extension}"
+            
+            # 获取描述，支持两种格式的键名
+            description = request_post.get(f"step_description_{step_num}_{index}", '')
+            # 如果找不到带索引的描述，尝试不带索引的
+            if not description:
+                description = request_post.get(f"step_description_{step_num}", '')
+            
+            planned.append((step_num, unique_filename, description, image_file, file_extension))
+    
+    # 各文件的写入互不依赖，在有界线程池中并行进行，耗时接近最大的单个文件而不是所有文件之和
+    staged = image_blobs.stage_uploads(
+        [(image_file, file_extension) for *_, image_file, file_extension in planned],
+        max_workers=upload_workers()
+    )
+    accepted = []
+    for plan, item in zip(planned, staged):
+        if isinstance(item, Exception):
+            logger.error('保存步骤%d的图片时出错: %s', plan[0], item, extra={'task_id': task['id']})
+        else:
+            accepted.append((plan, item))
+    
+    # 文件引用计数和图片记录在同一个事务中批量写入，每张图片不再单独提交
+    blobs, rows = [], []
+    if accepted:
+        try:
+            with transaction.atomic():
+                blobs = image_blobs.commit_staged([item for _, item in accepted])
+                rows = TaskImage.objects.bulk_create([
+                    TaskImage(
                         task_id=task['id'],
-                        image=os.path.join('task_step_images', unique_filename),
-                        description=description
+                        image=os.path.relpath(image_blobs.full_path(blob.path), settings.MEDIA_ROOT).replace(os.sep, '/'),
+                        description=description,
+                        content_hash=blob.sha256
                     )
-                    task_image.save()
-                    print(f"✓ 图片已保存到数据库: {unique_filename}")
-                    # 更新image_data，添加数据库ID
-                    image_data['id'] = task_image.id
-                except Exception as db_error:
-                    print(f"✗ 保存到数据库失败: {db_error}")
-            
-            except Exception as e:
-                print(f"处理步骤{step_num}的图片时出错: {e}")
-                continue
-            except (ValueError, IndexError) as e:
-                print(f"处理上传图片时出错: {e}")
-                continue
+                    for ((_, _, description, _, _), _), blob in zip(accepted, blobs)
+                ])
+        except Exception as e:
+            logger.exception('保存上传的图片时出错: %s', e, extra={'task_id': task['id']})
+            blobs, rows = [], []
+    
+    for ((step_num, unique_filename, description, _, _), _), blob, row in zip(accepted, blobs, rows):
+        image_url = image_blobs.url(blob.path)
+        
+        # 创建图片数据对象，明确关联到当前步骤；file_name仍按任务和步骤命名，用于标识和删除图片
+        # 缩略图生成交给后台任务，请求只登记待处理的图片
+        task['step_images'].append({
+            'step': step_num,
+            'url': image_url,
+            'file_name': unique_filename,
+            'filename': unique_filename,
+            'content_hash': blob.sha256,
+            'description': description,
+            'id': row.id,
+            'status': 'processing'
+        })
+        queued_images.append({
+            'task_id': task['id'],
+            'step': step_num,
+            'file_name': unique_filename,
+            'url': image_url,
+            'content_hash': blob.sha256,
+            'description': description,
+            'image_id': row.id
+        })
+        uploaded_count += 1
+        logger.debug('上传图片到步骤%d: %s（第%d张）', step_num, unique_filename, uploaded_count)
     
-    print(f"图片处理完成，总共成功上传 {uploaded_count} 张图片，最终step_images列表长度: {len(task['step_images'])}")
+    logger.info('上传了 %d 张图片，现有图片 %d 张', uploaded_count, len(task['step_images']), extra={'task_id': task['id']})
     
     return {
         'success': True,
         'uploaded_count': uploaded_count,
         'final_image_count': len(task['step_images']),
-        'uploaded_steps': list(uploaded_steps)
+        'uploaded_steps': list(uploaded_steps),
+        'queued_images': queued_images
     }
 
 
-def get_task_images_view(request, project_id, task_id):
+def process_step_image(payload):
+    """
+    后台任务：为已经写入磁盘并登记了图片记录的步骤图片生成缩略图和多尺寸版本
+    
+    Args:
+        payload: handle_image_upload登记的图片信息
+    
+    Returns:
+        dict: 需要合并进step_images条目的字段
+    """
+    file_path = step_image_file_path(payload)
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"图片文件不存在: {payload['file_name']}")
+    
+    updates = {'status': 'ready'}
+    variants = {}
+    # 生成缩略图和多尺寸版本，失败时仍保留原图
+    try:
+        variants = generate_image_variants(file_path, os.path.dirname(payload.get('url') or f"{STEP_IMAGE_URL}/"))
+        updates.update(variants)
+    except Exception as variant_error:
+        logger.warning('生成缩略图失败: %s: %s', payload['file_name'], variant_error)
+    
+    # 上传请求已经批量创建了图片记录；之前版本登记的任务没有image_id，在这里创建
+    if payload.get('image_id'):
+        updates['id'] = payload['image_id']
+        TaskImage.objects.filter(id=payload['image_id']).update(variants=variants)
+    else:
+        task_image = TaskImage.objects.create(
+            task_id=payload['task_id'],
+            image=os.path.relpath(file_path, settings.MEDIA_ROOT).replace(os.sep, '/'),
+            description=payload.get('description', ''),
+            content_hash=payload.get('content_hash', ''),
+            variants=variants
+        )
+        updates['id'] = task_image.id
+        logger.debug('图片已保存到数据库: %s', payload['file_name'])
+    return updates
+
+
+def step_image_file_path(image):
+    """步骤图片在磁盘上的路径：按内容存储的图片位于blobs目录，其余按文件名位于步骤图片目录"""
+    url = image.get('url', '')
+    if image.get('content_hash') and url.startswith(f'{BLOB_URL}/'):
+        return image_blobs.full_path(url[len(BLOB_URL) + 1:])
+    return os.path.join(STEP_IMAGE_DIR, image.get('file_name', image.get('filename', '')))
+
+
+def discard_step_image(payload, updates):
+    """图片在后台处理期间已被删除时，清理处理过程中生成的文件和数据库记录"""
+    # 按内容存储的文件仍被引用时，缩略图由其他图片共用，不能删除
+    if not payload.get('content_hash') or not image_blobs.exists(payload['content_hash']):
+        delete_image_variants(updates, os.path.dirname(step_image_file_path(payload)))
+    if updates.get('id'):
+        TaskImage.objects.filter(id=updates['id']).delete()
+
+
+@image_job_queue.register('task_image')
+def process_task_image(payload):
+    """后台任务：为upload_task_image上传的图片生成缩略图和多尺寸版本"""
+    task_image = TaskImage.objects.filter(id=payload['image_id']).first()
+    if task_image is None:
+        return {}
+    url_prefix = os.path.dirname(task_image.image.url)
+    variants = generate_image_variants(task_image.image.path, url_prefix)
+    # 保存到图片记录，get_task_images直接返回
+    TaskImage.objects.filter(id=task_image.id).update(variants=variants)
+    return variants
+
+
+async def get_task_images_view(request, project_id, task_id):
     """
-    获取任务相关的所有图片的视图函数
+    获取任务相关的所有图片的视图函数（异步，数据库查询不占用请求线程）
     
     Args:
         request: HTTP请求对象
@@ -284,26 +492,39 @@ def get_task_images_view(request, project_id, task_id):
         task_id: 任务ID
     
     Returns:
-        JsonResponse: 包含图片列表的JSON响应
+        JsonResponse: 包含一页图片列表的JSON响应，next_cursor用于获取下一页
     """
     try:
-        # 获取该任务的所有图片
-        images = TaskImage.objects.filter(task_id=task_id).order_by('-uploaded_at')
+        limit = parse_page_size(request.GET.get('limit'))
+        after = decode_cursor(request.GET.get('cursor'))
+        images, next_cursor = await image_metadata.apage_for_task(task_id, after, limit)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    
+    try:
+        # 尚未完成的后台处理任务，前端据此轮询图片处理进度
+        jobs = await image_job_queue.ajobs_for_task(task_id)
         
         # 构建响应数据
         image_list = [
             {
-                'id': image.id,
-                'url': image.image.url,
-                'description': image.description,
-                'uploaded_at': image.uploaded_at.strftime('%Y-%m-%d %H:%M:%S')
+                'id': image['id'],
+                'url': image['image_url'],
+                'description': image['description'],
+                'uploaded_at': image['uploaded_at'],
+                'thumbnail_url': image['thumbnail_url'],
+                'variants': image['variants']
             }
             for image in images
         ]
         
         return JsonResponse({
             'status': 'success',
-            'images': image_list
+            'images': image_list,
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None,
+            'jobs': [job.to_dict() for job in jobs],
+            'processing': sum(1 for job in jobs if job.status in (job.PENDING, job.RUNNING))
         })
         
     except Exception as e:
@@ -0,0 +1,204 @@
+"""
+图片后处理的本地任务队列
+上传请求只把原图写入磁盘并登记一条任务，缩略图生成、写入图片记录等耗时操作由进程内的线程池在后台完成；
+任务状态持久化在SQLite数据库的ImageJob表中，进程重启后未完成的任务会重新执行，不依赖外部消息队列
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, models, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class ImageJob(models.Model):
+    """图片后处理任务"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, '等待处理'),
+        (RUNNING, '处理中'),
+        (DONE, '已完成'),
+        (FAILED, '失败'),
+    ]
+
+    kind = models.CharField(max_length=50, help_text="任务类型，对应注册的处理函数")
+    task_id = models.IntegerField(help_text="关联的任务ID")
+    payload = models.JSONField(default=dict, help_text="处理函数的参数")
+    result = models.JSONField(null=True, blank=True, help_text="处理结果")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    error = models.TextField(blank=True, default='')
+    attempts = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # 查询某个任务的图片处理进度
+            models.Index(fields=['task_id', 'status'], name='portfolio_imgjob_task_idx'),
+            # 启动时查找未完成的任务
+            models.Index(fields=['status', 'updated_at'], name='portfolio_imgjob_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.id} ({self.status})"
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'error': self.error,
+            'file_name': self.payload.get('file_name', ''),
+            'step': self.payload.get('step'),
+            'result': self.result,
+        }
+
+
+class ImageJobQueue:
+    """基于线程池的图片任务队列
+
+    处理函数通过register(kind)注册，接收任务的payload，返回值作为任务结果保存；
+    run_async为False时在调用enqueue的线程中同步执行，便于调试和管理命令使用
+    """
+
+    def __init__(self, max_workers=2, run_async=True, stale_seconds=600, failed_visible_seconds=3600):
+        self.max_workers = max_workers
+        self.run_async = run_async
+        self.stale_seconds = stale_seconds
+        # 失败的任务在进度查询中保留的时间（秒），之后不再返回
+        self.failed_visible_seconds = failed_visible_seconds
+        self.handlers = {}
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def register(self, kind):
+        """注册某种任务的处理函数（装饰器）"""
+        def decorator(func):
+            self.handlers[kind] = func
+            return func
+        return decorator
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix='portfolio-image-job'
+                )
+            return self._executor
+
+    def _submit(self, job_id):
+        if self.run_async:
+            self._get_executor().submit(self.run_job, job_id)
+        else:
+            self.run_job(job_id)
+
+    def enqueue(self, kind, task_id, payload):
+        """登记一个新任务并提交给线程池，返回ImageJob记录"""
+        job = ImageJob.objects.create(kind=kind, task_id=task_id, payload=payload)
+        self._submit(job.id)
+        return job
+
+    def enqueue_many(self, kind, task_id, payloads):
+        """一次登记多个任务：在一个事务中用bulk_create写入，再逐个提交给线程池"""
+        with transaction.atomic():
+            jobs = ImageJob.objects.bulk_create([
+                ImageJob(kind=kind, task_id=task_id, payload=payload) for payload in payloads
+            ])
+        for job in jobs:
+            self._submit(job.id)
+        return jobs
+
+    async def aenqueue(self, kind, task_id, payload):
+        """enqueue的异步版本；同步执行模式下任务在线程中运行，不阻塞事件循环"""
+        job = await ImageJob.objects.acreate(kind=kind, task_id=task_id, payload=payload)
+        if self.run_async:
+            self._submit(job.id)
+        else:
+            await sync_to_async(self.run_job)(job.id)
+        return job
+
+    async def aenqueue_many(self, kind, task_id, payloads):
+        """enqueue_many的异步版本，数据库写入和同步执行模式下的任务都在线程中进行"""
+        return await sync_to_async(self.enqueue_many)(kind, task_id, payloads)
+
+    def run_job(self, job_id):
+        """执行单个任务；先把状态从pending改为running，多个进程同时恢复任务时只有一个能领取成功"""
+        if self.run_async:
+            close_old_connections()
+        try:
+            claimed = ImageJob.objects.filter(id=job_id, status=ImageJob.PENDING).update(
+                status=ImageJob.RUNNING, attempts=F('attempts') + 1, updated_at=timezone.now()
+            )
+            if not claimed:
+                return
+
+            job = ImageJob.objects.get(id=job_id)
+            try:
+                handler = self.handlers[job.kind]
+                result = handler(job.payload)
+            except Exception as e:
+                logger.exception('图片任务 %s (%s) 处理失败: %s', job_id, job.kind, e)
+                ImageJob.objects.filter(id=job_id).update(
+                    status=ImageJob.FAILED, error=str(e), updated_at=timezone.now()
+                )
+                return
+
+            ImageJob.objects.filter(id=job_id).update(
+                status=ImageJob.DONE, result=result, error='', updated_at=timezone.now()
+            )
+            logger.debug('图片任务 %s (%s) 处理完成', job_id, job.kind)
+        except Exception as e:
+            logger.exception('执行图片任务 %s 时出错: %s', job_id, e)
+        finally:
+            # 线程池中的线程不经过请求流程，需要自行释放数据库连接
+            if self.run_async:
+                close_old_connections()
+
+    def recover(self):
+        """重新提交上次运行中断的任务，返回提交的任务数
+
+        长时间停留在running状态的任务视为进程退出时被中断，先改回pending再重新执行
+        """
+        stale_before = timezone.now() - timedelta(seconds=self.stale_seconds)
+        ImageJob.objects.filter(status=ImageJob.RUNNING, updated_at__lt=stale_before).update(
+            status=ImageJob.PENDING, updated_at=timezone.now()
+        )
+        job_ids = list(ImageJob.objects.filter(status=ImageJob.PENDING).order_by('id').values_list('id', flat=True))
+        for job_id in job_ids:
+            self._submit(job_id)
+        return len(job_ids)
+
+    def _unfinished_jobs(self, task_id):
+        failed_after = timezone.now() - timedelta(seconds=self.failed_visible_seconds)
+        return ImageJob.objects.filter(
+            Q(status__in=(ImageJob.PENDING, ImageJob.RUNNING))
+            | Q(status=ImageJob.FAILED, updated_at__gte=failed_after),
+            task_id=task_id
+        ).order_by('id')
+
+    def jobs_for_task(self, task_id):
+        """等待中和处理中的图片任务，以及最近失败的任务，供前端轮询进度"""
+        return list(self._unfinished_jobs(task_id))
+
+    async def ajobs_for_task(self, task_id):
+        """jobs_for_task的异步版本"""
+        return [job async for job in self._unfinished_jobs(task_id)]
+
+
+image_job_queue = ImageJobQueue(
+    max_workers=getattr(settings, 'PORTFOLIO_IMAGE_JOB_WORKERS', 2),
+    run_async=getattr(settings, 'PORTFOLIO_IMAGE_JOBS_ASYNC', True),
+    stale_seconds=getattr(settings, 'PORTFOLIO_IMAGE_JOB_STALE_SECONDS', 600),
+    failed_visible_seconds=getattr(settings, 'PORTFOLIO_IMAGE_JOB_FAILED_VISIBLE_SECONDS', 3600),
+)
@@ -0,0 +1,128 @@
+"""
+任务步骤图片的缩略图和多尺寸版本生成
+上传时为原图生成一张缩略图和若干宽度的缩小版本（支持时输出WebP），
+生成结果记录在step_images条目中，模板据此输出srcset，浏览器按显示尺寸选择合适的文件
+"""
+
+import os
+from urllib.parse import quote
+
+from django.conf import settings
+
+from .instrumentation import record_image_io
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # 未安装Pillow时跳过图片处理，只保留原图
+    Image = None
+
+# 多尺寸版本存放在原图目录下的variants子目录中
+VARIANTS_DIR = 'variants'
+
+
+def variant_widths():
+    return tuple(getattr(settings, 'PORTFOLIO_IMAGE_VARIANT_WIDTHS', (320, 640, 1280)))
+
+
+def thumbnail_size():
+    return getattr(settings, 'PORTFOLIO_IMAGE_THUMBNAIL_SIZE', 240)
+
+
+def _output_format(image):
+    """优先输出WebP，不支持时透明图片用PNG，其余用JPEG"""
+    if features.check('webp'):
+        return 'WEBP', '.webp'
+    if image.mode in ('RGBA', 'LA', 'P'):
+        return 'PNG', '.png'
+    return 'JPEG', '.jpg'
+
+
+def _save(image, path, image_format):
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    options = {'optimize': True}
+    if image_format in ('JPEG', 'WEBP'):
+        options['quality'] = 82
+    image.save(path, image_format, **options)
+    record_image_io('variants_write', os.path.getsize(path))
+
+
+def generate_image_variants(file_path, url_prefix):
+    """为file_path处的原图生成缩略图和多尺寸版本
+
+    Args:
+        file_path: 原图在磁盘上的路径
+        url_prefix: 原图所在目录对应的URL前缀，例如 /media/task_step_images
+
+    Returns:
+        dict: 可直接合并进step_images条目的字段（width、height、thumbnail_url、variants），
+              无法处理时返回空字典
+    """
+    if Image is None:
+        return {}
+
+    directory = os.path.join(os.path.dirname(file_path), VARIANTS_DIR)
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+
+    record_image_io('variants_read', os.path.getsize(file_path))
+    with Image.open(file_path) as original:
+        # 按EXIF方向信息旋转，避免手机照片缩小后方向错误
+        image = ImageOps.exif_transpose(original)
+        image.load()
+
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or image.mode == 'P' else 'RGB')
+
+    image_format, extension = _output_format(image)
+    width, height = image.size
+    result = {'width': width, 'height': height, 'variants': []}
+
+    # 缩略图：按比例缩小到不超过thumbnail_size的正方形
+    thumb = image.copy()
+    thumb.thumbnail((thumbnail_size(), thumbnail_size()), Image.LANCZOS)
+    thumb_name = f'{stem}_thumb{extension}'
+    _save(thumb, os.path.join(directory, thumb_name), image_format)
+    result['thumbnail_url'] = f'{url_prefix}/{VARIANTS_DIR}/{thumb_name}'
+
+    # 多尺寸版本：只生成比原图窄的宽度
+    for target_width in variant_widths():
+        if target_width >= width:
+            continue
+        target_height = max(1, round(height * target_width / width))
+        variant = image.resize((target_width, target_height), Image.LANCZOS)
+        variant_name = f'{stem}_{target_width}w{extension}'
+        _save(variant, os.path.join(directory, variant_name), image_format)
+        result['variants'].append({
+            'width': target_width,
+            'url': f'{url_prefix}/{VARIANTS_DIR}/{variant_name}',
+        })
+
+    return result
+
+
+def image_variant_paths(image_data, media_dir):
+    """step_images条目记录的缩略图和多尺寸版本在磁盘上的路径"""
+    urls = [v['url'] for v in image_data.get('variants', [])]
+    if image_data.get('thumbnail_url'):
+        urls.append(image_data['thumbnail_url'])
+    return [os.path.join(media_dir, VARIANTS_DIR, os.path.basename(url)) for url in urls]
+
+
+def delete_image_variants(image_data, media_dir):
+    """删除step_images条目记录的缩略图和多尺寸版本文件，返回删除的文件数"""
+    removed = 0
+    for path in image_variant_paths(image_data, media_dir):
+        if os.path.exists(path):
+            os.remove(path)
+            removed += 1
+    return removed
+
+
+def build_srcset(image_data):
+    """根据step_images条目生成img标签的srcset属性值，原图作为最大宽度的候选"""
+    # srcset以逗号和空格分隔候选项，文件名需要转义
+    candidates = [f"{quote(v['url'])} {v['width']}w" for v in image_data.get('variants', [])]
+    if candidates and image_data.get('url') and image_data.get('width'):
+        candidates.append(f"{quote(image_data['url'])} {image_data['width']}w")
+    return ', '.join(candidates)
@@ -0,0 +1,355 @@
+"""
+请求级别的性能统计
+每个请求记录总耗时、数据文件读写（load_data/save_data）耗时、模板过滤器调用次数、
+ORM查询次数和耗时以及图片读写字节数，通过Server-Timing响应头返回给浏览器开发者工具；
+同时汇总为Prometheus文本格式的直方图和计数器，由本机访问的 /metrics/ 接口导出。
+统计数据保存在各进程内存中，多进程部署时由Prometheus分别抓取每个worker
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import Http404, HttpResponse
+
+# Prometheus客户端库的默认直方图区间（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 当前请求的统计对象，后台线程（图片处理任务等）中为None，只计入全局指标
+_current_request = ContextVar('portfolio_request_metrics', default=None)
+
+
+def instrumentation_enabled():
+    return getattr(settings, 'PORTFOLIO_INSTRUMENTATION_ENABLED', True)
+
+
+def server_timing_enabled():
+    """Server-Timing会暴露服务器内部耗时，公网部署时可以关闭，只保留/metrics/"""
+    return getattr(settings, 'PORTFOLIO_SERVER_TIMING', True)
+
+
+def metrics_allowed_ips():
+    return getattr(settings, 'PORTFOLIO_METRICS_ALLOWED_IPS', ('127.0.0.1', '::1'))
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """只增不减的计数器，按标签值分别计数"""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            yield self.name, _format_labels(self.label_names, label_values), value
+
+
+class Histogram:
+    """累积区间的直方图，与Prometheus的histogram类型一致"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # 标签值 -> [各区间计数（非累积，最后一项为+Inf）, 总和, 次数]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *label_values):
+        series = self._series.get(label_values)
+        return series[2] if series else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, ([*counts], total, count)) for key, (counts, total, count) in self._series.items())
+        for label_values, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, float('inf')), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names, label_values, (('le', _format_number(bound)),))
+                yield f'{self.name}_bucket', labels, cumulative
+            labels = _format_labels(self.label_names, label_values)
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, count
+
+
+class MetricsRegistry:
+    """进程内的指标集合"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f'指标 {metric.name} 已存在')
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self.register(Counter(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def render(self):
+        """导出为Prometheus文本格式"""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for sample_name, labels, value in metric.samples():
+                lines.append(f'{sample_name}{labels} {_format_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+REQUEST_DURATION = registry.histogram(
+    'portfolio_request_duration_seconds', '请求处理耗时（流式响应只统计到开始发送为止）', ('view', 'method', 'status'))
+OPERATION_DURATION = registry.histogram(
+    'portfolio_operation_duration_seconds', '数据文件读写等被计时操作的耗时', ('operation',))
+DB_QUERY_DURATION = registry.histogram(
+    'portfolio_db_query_duration_seconds', '单条ORM查询的耗时', ('alias',))
+DB_QUERIES_PER_REQUEST = registry.histogram(
+    'portfolio_db_queries_per_request', '每个请求执行的ORM查询数', ('view',),
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200))
+FILTER_CALLS = registry.counter(
+    'portfolio_template_filter_calls_total', 'portfolio_filters中各模板过滤器的调用次数', ('filter',))
+IMAGE_IO_BYTES = registry.counter(
+    'portfolio_image_io_bytes_total', '图片读写字节数', ('operation',))
+
+
+class RequestMetrics:
+    """单个请求内累计的统计数据"""
+
+    __slots__ = ('timings', 'filter_calls', 'db_queries', 'db_seconds', 'image_bytes')
+
+    def __init__(self):
+        self.timings = {}
+        self.filter_calls = 0
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.image_bytes = 0
+
+    def add_timing(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def server_timing(self, total_seconds):
+        """生成Server-Timing响应头，耗时单位为毫秒"""
+        entries = [f'total;dur={total_seconds * 1000:.1f}']
+        entries.extend(f'{name};dur={seconds * 1000:.1f}' for name, seconds in self.timings.items())
+        if self.db_queries:
+            entries.append(f'db;dur={self.db_seconds * 1000:.1f};desc="{self.db_queries} queries"')
+        if self.filter_calls:
+            entries.append(f'filters;desc="{self.filter_calls} calls"')
+        if self.image_bytes:
+            entries.append(f'image-io;desc="{self.image_bytes} bytes"')
+        return ', '.join(entries)
+
+
+def current_metrics():
+    return _current_request.get()
+
+
+@contextmanager
+def timed(name):
+    """记录with块的耗时，计入当前请求的Server-Timing和全局直方图"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        OPERATION_DURATION.observe(elapsed, name)
+        metrics = _current_request.get()
+        if metrics is not None:
+            metrics.add_timing(name, elapsed)
+
+
+def timed_function(name):
+    """timed的装饰器形式"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_image_io(operation, size):
+    """记录图片读写字节数，operation如 upload、store、variants_read、variants_write、serve"""
+    if not size:
+        return
+    IMAGE_IO_BYTES.inc(size, operation)
+    metrics = _current_request.get()
+    if metrics is not None:
+        metrics.image_bytes += size
+
+
+def count_filter_calls(name, func):
+    """包装模板过滤器以统计调用次数；保留is_safe等属性和原函数签名，Django据此检查参数个数"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        FILTER_CALLS.inc(1, name)
+        metrics = _current_request.get()
+        if metrics is not None:
+            metrics.filter_calls += 1
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def instrument_filters(library):
+    """为模板库中已注册的全部过滤器加上调用计数"""
+    for name, func in list(library.filters.items()):
+        library.filters[name] = count_filter_calls(name, func)
+
+
+def _query_timer(alias):
+    def wrapper(execute, sql, params, many, context):
+        if not instrumentation_enabled():
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            DB_QUERY_DURATION.observe(elapsed, alias)
+            metrics = _current_request.get()
+            if metrics is not None:
+                metrics.db_queries += 1
+                metrics.db_seconds += elapsed
+    wrapper.portfolio_query_timer = True
+    return wrapper
+
+
+def install_query_timer(connection):
+    """为数据库连接安装查询计时，同一连接对象重新连接时不会重复安装
+
+    数据库连接属于各自的线程，异步视图中的ORM查询在sync_to_async的线程中执行；
+    计时器安装在每个线程的连接上，再通过ContextVar计入发起查询的请求
+    """
+    if not any(getattr(wrapper, 'portfolio_query_timer', False) for wrapper in connection.execute_wrappers):
+        connection.execute_wrappers.append(_query_timer(connection.alias))
+
+
+@receiver(connection_created)
+def _install_query_timer_on_connect(sender, connection, **kwargs):
+    install_query_timer(connection)
+
+
+class InstrumentationMiddleware:
+    """为每个请求建立统计上下文，结束时写入Server-Timing并更新全局指标
+
+    放在中间件列表的最前面，统计结果包含其他中间件（例如响应压缩）的耗时
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        # 加载中间件之前已经建立的连接收不到connection_created信号
+        for connection in connections.all(initialized_only=True):
+            install_query_timer(connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not instrumentation_enabled():
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current_request.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_request.reset(token)
+        return self._finish(request, response, metrics, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        """ASGI下的异步版本；sync_to_async线程中的ORM查询通过复制的上下文计入当前请求"""
+        if not instrumentation_enabled():
+            return await self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current_request.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_request.reset(token)
+        return self._finish(request, response, metrics, time.perf_counter() - start)
+
+    def _finish(self, request, response, metrics, elapsed):
+        match = getattr(request, 'resolver_match', None)
+        view_name = (match.view_name if match else None) or 'unresolved'
+        REQUEST_DURATION.observe(elapsed, view_name, request.method, str(response.status_code))
+        DB_QUERIES_PER_REQUEST.observe(metrics.db_queries, view_name)
+        if server_timing_enabled():
+            response['Server-Timing'] = metrics.server_timing(elapsed)
+        return response
+
+
+def metrics_view(request):
+    """以Prometheus文本格式导出指标，只允许PORTFOLIO_METRICS_ALLOWED_IPS中的地址访问"""
+    if request.META.get('REMOTE_ADDR') not in metrics_allowed_ips():
+        raise Http404('页面不存在')
+    return HttpResponse(registry.render(), content_type=PROMETHEUS_CONTENT_TYPE)
@@ -0,0 +1,359 @@
+"""
+并发负载测试
+多个客户端线程按配置的比例混合发送读请求（首页、任务列表、任务详情）和写请求
+（update-process-content修改步骤内容，可同时上传和删除图片），统计吞吐量、各类请求的延迟百分位数、
+出错次数和丢失的更新。请求可以在进程内直接交给Django处理，也可以通过本机端口发给内置的WSGI服务器；
+数据文件、媒体目录和数据库都使用benchmarks.isolated_environment中的临时副本，不需要联网。
+
+丢失更新的检测：每个客户端线程独占一组任务，同一任务的写请求按顺序发送，
+因此每个任务最后一次确认成功的修改必须出现在最终写入磁盘的data.json中；
+确认上传的最新图片必须存在，确认删除的图片不能再出现
+"""
+
+import http.client
+import itertools
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+from django.test import Client, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.utils.crypto import get_random_string
+
+from .benchmarks import (
+    RESULT_FORMAT_VERSION, STEPS_PER_TASK, generate_dataset, isolated_environment, summarize, synthetic_png,
+    wait_for_image_jobs,
+)
+
+# 默认的请求比例：读多写少
+DEFAULT_MIX = {'home': 3, 'task_list': 3, 'task_detail': 2, 'edit': 1, 'edit_image': 1}
+REQUEST_TYPES = ('home', 'task_list', 'task_detail', 'edit', 'edit_image')
+# 上传图片使用的步骤，合成数据的图片从步骤1开始分配，最后一个步骤通常没有图片
+UPLOAD_STEP = STEPS_PER_TASK
+MODES = ('inprocess', 'socket')
+
+
+def parse_mix(text):
+    """解析 "home=3,edit=1" 形式的请求比例"""
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in REQUEST_TYPES:
+            raise ValueError(f'未知的请求类型: {name}')
+        try:
+            mix[name] = float(weight) if weight else 1.0
+        except ValueError:
+            raise ValueError(f'无效的比例: {item}')
+        if mix[name] < 0:
+            raise ValueError(f'无效的比例: {item}')
+    if not any(mix.values()):
+        raise ValueError('请求比例不能全部为0')
+    return mix
+
+
+class InProcessTransport:
+    """在当前进程内把请求交给Django处理（经过完整的中间件）"""
+
+    def __init__(self):
+        # 测试客户端通过进程全局的got_request_exception信号收集视图异常，
+        # 多个线程同时使用时一个线程的异常会在其他线程中重新抛出；这里只看响应状态码，5xx记为出错
+        self.client = Client(raise_request_exception=False)
+
+    def get(self, path):
+        response = self.client.get(path)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response.status_code, body
+
+    def post(self, path, data):
+        response = self.client.post(path, data)
+        return response.status_code, response.content
+
+
+class SocketTransport:
+    """通过本机端口向WSGI服务器发送HTTP请求；自带CSRF cookie和请求头"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        token = get_random_string(32)
+        self.headers = {'Cookie': f'csrftoken={token}', 'X-CSRFToken': token}
+
+    def _request(self, method, path, body=None, headers=None):
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        try:
+            connection.request(method, path, body=body, headers={**self.headers, **(headers or {})})
+            response = connection.getresponse()
+            return response.status, response.read()
+        finally:
+            connection.close()
+
+    def get(self, path):
+        return self._request('GET', path)
+
+    def post(self, path, data):
+        body = encode_multipart(BOUNDARY, data)
+        return self._request('POST', path, body, {'Content-Type': MULTIPART_CONTENT})
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalServer:
+    """在后台线程中运行的多线程WSGI服务器，监听127.0.0.1上的随机端口"""
+
+    def __init__(self):
+        self.server = ThreadedWSGIServer(('127.0.0.1', 0), QuietRequestHandler, allow_reuse_address=False)
+        self.server.set_app(get_wsgi_application())
+        self.thread = threading.Thread(target=self.server.serve_forever, name='portfolio-loadtest-server', daemon=True)
+
+    @property
+    def address(self):
+        return self.server.server_address[:2]
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
+class Scheduler:
+    """控制请求的发送节奏
+
+    rate为每秒总请求数时按固定间隔分配发送时间（开放模型），延迟从计划发送时间开始计算，
+    服务器变慢造成的排队时间也计入延迟；rate为None时每个线程收到响应后立即发送下一个请求
+    """
+
+    def __init__(self, rate, duration, total_requests):
+        self.rate = rate
+        self.total_requests = total_requests
+        self.start = time.perf_counter()
+        self.deadline = self.start + duration if duration else None
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def next_slot(self):
+        """返回本次请求的计划开始时间，测试结束时返回None"""
+        with self._lock:
+            index = next(self._counter)
+        if self.total_requests is not None and index >= self.total_requests:
+            return None
+        if self.rate:
+            scheduled = self.start + index / self.rate
+            if self.deadline is not None and scheduled >= self.deadline:
+                return None
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            return scheduled
+        now = time.perf_counter()
+        if self.deadline is not None and now >= self.deadline:
+            return None
+        return now
+
+
+class Worker:
+    """单个客户端：按比例随机选择请求类型，写请求只修改自己独占的任务"""
+
+    def __init__(self, index, transport, scheduler, mix, read_tasks, owned_tasks, seed):
+        self.index = index
+        self.transport = transport
+        self.scheduler = scheduler
+        self.rng = random.Random(seed * 1000 + index)
+        self.names = list(mix)
+        self.weights = [mix[name] for name in self.names]
+        self.read_tasks = read_tasks
+        # 任务id -> {project_id, lines, sequence, content, image, deleted}
+        self.owned = {
+            task['id']: {
+                'project_id': project_id,
+                'lines': [step['content'] for step in task['process']],
+                'sequence': 0,
+                'content': None,
+                'image': None,
+                'deleted': set(),
+            }
+            for project_id, task in owned_tasks
+        }
+        self.samples = {name: [] for name in REQUEST_TYPES}
+        self.errors = {name: 0 for name in REQUEST_TYPES}
+
+    def run(self):
+        while True:
+            scheduled = self.scheduler.next_slot()
+            if scheduled is None:
+                return
+            name = self.rng.choices(self.names, self.weights)[0]
+            if name.startswith('edit') and not self.owned:
+                name = 'home'
+            try:
+                ok = getattr(self, f'request_{name}')()
+            except Exception:
+                ok = False
+            self.samples[name].append(time.perf_counter() - scheduled)
+            if not ok:
+                self.errors[name] += 1
+
+    def request_home(self):
+        return self.transport.get('/')[0] == 200
+
+    def request_task_list(self):
+        query = self.rng.choice(('', '?category=R%26D', '?workshop=2', '?' + urlencode({'category': 'UAT', 'workshop': 3})))
+        return self.transport.get(f'/tasks/{query}')[0] == 200
+
+    def request_task_detail(self):
+        project_id, task_id = self.rng.choice(self.read_tasks)
+        return self.transport.get(f'/projects/{project_id}/tasks/{task_id}/')[0] == 200
+
+    def request_edit(self):
+        return self._edit(with_image=False)
+
+    def request_edit_image(self):
+        return self._edit(with_image=True)
+
+    def _edit(self, with_image):
+        task_id = self.rng.choice(list(self.owned))
+        state = self.owned[task_id]
+        state['sequence'] += 1
+        marker = f'loadtest-{self.index}-{task_id}-{state["sequence"]}'
+        content = f'{marker} 修改后的步骤内容'
+        data = {'process_content': '\n'.join([content, *state['lines'][1:]])}
+        upload_name = None
+        if with_image:
+            base_name = marker.replace('-', '_')
+            upload_name = f'task_{task_id}_step_{UPLOAD_STEP}_0_{base_name}.png'
+            data[f'step_image_{UPLOAD_STEP}_0'] = SimpleUploadedFile(
+                f'{base_name}.png', synthetic_png(self.index * 7919 + state['sequence']), content_type='image/png')
+            if state['image']:
+                # 同一步骤最多3张图片，上传新图片时删除上一次上传的图片
+                data['delete_step_image[]'] = state['image']
+
+        status, body = self.transport.post(f"/projects/{state['project_id']}/tasks/{task_id}/update-process-content/", data)
+        try:
+            ok = status == 200 and json.loads(body).get('status') == 'success'
+        except ValueError:
+            ok = False
+        if ok:
+            state['content'] = content
+            if with_image:
+                if state['image']:
+                    state['deleted'].add(state['image'])
+                state['image'] = upload_name
+        return ok
+
+
+def count_lost_updates(workers, data):
+    """对照每个任务最后一次确认成功的修改检查data中的任务，返回丢失的内容修改和图片修改数"""
+    tasks = {task['id']: task for project in data.get('projects', []) for task in project.get('tasks', [])}
+    lost_content = lost_images = 0
+    for worker in workers:
+        for task_id, state in worker.owned.items():
+            task = tasks.get(task_id)
+            if task is None:
+                lost_content += state['content'] is not None
+                lost_images += state['image'] is not None
+                continue
+            if state['content'] is not None:
+                process = task.get('process') or [{}]
+                if process[0].get('content') != state['content']:
+                    lost_content += 1
+            names = {image.get('file_name') for image in task.get('step_images', [])}
+            if state['image'] and state['image'] not in names:
+                lost_images += 1
+            lost_images += len(state['deleted'] & names)
+    return {'content': lost_content, 'images': lost_images, 'total': lost_content + lost_images}
+
+
+def run_load_test(mode='inprocess', concurrency=8, duration=10.0, total_requests=None, rate=None, mix=None,
+                  projects=5, tasks=40, images=3, seed=0, page_cache=True):
+    """
+    运行负载测试
+
+    Args:
+        mode: 'inprocess' 在进程内调用Django；'socket' 通过本机端口访问内置WSGI服务器
+        concurrency: 客户端线程数
+        duration: 测试时长（秒），与total_requests同时指定时先达到者结束
+        total_requests: 总请求数
+        rate: 每秒总请求数，None表示每个线程收到响应后立即发送下一个请求
+        mix: 请求类型 -> 比例
+        page_cache: 是否启用整页缓存，默认与正式配置一致
+
+    Returns:
+        dict: 可直接保存为JSON的结果
+    """
+    from . import views
+
+    if mode not in MODES:
+        raise ValueError(f'未知的模式: {mode}')
+    mix = mix or dict(DEFAULT_MIX)
+    data = generate_dataset(projects, tasks, images, seed)
+    all_tasks = [(project['id'], task) for project in data['projects'] for task in project['tasks']]
+    read_tasks = [(project_id, task['id']) for project_id, task in all_tasks]
+
+    with isolated_environment(data, page_cache=page_cache):
+        with override_settings(ALLOWED_HOSTS=['testserver', '127.0.0.1', 'localhost']):
+            server = LocalServer() if mode == 'socket' else None
+            if server is not None:
+                server.__enter__()
+            try:
+                scheduler = Scheduler(rate, duration, total_requests)
+                workers = []
+                for index in range(concurrency):
+                    transport = SocketTransport(*server.address) if server is not None else InProcessTransport()
+                    workers.append(Worker(index, transport, scheduler, mix, read_tasks, all_tasks[index::concurrency], seed))
+                threads = [threading.Thread(target=worker.run, name=f'portfolio-loadtest-{worker.index}') for worker in workers]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                elapsed = time.perf_counter() - scheduler.start
+            finally:
+                if server is not None:
+                    server.__exit__(None, None, None)
+
+        # 后台图片任务完成后再检查，任务结果也会保存数据
+        wait_for_image_jobs()
+        with open(views.DATA_FILE, 'r', encoding='utf-8') as f:
+            persisted = json.load(f)
+        lost_on_disk = count_lost_updates(workers, persisted)
+        lost_in_memory = count_lost_updates(workers, views.global_data)
+
+    all_samples = []
+    by_type = {}
+    for name in REQUEST_TYPES:
+        samples = [sample for worker in workers for sample in worker.samples[name]]
+        if not samples:
+            continue
+        errors = sum(worker.errors[name] for worker in workers)
+        by_type[name] = {**summarize(samples, errors), 'throughput_rps': len(samples) / elapsed}
+        all_samples.extend(samples)
+    total_errors = sum(summary['errors'] for summary in by_type.values())
+
+    return {
+        'format': RESULT_FORMAT_VERSION,
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'parameters': {
+            'mode': mode, 'concurrency': concurrency, 'duration': duration, 'total_requests': total_requests,
+            'rate': rate, 'mix': mix, 'projects': projects, 'tasks': tasks, 'images': images, 'seed': seed,
+            'page_cache': page_cache,
+        },
+        'elapsed_s': elapsed,
+        'throughput_rps': len(all_samples) / elapsed if elapsed else 0.0,
+        'overall': summarize(all_samples, total_errors),
+        'by_type': by_type,
+        'lost_updates': {'disk': lost_on_disk, 'memory': lost_in_memory},
+    }
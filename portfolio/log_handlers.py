@@ -0,0 +1,117 @@
+"""
+结构化的异步日志
+请求线程只把日志记录放入有界队列，JSON格式化和写stdout由QueueListener的后台线程完成，
+stdout输出变慢时请求不会被阻塞（队列已满时丢弃记录并计数）；
+调试级别的高频日志可以按调用位置采样，只保留一部分
+"""
+
+import atexit
+import copy
+import json
+import logging
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from .instrumentation import registry
+
+# 队列默认容量（条）
+DEFAULT_QUEUE_SIZE = 10000
+
+# LogRecord自带的属性，其余属性是调用时通过extra传入的结构化字段
+RESERVED_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+LOG_RECORDS_DROPPED = registry.counter(
+    'portfolio_log_records_dropped_total', '日志队列已满时丢弃的记录数')
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行JSON，extra中的字段作为同级的键"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in RESERVED_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc_info'] = record.exc_text
+        if record.stack_info:
+            entry['stack_info'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """低于level的日志按调用位置每rate条保留1条，保留的记录带有sample_rate字段
+
+    用于循环中逐条输出的调试日志；level及以上的日志全部保留
+    """
+
+    def __init__(self, rate=10, level='INFO'):
+        super().__init__()
+        self.rate = int(rate)
+        self.level = level if isinstance(level, int) else logging.getLevelName(str(level).upper())
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= self.level or self.rate <= 1:
+            return True
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+        if count % self.rate:
+            return False
+        record.sample_rate = self.rate
+        return True
+
+
+class AsyncQueueHandler(QueueHandler):
+    """把日志记录交给后台线程输出的处理器
+
+    在LOGGING中配置的formatter作用于后台线程中实际写出的StreamHandler；
+    请求线程只合并消息参数（参数可能是之后会被修改的列表或字典），不做格式化
+    """
+
+    def __init__(self, stream=None, maxsize=DEFAULT_QUEUE_SIZE):
+        super().__init__(queue.Queue(maxsize))
+        self.target = logging.StreamHandler(stream or sys.stderr)
+        self.listener = QueueListener(self.queue, self.target)
+        self.listener.start()
+        self._stopped = False
+        # 进程退出前把队列中剩余的记录写完
+        atexit.register(self.close)
+
+    def setFormatter(self, fmt):
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+    def close(self):
+        if not self._stopped:
+            self._stopped = True
+            self.listener.stop()
+            self.target.close()
+        super().close()
@@ -0,0 +1,108 @@
+"""
+运行性能基准测试，或比较两次测试结果
+用法: python manage.py benchmark [--projects 5 --tasks 40 --images 3] [--output bench.json]
+      python manage.py benchmark --compare baseline.json [--results current.json] [--fail-on-regression]
+"""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from portfolio.benchmarks import compare_results, run_benchmarks
+
+GROUPS = ('view', 'persistence', 'filter', 'image')
+
+
+class Command(BaseCommand):
+    help = '用合成数据计时页面、数据读写、模板过滤器和图片上传删除，结果保存为JSON并可与之前的结果比较'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--projects', type=int, default=5, help='合成数据的项目数')
+        parser.add_argument('--tasks', type=int, default=40, help='每个项目的任务数')
+        parser.add_argument('--images', type=int, default=3, help='每个任务的步骤图片数')
+        parser.add_argument('--iterations', type=int, default=30, help='每项测试的计时次数')
+        parser.add_argument('--warmup', type=int, default=3, help='计时前的预热次数')
+        parser.add_argument('--seed', type=int, default=0, help='合成数据的随机数种子')
+        parser.add_argument('--only', default='', help=f'只运行的分组，逗号分隔: {",".join(GROUPS)}')
+        parser.add_argument('--page-cache', action='store_true', help='启用整页缓存（默认关闭以测量实际渲染耗时）')
+        parser.add_argument('--output', help='结果JSON的保存路径')
+        parser.add_argument('--compare', help='作为基准的结果JSON')
+        parser.add_argument('--results', help='与基准比较的已有结果JSON，指定时不重新运行测试')
+        parser.add_argument('--metric', default='p50_ms', help='比较的统计项，例如 p50_ms、p95_ms、mean_ms')
+        parser.add_argument('--threshold', type=float, default=0.1, help='相对变化超过该比例视为回退')
+        parser.add_argument('--fail-on-regression', action='store_true', help='存在回退时以非零状态退出')
+
+    def handle(self, *args, **options):
+        if options['results']:
+            if not options['compare']:
+                raise CommandError('--results 需要与 --compare 一起使用')
+            current = self._load(options['results'])
+        else:
+            groups = [group.strip() for group in options['only'].split(',') if group.strip()]
+            unknown = set(groups) - set(GROUPS)
+            if unknown:
+                raise CommandError(f'未知的分组: {", ".join(sorted(unknown))}')
+            current = run_benchmarks(
+                projects=options['projects'], tasks=options['tasks'], images=options['images'],
+                iterations=options['iterations'], warmup=options['warmup'], groups=groups or None,
+                page_cache=options['page_cache'], seed=options['seed'],
+            )
+            self._print_results(current)
+            if options['output']:
+                with open(options['output'], 'w', encoding='utf-8') as f:
+                    json.dump(current, f, ensure_ascii=False, indent=2)
+                self.stdout.write(self.style.SUCCESS(f"✓ 结果已保存到: {options['output']}"))
+
+        if options['compare']:
+            baseline = self._load(options['compare'])
+            rows = compare_results(baseline, current, metric=options['metric'], threshold=options['threshold'])
+            regressions = self._print_comparison(rows, options['metric'])
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f'{regressions} 项性能回退')
+
+    def _load(self, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            raise CommandError(f'无法读取结果文件 {path}: {e}')
+
+    def _print_results(self, result):
+        self.stdout.write(f"{'测试项':<50}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)")
+        for name, summary in result['results'].items():
+            if not summary.get('count'):
+                if summary.get('skipped'):
+                    self.stdout.write(self.style.WARNING(f"⚠ {name}: {summary['skipped']}"))
+                else:
+                    self.stdout.write(self.style.ERROR(f"✗ {name}: 没有成功的样本，{summary.get('errors', 0)} 次出错"))
+                continue
+            line = (f"{name:<50}{summary['p50_ms']:>10.3f}{summary['p95_ms']:>10.3f}"
+                    f"{summary['p99_ms']:>10.3f}{summary['max_ms']:>10.3f}")
+            if summary['errors']:
+                line += f"  ✗ {summary['errors']} 次出错"
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(line)
+
+    def _print_comparison(self, rows, metric):
+        self.stdout.write(f"\n与基准比较 ({metric}):")
+        regressions = 0
+        for row in rows:
+            before = '-' if row['baseline'] is None else f"{row['baseline']:.3f}"
+            after = '-' if row['current'] is None else f"{row['current']:.3f}"
+            change = '' if row['change'] is None else f"{row['change']:+.1%}"
+            line = f"{row['name']:<50}{before:>10}{after:>10}{change:>9}"
+            if row['status'] == 'regression':
+                regressions += 1
+                self.stdout.write(self.style.ERROR(f'{line}  ✗ 回退'))
+            elif row['status'] == 'improvement':
+                self.stdout.write(self.style.SUCCESS(f'{line}  ✓ 改进'))
+            elif row['status'] in ('error', 'missing'):
+                self.stdout.write(self.style.WARNING(f"{line}  ⚠ {'出错' if row['status'] == 'error' else '缺少结果'}"))
+            else:
+                self.stdout.write(f"{line}  {'新增' if row['status'] == 'new' else ''}")
+        if regressions:
+            self.stdout.write(self.style.ERROR(f'✗ {regressions} 项性能回退'))
+        else:
+            self.stdout.write(self.style.SUCCESS('✓ 没有性能回退'))
+        return regressions
@@ -0,0 +1,85 @@
+"""
+把按文件名保存的历史图片迁移到按内容寻址的存储中，相同内容的文件只保留一份
+用法: python manage.py dedupe_step_images [--delete-originals]
+"""
+
+import os
+
+from django.core.management.base import BaseCommand
+
+from portfolio import views
+from portfolio.image_handlers import TaskImage, image_blobs, step_image_file_path
+from portfolio.image_variants import delete_image_variants, generate_image_variants
+
+# 历史步骤图片在MEDIA_ROOT下的目录名
+STEP_IMAGE_DIR_NAME = 'task_step_images'
+
+
+class Command(BaseCommand):
+    help = '为没有content_hash的步骤图片和任务图片建立按内容存储的引用'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete-originals', action='store_true', help='迁移后删除原来按文件名保存的文件')
+
+    def handle(self, *args, **options):
+        migrated = 0
+        missing = 0
+        originals = set()
+
+        with views.data_write_lock():
+            for project in views.task_store.projects:
+                for task in project['tasks']:
+                    changed = False
+                    for image in task.get('step_images', []):
+                        if image.get('content_hash'):
+                            continue
+                        file_path = step_image_file_path(image)
+                        if not os.path.exists(file_path):
+                            missing += 1
+                            continue
+
+                        blob = image_blobs.store_file(file_path)
+                        old_name = f"{STEP_IMAGE_DIR_NAME}/{image.get('file_name', image.get('filename', ''))}"
+                        # 旧的缩略图按原文件名命名，改为按内容生成
+                        delete_image_variants(image, os.path.dirname(file_path))
+                        image.pop('thumbnail_url', None)
+                        image.pop('variants', None)
+                        image['url'] = image_blobs.url(blob.path)
+                        image['content_hash'] = blob.sha256
+                        try:
+                            image.update(generate_image_variants(image_blobs.full_path(blob.path), os.path.dirname(image['url'])))
+                        except Exception as e:
+                            self.stderr.write(f'⚠ 生成缩略图失败: {old_name}: {e}')
+
+                        TaskImage.objects.filter(image=old_name, task_id=task['id']).update(
+                            image=f'blobs/{blob.path}', content_hash=blob.sha256
+                        )
+                        originals.add(file_path)
+                        migrated += 1
+                        changed = True
+                    if changed:
+                        views.save_task(project, task)
+
+            # 通过upload_task_image上传、不属于任何步骤的图片
+            for task_image in TaskImage.objects.filter(content_hash='').exclude(image__startswith=f'{STEP_IMAGE_DIR_NAME}/'):
+                file_path = task_image.image.path
+                if not os.path.exists(file_path):
+                    missing += 1
+                    continue
+                blob = image_blobs.store_file(file_path)
+                task_image.image = f'blobs/{blob.path}'
+                task_image.content_hash = blob.sha256
+                task_image.save(update_fields=['image', 'content_hash'])
+                originals.add(file_path)
+                migrated += 1
+
+        reclaimed = 0
+        if options['delete_originals']:
+            for file_path in originals:
+                if os.path.exists(file_path):
+                    reclaimed += os.path.getsize(file_path)
+                    os.remove(file_path)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ 已迁移 {migrated} 张图片，{missing} 张原图不存在，删除原文件释放 {reclaimed} 字节'
+        ))
@@ -0,0 +1,47 @@
+"""
+为已有的步骤图片补充生成缩略图和多尺寸版本
+用法: python manage.py generate_image_variants [--force]
+"""
+
+import os
+
+from django.core.management.base import BaseCommand
+
+from portfolio import views
+from portfolio.image_handlers import step_image_file_path
+from portfolio.image_variants import generate_image_variants
+
+
+class Command(BaseCommand):
+    help = '为step_images中尚未处理的图片生成缩略图和多尺寸版本'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='重新生成已经存在的版本')
+
+    def handle(self, *args, **options):
+        processed = 0
+        missing = 0
+
+        with views.data_write_lock():
+            for project in views.task_store.projects:
+                for task in project['tasks']:
+                    changed = False
+                    for image in task.get('step_images', []):
+                        if image.get('thumbnail_url') and not options['force']:
+                            continue
+                        filename = image.get('file_name', image.get('filename', ''))
+                        file_path = step_image_file_path(image)
+                        if not filename or not os.path.exists(file_path):
+                            missing += 1
+                            continue
+                        try:
+                            image.update(generate_image_variants(file_path, os.path.dirname(image['url'])))
+                        except Exception as e:
+                            self.stderr.write(f'✗ 处理失败: {filename}: {e}')
+                            continue
+                        processed += 1
+                        changed = True
+                    if changed:
+                        views.save_task(project, task)
+
+        self.stdout.write(self.style.SUCCESS(f'✓ 已处理 {processed} 张图片，{missing} 张原图不存在'))
@@ -0,0 +1,42 @@
+"""
+把 data.json 中的项目和任务批量导入 Project/Task 数据表
+用法: python manage.py import_data_json [--file PATH] [--batch-size N] [--replace]
+"""
+
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from portfolio.orm_store import OrmTaskStore
+
+
+class Command(BaseCommand):
+    help = '使用bulk_create分批把data.json导入Project/Task数据表'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file',
+            default=os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data.json'),
+            help='要导入的JSON文件路径，默认为portfolio/data.json'
+        )
+        parser.add_argument('--batch-size', type=int, default=500, help='每批插入的行数')
+        parser.add_argument('--replace', action='store_true', help='导入前清空已有的项目和任务')
+
+    def handle(self, *args, **options):
+        path = options['file']
+        if not os.path.exists(path):
+            raise CommandError(f'文件不存在: {path}')
+
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except json.JSONDecodeError as e:
+            raise CommandError(f'JSON解析失败: {e}')
+
+        project_count, task_count = OrmTaskStore().import_data(
+            data,
+            batch_size=options['batch_size'],
+            replace=options['replace']
+        )
+        self.stdout.write(self.style.SUCCESS(f'✓ 已导入 {project_count} 个项目，{task_count} 个任务'))
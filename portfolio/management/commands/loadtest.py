@@ -0,0 +1,72 @@
+"""
+并发负载测试：混合读请求和带图片的步骤内容修改，统计吞吐量、延迟、出错和丢失的更新
+用法: python manage.py loadtest [--mode inprocess|socket] [--concurrency 8] [--duration 10] [--rate 50]
+                                [--mix home=3,task_list=3,task_detail=2,edit=1,edit_image=1] [--output load.json]
+"""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from portfolio.load_testing import MODES, parse_mix, run_load_test
+
+
+class Command(BaseCommand):
+    help = '在临时数据和测试数据库上运行并发负载测试'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=MODES, default='inprocess', help='inprocess在进程内调用Django，socket通过本机端口访问')
+        parser.add_argument('--concurrency', type=int, default=8, help='客户端线程数')
+        parser.add_argument('--duration', type=float, default=10.0, help='测试时长（秒）')
+        parser.add_argument('--requests', type=int, help='总请求数，先于时长达到时结束')
+        parser.add_argument('--rate', type=float, help='每秒总请求数，不指定时每个线程连续发送')
+        parser.add_argument('--mix', default='', help='请求比例，例如 home=3,task_list=3,task_detail=2,edit=1,edit_image=1')
+        parser.add_argument('--projects', type=int, default=5, help='合成数据的项目数')
+        parser.add_argument('--tasks', type=int, default=40, help='每个项目的任务数')
+        parser.add_argument('--images', type=int, default=3, help='每个任务的步骤图片数')
+        parser.add_argument('--seed', type=int, default=0, help='随机数种子')
+        parser.add_argument('--no-page-cache', action='store_true', help='关闭整页缓存')
+        parser.add_argument('--output', help='结果JSON的保存路径')
+        parser.add_argument('--fail-on-lost-updates', action='store_true', help='检测到丢失的更新时以非零状态退出')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency 至少为1')
+        try:
+            mix = parse_mix(options['mix'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        result = run_load_test(
+            mode=options['mode'], concurrency=options['concurrency'], duration=options['duration'],
+            total_requests=options['requests'], rate=options['rate'], mix=mix,
+            projects=options['projects'], tasks=options['tasks'], images=options['images'],
+            seed=options['seed'], page_cache=not options['no_page_cache'],
+        )
+
+        overall = result['overall']
+        self.stdout.write(
+            f"{overall['count']} 个请求，用时 {result['elapsed_s']:.1f} 秒，吞吐量 {result['throughput_rps']:.1f} 请求/秒"
+        )
+        self.stdout.write(f"{'请求类型':<16}{'次数':>8}{'出错':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)")
+        for name, summary in [*result['by_type'].items(), ('总计', overall)]:
+            line = (f"{name:<16}{summary['count']:>8}{summary['errors']:>8}{summary['p50_ms']:>10.2f}"
+                    f"{summary['p95_ms']:>10.2f}{summary['p99_ms']:>10.2f}{summary['max_ms']:>10.2f}")
+            self.stdout.write(self.style.ERROR(line) if summary['errors'] else line)
+
+        lost = result['lost_updates']
+        if lost['disk']['total'] or lost['memory']['total']:
+            self.stdout.write(self.style.ERROR(
+                f"✗ 丢失的更新: data.json中 {lost['disk']['content']} 处内容、{lost['disk']['images']} 处图片；"
+                f"内存中 {lost['memory']['content']} 处内容、{lost['memory']['images']} 处图片"
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS('✓ 没有丢失的更新'))
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"✓ 结果已保存到: {options['output']}"))
+
+        if lost['disk']['total'] and options['fail_on_lost_updates']:
+            raise CommandError('检测到丢失的更新')
@@ -0,0 +1,103 @@
+"""
+任务文本中图片标记的渲染
+[image:文件名] 标记转换为延迟加载的img标签：文件名对应任务的步骤图片时使用其缩略图和多尺寸版本，
+否则指向 /media/task_images/ 下的同名文件。正则表达式只编译一次，
+拆分结果和渲染结果以文本内容为键缓存，同一段文本重复渲染时只需两次字典查找
+"""
+
+import re
+
+from django.conf import settings
+from django.utils.html import escape
+
+from .aggregate_cache import VersionedCache
+from .image_variants import build_srcset
+
+# 图片标记，例如 [image:screenshot.png]
+IMAGE_PATTERN = re.compile(r'\[image:(.*?)\]')
+
+# 没有对应步骤图片时的URL前缀
+TASK_IMAGE_URL = '/media/task_images'
+
+IMAGE_STYLE = 'max-width: 100%; height: auto; border-radius: 4px; margin: 10px 0;'
+
+
+class ImageMarkupRenderer:
+    """带缓存的图片标记渲染器
+
+    缓存键由文本和每个文件名解析出的图片字段组成，图片生成缩略图或被替换后键随之变化，
+    因此缓存不需要在数据修改时主动失效，只按LRU策略限制条目数量。
+    文本直接作为字典键而不是另算SHA-1：字符串的哈希值计算一次后缓存在对象上，
+    任务数据常驻内存，同一个字符串对象再次渲染时查找代价与文本长度无关
+    """
+
+    def __init__(self, maxsize=1024):
+        self._segments = VersionedCache(maxsize=maxsize)
+        self._rendered = VersionedCache(maxsize=maxsize)
+
+    def segments(self, text):
+        """返回(拆分结果, 不重复的文件名)；拆分结果中偶数位置是原样输出的文本，奇数位置是图片文件名"""
+        def split():
+            parts = tuple(IMAGE_PATTERN.split(text))
+            return parts, tuple(dict.fromkeys(parts[1::2]))
+        return self._segments.get_or_compute(text, split)
+
+    def render(self, text, images=None):
+        """
+        渲染文本中的图片标记
+
+        Args:
+            text: 任务步骤等文本内容
+            images: 文件名到步骤图片条目的字典，None表示只使用 /media/task_images/ 下的文件
+
+        Returns:
+            str: 替换后的HTML
+        """
+        parts, names = self.segments(text)
+        if not names:
+            return text
+        resolved = tuple(self._resolve(name, images) for name in names)
+        return self._rendered.get_or_compute((text, resolved), lambda: self._build(parts, names, resolved))
+
+    def _resolve(self, file_name, images):
+        """图片标签用到的字段：(原图URL, 缩略图URL, srcset, 宽, 高)"""
+        image = images.get(file_name) if images else None
+        if not image or not image.get('url'):
+            return (f'{TASK_IMAGE_URL}/{file_name}', '', '', None, None)
+        return (
+            image['url'],
+            image.get('thumbnail_url', ''),
+            build_srcset(image),
+            image.get('width'),
+            image.get('height'),
+        )
+
+    def _build(self, parts, names, resolved):
+        tags = {name: self._img_tag(*fields) for name, fields in zip(names, resolved)}
+        return ''.join(part if index % 2 == 0 else tags[part] for index, part in enumerate(parts))
+
+    def _img_tag(self, url, thumbnail_url, srcset, width, height):
+        # 有多尺寸版本时由浏览器按显示宽度选择，只有缩略图时先显示缩略图，点击查看原图
+        attrs = [f'src="{escape(thumbnail_url or url)}"']
+        if srcset:
+            attrs.append(f'srcset="{escape(srcset)}" sizes="(max-width: 800px) 100vw, 800px"')
+        if width and height:
+            attrs.append(f'width="{int(width)}" height="{int(height)}"')
+        attrs.append(f'alt="任务图片" loading="lazy" decoding="async" style="{IMAGE_STYLE}"')
+        tag = f'<img {" ".join(attrs)}>'
+        if thumbnail_url and not srcset:
+            return f'<a href="{escape(url)}" target="_blank">{tag}</a>'
+        return tag
+
+
+def step_images_by_name(task):
+    """任务步骤图片按文件名建立的字典，供render的images参数使用"""
+    images = {}
+    for image in task.get('step_images', []) or []:
+        for key in ('file_name', 'filename'):
+            if image.get(key):
+                images.setdefault(image[key], image)
+    return images
+
+
+markup_renderer = ImageMarkupRenderer(maxsize=getattr(settings, 'PORTFOLIO_MARKUP_CACHE_SIZE', 1024))
@@ -0,0 +1,195 @@
+"""
+媒体文件的分发
+支持ETag/Last-Modified条件请求和单段Range请求（浏览器拖动大图、断点续传）；
+配置了前置服务器时只返回X-Sendfile或X-Accel-Redirect头，由Apache/Nginx直接发送文件；
+由Django直接发送时响应以文件对象的形式交给WSGI服务器的wsgi.file_wrapper，
+gunicorn等服务器会据此调用os.sendfile，文件内容不经过Python缓冲区
+"""
+
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.utils._os import safe_join
+
+from .instrumentation import record_image_io
+
+# 单段Range请求，例如 bytes=0-1023、bytes=1024-、bytes=-500
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+# 按内容哈希命名的文件内容不会变化，使用一年的强缓存
+IMMUTABLE_PREFIXES = ('blobs/',)
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def media_serving_enabled():
+    return getattr(settings, 'PORTFOLIO_SERVE_MEDIA', settings.DEBUG)
+
+
+def media_offload():
+    """None表示由Django发送文件，'x-sendfile'（Apache/lighttpd）或'x-accel-redirect'（Nginx）表示交给前置服务器"""
+    return getattr(settings, 'PORTFOLIO_MEDIA_OFFLOAD', None)
+
+
+def media_accel_prefix():
+    """Nginx中对应MEDIA_ROOT的internal location前缀"""
+    return getattr(settings, 'PORTFOLIO_MEDIA_ACCEL_PREFIX', '/protected-media/')
+
+
+def media_max_age():
+    """非内容寻址文件的缓存时间（秒），0表示每次都用条件请求重新验证"""
+    return getattr(settings, 'PORTFOLIO_MEDIA_MAX_AGE', 0)
+
+
+class FileSlice:
+    """文件中从start开始length字节的只读视图
+
+    fileno()对应的文件位置已经移动到start，gunicorn的file_wrapper会按Content-Length
+    从当前位置调用sendfile；不支持sendfile的服务器通过read()分块读取，不会读出区间之外的内容
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.file.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def file_etag(stat):
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def parse_range(header, size):
+    """
+    解析Range请求头
+
+    Returns:
+        tuple | None: (起始位置, 字节数)；请求头不存在、格式不支持或包含多段时返回None，按完整文件响应
+    Raises:
+        ValueError: 区间超出文件范围，应返回416
+    """
+    match = RANGE_PATTERN.match(header.strip()) if header else None
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # bytes=-N 表示最后N个字节
+        length = min(int(end), size)
+        if length == 0:
+            raise ValueError('无效的Range')
+        return size - length, length
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or end < start:
+        raise ValueError('无效的Range')
+    return start, end - start + 1
+
+
+def range_still_valid(request, etag, mtime):
+    """If-Range与当前文件一致时才按Range返回部分内容，否则返回完整文件"""
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    modified = parse_http_date_safe(if_range)
+    return modified is not None and int(mtime) <= modified
+
+
+def serve_media(request, path):
+    """
+    返回MEDIA_ROOT下的文件
+
+    Args:
+        request: HTTP请求
+        path: 相对于MEDIA_URL的路径
+
+    Returns:
+        HttpResponse: 200/206完整或部分内容，304未修改，416区间无效
+    """
+    path = posixpath.normpath(path).lstrip('/')
+    # 以点号开头的是正在写入的上传临时文件（.upload-*）等内部文件，不对外提供
+    if any(part.startswith('.') for part in path.split('/')):
+        raise Http404('文件不存在')
+    try:
+        full_path = safe_join(str(settings.MEDIA_ROOT), path)
+    except (SuspiciousFileOperation, ValueError):
+        raise Http404('文件不存在')
+    try:
+        stat = os.stat(full_path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404('文件不存在')
+    if not os.path.isfile(full_path):
+        raise Http404('文件不存在')
+
+    etag = file_etag(stat)
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        return not_modified
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    if encoding:
+        # 压缩包等文件按原样下载，不让浏览器自动解压
+        content_type = 'application/octet-stream'
+    content_type = content_type or 'application/octet-stream'
+
+    offload = media_offload()
+    if offload:
+        # 由前置服务器发送文件，Range请求也由前置服务器处理
+        response = HttpResponse(content_type=content_type)
+        if offload == 'x-accel-redirect':
+            response['X-Accel-Redirect'] = media_accel_prefix().rstrip('/') + '/' + quote(path)
+        else:
+            # 响应头只能是latin-1字符，按UTF-8字节原样传给前置服务器
+            response['X-Sendfile'] = full_path.encode('utf-8').decode('latin-1')
+    else:
+        try:
+            byte_range = parse_range(request.headers.get('Range'), stat.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+        if byte_range is not None and not range_still_valid(request, etag, stat.st_mtime):
+            byte_range = None
+
+        file = open(full_path, 'rb')
+        if byte_range is None:
+            response = FileResponse(file, content_type=content_type)
+            record_image_io('serve', stat.st_size)
+        else:
+            start, length = byte_range
+            response = FileResponse(FileSlice(file, start, length), content_type=content_type, status=206)
+            response['Content-Range'] = f'bytes {start}-{start + length - 1}/{stat.st_size}'
+            response['Content-Length'] = length
+            record_image_io('serve', length)
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    if path.startswith(IMMUTABLE_PREFIXES):
+        response['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        response['Cache-Control'] = f'public, max-age={media_max_age()}, must-revalidate'
+    return response
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:45
+
+import json
+
+from django.db import migrations, models
+
+
+def process_text_to_json(apps, schema_editor):
+    """把旧的纯文本process（每行一个步骤标题）转换为JSON步骤列表，已经是JSON列表的保持不变"""
+    Task = apps.get_model('portfolio', 'Task')
+    for task in Task.objects.only('id', 'process').iterator():
+        try:
+            steps = json.loads(task.process)
+        except (TypeError, ValueError):
+            steps = None
+        if not isinstance(steps, list):
+            lines = [line.strip() for line in (task.process or '').splitlines() if line.strip()]
+            steps = [{'title': line, 'content': ''} for line in lines]
+        Task.objects.filter(id=task.id).update(process=json.dumps(steps, ensure_ascii=False))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='task',
+            name='technology',
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='pain_points',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='step_images',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.RunPython(process_text_to_json, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='task',
+            name='process',
+            field=models.JSONField(default=list),
+        ),
+        migrations.AlterField(
+            model_name='task',
+            name='project_id',
+            field=models.IntegerField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='task',
+            name='workshop',
+            field=models.IntegerField(db_index=True),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['category', 'workshop'], name='portfolio_task_cat_ws_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0002_task_storage_backend'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(help_text='任务类型，对应注册的处理函数', max_length=50)),
+                ('task_id', models.IntegerField(help_text='关联的任务ID')),
+                ('payload', models.JSONField(default=dict, help_text='处理函数的参数')),
+                ('result', models.JSONField(blank=True, help_text='处理结果', null=True)),
+                ('status', models.CharField(choices=[('pending', '等待处理'), ('running', '处理中'), ('done', '已完成'), ('failed', '失败')], default='pending', max_length=20)),
+                ('error', models.TextField(blank=True, default='')),
+                ('attempts', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['task_id', 'status'], name='portfolio_imgjob_task_idx'), models.Index(fields=['status', 'updated_at'], name='portfolio_imgjob_status_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0003_image_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(help_text='文件内容的SHA-256', max_length=64, unique=True)),
+                ('path', models.CharField(help_text='相对于存储目录的文件路径', max_length=255)),
+                ('size', models.BigIntegerField(default=0)),
+                ('ref_count', models.IntegerField(default=0, help_text='引用该文件的图片数量')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='taskimage',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, default='', help_text='图片内容的SHA-256', max_length=64),
+        ),
+    ]
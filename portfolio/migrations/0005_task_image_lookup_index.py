@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0004_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='taskimage',
+            index=models.Index(fields=['task_id', 'image'], name='portfolio_taskimg_task_img_idx'),
+        ),
+    ]
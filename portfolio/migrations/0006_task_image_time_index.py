@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0005_task_image_lookup_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='taskimage',
+            index=models.Index(fields=['task_id', 'uploaded_at'], name='portfolio_taskimg_time_idx'),
+        ),
+    ]
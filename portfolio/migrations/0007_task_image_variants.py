@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0006_task_image_time_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskimage',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict, help_text='缩略图和多尺寸版本'),
+        ),
+    ]
@@ -1,4 +1,8 @@
 from django.db import models
+# TaskImage定义在image_handlers中，在此导入以便注册到应用并供迁移文件引用
+from .image_handlers import TaskImage, task_image_upload_path
+from .image_jobs import ImageJob
+from .image_blobs import ImageBlob
 
 class Project(models.Model):
     """项目模型"""
@@ -12,15 +16,24 @@ class Project(models.Model):
 class Task(models.Model):
     """任务模型"""
     id = models.IntegerField(primary_key=True)
-    project_id = models.IntegerField()
+    project_id = models.IntegerField(db_index=True)
     title = models.CharField(max_length=200)
     category = models.CharField(max_length=50)
-    workshop = models.IntegerField()
+    workshop = models.IntegerField(db_index=True)
     description = models.TextField()
     pain_points = models.TextField(blank=True, default='')
-    process = models.TextField()
+    # 步骤列表，与data.json中的结构一致: [{'title': ..., 'content': ...}]
+    process = models.JSONField(default=list)
     results = models.TextField()
     progress = models.IntegerField()
+    # 步骤图片列表，与data.json中的step_images结构一致
+    step_images = models.JSONField(default=list, blank=True)
+    
+    class Meta:
+        indexes = [
+            # 任务列表按分类、workshop筛选
+            models.Index(fields=['category', 'workshop'], name='portfolio_task_cat_ws_idx'),
+        ]
     
     def __str__(self):
         return self.title
@@ -0,0 +1,196 @@
+"""
+基于Project/Task数据表的任务存储后端
+提供与TaskStore相同的接口并返回与data.json结构一致的字典，
+任务筛选和workshop统计通过带索引的SQL完成，而不是在Python中遍历所有任务
+"""
+
+import logging
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max, Q
+
+from .models import Project, Task
+
+logger = logging.getLogger(__name__)
+
+# 新增任务时主键冲突（其他进程同时新增）后重新分配ID的次数
+CREATE_ATTEMPTS = 5
+
+# 与data.json中任务字典对应的字段
+TASK_FIELDS = (
+    'id', 'project_id', 'title', 'category', 'workshop', 'description',
+    'pain_points', 'process', 'results', 'progress', 'step_images',
+)
+
+
+def task_row_values(task):
+    """把任务字典转换为Task模型的字段值，忽略只在页面展示时使用的字段"""
+    return {
+        'title': task.get('title', ''),
+        'category': task.get('category') or '',
+        'workshop': task.get('workshop') or 0,
+        'description': task.get('description', ''),
+        'pain_points': task.get('pain_points', ''),
+        'process': task.get('process', []),
+        'results': task.get('results', ''),
+        'progress': task.get('progress', 0),
+        'step_images': task.get('step_images', []),
+    }
+
+
+class OrmTaskStore:
+    """数据库任务存储，每次调用都直接查询数据库，多进程下天然保持一致"""
+
+    def _project_rows(self):
+        return {p['id']: p for p in Project.objects.order_by('id').values('id', 'name', 'description')}
+
+    @property
+    def projects(self):
+        """返回所有项目及其任务，共两次查询"""
+        projects = self._project_rows()
+        for project in projects.values():
+            project['tasks'] = []
+        for task in Task.objects.order_by('project_id', 'id').values(*TASK_FIELDS):
+            project = projects.get(task['project_id'])
+            if project is not None:
+                project['tasks'].append(task)
+        return list(projects.values())
+
+    def get_project(self, project_id):
+        """按项目ID查找项目，任务列表通过project_id索引查询"""
+        project = Project.objects.filter(id=int(project_id)).values('id', 'name', 'description').first()
+        if project is None:
+            return None
+        project['tasks'] = list(Task.objects.filter(project_id=project['id']).order_by('id').values(*TASK_FIELDS))
+        return project
+
+    def get_task(self, project_id, task_id):
+        """按主键查找任务，并确认任务属于指定项目"""
+        return Task.objects.filter(id=int(task_id), project_id=int(project_id)).values(*TASK_FIELDS).first()
+
+    def has_project(self, project_id):
+        return Project.objects.filter(id=int(project_id)).exists()
+
+    def get_task_project(self, task_id):
+        """返回任务所属的项目，不存在时返回None"""
+        project_id = Task.objects.filter(id=int(task_id)).values_list('project_id', flat=True).first()
+        return self.get_project(project_id) if project_id is not None else None
+
+    def allocate_task_id(self):
+        """返回候选的任务ID；实际ID在add_task插入成功后确定"""
+        max_id = Task.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+        return max_id + 1
+
+    def add_task(self, project, task):
+        """用create()插入新任务；ID已被其他请求占用时重新分配并重试，不会覆盖已有任务
+
+        插入成功后task['id']为实际使用的ID
+        """
+        task['project_id'] = project['id']
+        for _ in range(CREATE_ATTEMPTS):
+            try:
+                with transaction.atomic():
+                    Task.objects.create(id=task['id'], project_id=project['id'], **task_row_values(task))
+                break
+            except IntegrityError:
+                task['id'] = self.allocate_task_id()
+        else:
+            raise IntegrityError(f'无法为新任务分配ID: {task["id"]}')
+        project['tasks'].append(task)
+
+    def update_task(self, task):
+        """数据库由索引维护筛选条件，这里无需处理"""
+
+    def save_task(self, project, task):
+        """保存任务的修改（新任务已在add_task中插入），任务不存在时返回False"""
+        try:
+            updated = Task.objects.filter(id=task['id']).update(project_id=project['id'], **task_row_values(task))
+            return updated > 0
+        except Exception as e:
+            logger.exception('保存任务到数据库失败: %s', e)
+            return False
+
+    def delete_task(self, project, task_id):
+        """删除任务，返回是否删除成功"""
+        deleted, _ = Task.objects.filter(id=int(task_id), project_id=project['id']).delete()
+        project['tasks'] = [t for t in project['tasks'] if t['id'] != int(task_id)]
+        return deleted > 0
+
+    def filter_tasks(self, project_id=None, category=None, workshop=None):
+        """按项目、分类和workshop筛选任务，None表示不筛选该条件"""
+        tasks = Task.objects.all()
+        if project_id is not None:
+            tasks = tasks.filter(project_id=int(project_id))
+        if category is not None:
+            tasks = tasks.filter(category=category)
+        if workshop is not None:
+            tasks = tasks.filter(workshop=workshop)
+        return list(tasks.order_by('project_id', 'id').values(*TASK_FIELDS))
+
+    def task_sort_key(self, task):
+        """任务列表的排序键：(项目ID, 任务ID)"""
+        return (task['project_id'], task['id'])
+
+    def page_tasks(self, project_id=None, category=None, workshop=None, after=None, limit=50):
+        """按filter_tasks的顺序返回排在after之后的最多limit + 1个任务，使用keyset条件而不是OFFSET"""
+        tasks = Task.objects.all()
+        if project_id is not None:
+            tasks = tasks.filter(project_id=int(project_id))
+        if category is not None:
+            tasks = tasks.filter(category=category)
+        if workshop is not None:
+            tasks = tasks.filter(workshop=workshop)
+        if after is not None:
+            after_project, after_task = int(after[0]), int(after[1])
+            tasks = tasks.filter(Q(project_id__gt=after_project) | Q(project_id=after_project, id__gt=after_task))
+        return list(tasks.order_by('project_id', 'id').values(*TASK_FIELDS)[:limit + 1])
+
+    def group_by_project(self, tasks):
+        """按所属项目分组任务，返回[{'id', 'name', 'tasks'}]"""
+        projects = self._project_rows()
+        grouped = {}
+        for task in tasks:
+            project = projects.get(task['project_id'])
+            if project is None:
+                continue
+            if project['id'] not in grouped:
+                grouped[project['id']] = {'id': project['id'], 'name': project['name'], 'tasks': []}
+            grouped[project['id']]['tasks'].append(task)
+        return list(grouped.values())
+
+    def workshop_stats(self, project, workshops):
+        """按workshop统计项目任务总数和完成数，统计由一条GROUP BY查询完成"""
+        counts = {
+            row['workshop']: row
+            for row in Task.objects.filter(project_id=project['id'])
+            .values('workshop')
+            .annotate(total=Count('id'), completed=Count('id', filter=Q(progress=100)))
+        }
+        stats = {}
+        for i in workshops:
+            row = counts.get(i, {'total': 0, 'completed': 0})
+            stats[i] = {
+                'total_tasks': row['total'],
+                'completed_tasks': row['completed'],
+                'completion_rate': round((row['completed'] / row['total']) * 100) if row['total'] > 0 else 0,
+                'tasks': [t for t in project['tasks'] if t.get('workshop') == i],
+            }
+        return stats
+
+    @transaction.atomic
+    def import_data(self, data, batch_size=500, replace=False):
+        """把data.json格式的数据批量导入数据表，返回(项目数, 任务数)"""
+        if replace:
+            Task.objects.all().delete()
+            Project.objects.all().delete()
+
+        projects = []
+        tasks = []
+        for project in data.get('projects', []):
+            projects.append(Project(id=project['id'], name=project.get('name', ''), description=project.get('description', '')))
+            for task in project.get('tasks', []):
+                tasks.append(Task(id=task['id'], project_id=project['id'], **task_row_values(task)))
+
+        Project.objects.bulk_create(projects, batch_size=batch_size, ignore_conflicts=not replace)
+        Task.objects.bulk_create(tasks, batch_size=batch_size, ignore_conflicts=not replace)
+        return len(projects), len(tasks)
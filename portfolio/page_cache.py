@@ -0,0 +1,96 @@
+"""
+只读页面的整页响应缓存
+缓存键包含数据版本号和带查询参数的完整路径（category、workshop等筛选条件），
+数据保存后版本号变化，旧页面自然失效；配合ETag/Last-Modified让浏览器的条件请求直接得到304。
+缓存后端通过settings.CACHES配置，可以使用本地内存或文件缓存
+"""
+
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.views.decorators.http import condition
+
+# 缓存的响应头，其余响应头由中间件重新生成
+CACHED_HEADERS = ('Content-Type', 'Content-Language')
+
+
+def page_cache_enabled():
+    return getattr(settings, 'PORTFOLIO_PAGE_CACHE_ENABLED', True)
+
+
+def page_cache_timeout():
+    """页面缓存的过期时间（秒），None表示直到数据版本变化前一直有效"""
+    return getattr(settings, 'PORTFOLIO_PAGE_CACHE_TIMEOUT', None)
+
+
+def _path_hash(request):
+    return hashlib.md5(request.get_full_path().encode('utf-8')).hexdigest()
+
+
+def page_cache_key(request, version):
+    return f'portfolio:page:{version}:{_path_hash(request)}'
+
+
+def _store_when_complete(chunks, store):
+    """依次产出流式响应的内容块，全部产出后把完整内容交给store；中途断开时不缓存"""
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+    store(b''.join(parts))
+
+
+def cached_page(version_func, last_modified_func, is_enabled=page_cache_enabled):
+    """整页缓存装饰器
+
+    version_func() 返回当前数据版本号，用于缓存键和ETag；
+    last_modified_func() 返回数据最后修改时间，用于Last-Modified；
+    只缓存GET/HEAD请求的200响应，条件请求的304由Django的condition装饰器处理
+    """
+    def etag_func(request, *args, **kwargs):
+        if not is_enabled():
+            return None
+        # 同一数据版本下不同路径和筛选条件对应不同的页面
+        return f'{version_func()}-{_path_hash(request)[:12]}'
+
+    def last_modified(request, *args, **kwargs):
+        if not is_enabled():
+            return None
+        return last_modified_func()
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if not is_enabled() or request.method not in ('GET', 'HEAD'):
+                return view_func(request, *args, **kwargs)
+
+            cache = caches[getattr(settings, 'PORTFOLIO_PAGE_CACHE_ALIAS', 'default')]
+            key = page_cache_key(request, version_func())
+            cached = cache.get(key)
+            if cached is not None:
+                response = HttpResponse(cached['content'], status=cached['status'])
+                for header, value in cached['headers'].items():
+                    response[header] = value
+                return response
+
+            response = view_func(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            headers = {h: response[h] for h in CACHED_HEADERS if response.has_header(h)}
+
+            def store(content):
+                cache.set(key, {'content': content, 'status': 200, 'headers': headers}, page_cache_timeout())
+
+            if not response.streaming:
+                store(response.content)
+            elif not response.is_async:
+                # 流式响应在全部发送完之后再写入缓存，之后的请求直接返回完整页面
+                response.streaming_content = _store_when_complete(response.streaming_content, store)
+            return response
+
+        return condition(etag_func=etag_func, last_modified_func=last_modified)(wrapper)
+
+    return decorator
@@ -0,0 +1,51 @@
+"""
+JSON接口的游标分页
+游标是最后一条记录排序键的不透明编码，下一页从该键之后开始读取（keyset分页），
+每页的查询代价只与每页条数有关，而与数据总量和已翻过的页数无关
+"""
+
+import base64
+import json
+
+# 每页默认条数和上限
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(values):
+    """把排序键编码为URL安全的游标字符串"""
+    raw = json.dumps(list(values), separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """解码游标，返回排序键列表；游标为空时返回None，格式错误时抛出ValueError"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw.decode('utf-8'))
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('无效的分页游标')
+    if not isinstance(values, list):
+        raise ValueError('无效的分页游标')
+    return values
+
+
+def parse_page_size(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """解析limit参数，限制在1到maximum之间，格式错误时抛出ValueError"""
+    if value in (None, ''):
+        return default
+    size = int(value)
+    if size < 1:
+        raise ValueError('limit必须大于0')
+    return min(size, maximum)
+
+
+def paginate(rows, limit, key_func):
+    """rows为最多limit + 1条的查询结果，返回(本页数据, 下一页游标)，没有下一页时游标为None"""
+    rows = list(rows)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(key_func(rows[-1]))
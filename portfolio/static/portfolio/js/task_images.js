@@ -312,7 +312,14 @@ function loadStepImages() {
             `;
             
             const img = document.createElement('img');
-            img.src = imageUrl;
+            // 优先加载服务端生成的缩略图，浏览器根据srcset选择合适尺寸
+            img.src = image.thumbnail_url || imageUrl;
+            img.dataset.fullSrc = imageUrl;
+            if (image.srcset) {
+                img.srcset = image.srcset;
+                img.sizes = '120px';
+            }
+            img.loading = 'lazy';
             img.alt = `步骤${stepNum}的图片${index + 1}`;
             img.style.cssText = `
                 max-width: 100%;
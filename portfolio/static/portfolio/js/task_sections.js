@@ -0,0 +1,145 @@
+// 任务详情页按需加载的区块：步骤正文和相关任务
+// 页面只输出步骤标题，步骤正文滚动到可视区域附近时按批次从片段接口获取；
+// 每批加载完成后触发task:steps-loaded事件（detail.steps为步骤序号数组），供图片画廊等功能使用
+(function() {
+    const loaded = new Set();
+    const pending = new Map();
+    let container = null;
+    let stepsUrl = '';
+    let batchSize = 5;
+    let totalSteps = 0;
+
+    function stepBody(stepNumber) {
+        return document.querySelector(`.step-description[data-step-body="${stepNumber}"]`);
+    }
+
+    // 加载从start开始的一批步骤，同一批次只请求一次
+    function loadBatch(start) {
+        if (pending.has(start)) {
+            return pending.get(start);
+        }
+        const url = `${stepsUrl}?start=${start}&count=${batchSize}`;
+        const request = fetch(url, {headers: {'Accept': 'application/json'}})
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(`加载步骤失败: ${response.status}`);
+                }
+                return response.json();
+            })
+            .then(data => {
+                const steps = [];
+                data.steps.forEach(step => {
+                    const body = stepBody(step.step);
+                    if (body && !loaded.has(step.step)) {
+                        body.innerHTML = step.html;
+                        body.removeAttribute('aria-busy');
+                        loaded.add(step.step);
+                        steps.push(step.step);
+                    }
+                });
+                if (steps.length > 0) {
+                    document.dispatchEvent(new CustomEvent('task:steps-loaded', {detail: {steps: steps}}));
+                }
+            })
+            .catch(error => {
+                // 失败的批次可以在下次滚动或调用loadAll时重试
+                pending.delete(start);
+                throw error;
+            });
+        pending.set(start, request);
+        return request;
+    }
+
+    function batchStart(stepNumber) {
+        return Math.floor((stepNumber - 1) / batchSize) * batchSize + 1;
+    }
+
+    // 加载所有尚未加载的步骤，编辑和浏览模式在使用步骤内容前调用
+    function loadAll() {
+        const batches = [];
+        for (let start = 1; start <= totalSteps; start += batchSize) {
+            batches.push(loadBatch(start));
+        }
+        return Promise.all(batches);
+    }
+
+    function setupSteps() {
+        container = document.querySelector('.process-content[data-steps-url]');
+        if (!container) {
+            return;
+        }
+        stepsUrl = container.dataset.stepsUrl;
+        batchSize = parseInt(container.dataset.batchSize, 10) || batchSize;
+        const bodies = container.querySelectorAll('.step-description[data-step-body]');
+        totalSteps = bodies.length;
+
+        if (!('IntersectionObserver' in window)) {
+            loadAll().catch(error => console.error(error));
+            return;
+        }
+
+        // 提前一屏开始加载，滚动到时内容通常已经就绪
+        const observer = new IntersectionObserver(entries => {
+            entries.forEach(entry => {
+                if (!entry.isIntersecting) {
+                    return;
+                }
+                const stepNumber = parseInt(entry.target.dataset.stepBody, 10);
+                observer.unobserve(entry.target);
+                loadBatch(batchStart(stepNumber)).catch(error => {
+                    console.error(error);
+                    observer.observe(entry.target);
+                });
+            });
+        }, {rootMargin: '600px 0px'});
+        bodies.forEach(body => observer.observe(body));
+    }
+
+    function setupRelatedTasks() {
+        const related = document.getElementById('related-tasks-container');
+        if (!related || !related.dataset.fragmentUrl) {
+            return;
+        }
+        const load = () => fetch(related.dataset.fragmentUrl)
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(`加载相关任务失败: ${response.status}`);
+                }
+                return response.text();
+            })
+            .then(html => {
+                related.innerHTML = html;
+            })
+            .catch(error => {
+                console.error(error);
+                related.innerHTML = '<p class="no-related-tasks">相关任务加载失败</p>';
+            });
+
+        if (!('IntersectionObserver' in window)) {
+            load();
+            return;
+        }
+        const observer = new IntersectionObserver(entries => {
+            if (entries.some(entry => entry.isIntersecting)) {
+                observer.disconnect();
+                load();
+            }
+        }, {rootMargin: '300px 0px'});
+        observer.observe(related);
+    }
+
+    window.taskSections = {
+        loadAll: loadAll,
+        loadedSteps: () => Array.from(loaded)
+    };
+
+    if (document.readyState === 'loading') {
+        document.addEventListener('DOMContentLoaded', () => {
+            setupSteps();
+            setupRelatedTasks();
+        });
+    } else {
+        setupSteps();
+        setupRelatedTasks();
+    }
+})();
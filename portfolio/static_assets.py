@@ -0,0 +1,257 @@
+"""
+静态资源的构建和分发
+collectstatic时先压缩CSS和JS，再由ManifestStaticFilesStorage生成带内容哈希的文件名和manifest，
+最后为文本类资源生成.gz和.br预压缩文件；serve_static_asset按Accept-Encoding返回预压缩版本，
+带哈希的文件名内容不会变化，使用一年的强缓存
+"""
+
+import gzip
+import mimetypes
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+from django.http import FileResponse, Http404
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .compression import accepted_encodings
+from .media_serving import file_etag
+
+try:
+    import brotli
+except ImportError:  # 未安装brotli时只生成gzip版本
+    brotli = None
+
+try:
+    import rcssmin
+except ImportError:  # 未安装时使用下面的简单实现
+    rcssmin = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+# 需要生成预压缩版本的文件类型，图片和字体本身已经压缩过
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.html', '.txt', '.json', '.map')
+# 小于该字节数的文件压缩收益很小，不生成预压缩版本
+MIN_COMPRESS_SIZE = 256
+# 预压缩文件的扩展名及对应的Content-Encoding，按优先顺序排列
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+# 带哈希文件名的缓存时间（一年）
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+CSS_COMMENT_PATTERN = re.compile(r'/\*.*?\*/', re.S)
+CSS_STRING_PATTERN = re.compile(r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')''')
+CSS_SPACE_PATTERN = re.compile(r'\s+')
+CSS_PUNCTUATION_PATTERN = re.compile(r'\s*([{};,>])\s*')
+# 冒号前的空白在选择器中有意义（后代选择器），只去掉冒号后的空白
+CSS_COLON_PATTERN = re.compile(r':\s+')
+HASHED_NAME_PATTERN = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+
+# 之后的 / 开始正则表达式而不是除号的字符和关键字
+JS_REGEX_PREFIX_CHARS = set('(,=:[!&|?{};+-*%<>~^')
+JS_REGEX_PREFIX_WORDS = {'return', 'typeof', 'case', 'do', 'else', 'in', 'instanceof', 'new', 'delete', 'void', 'throw', 'yield', 'await'}
+
+
+def minify_css(text):
+    """去掉注释和多余空白；字符串内容保持不变"""
+    if rcssmin is not None:
+        return rcssmin.cssmin(text)
+    parts = CSS_STRING_PATTERN.split(text)
+    for index in range(0, len(parts), 2):
+        part = CSS_COMMENT_PATTERN.sub('', parts[index])
+        part = CSS_SPACE_PATTERN.sub(' ', part)
+        part = CSS_COLON_PATTERN.sub(':', CSS_PUNCTUATION_PATTERN.sub(r'\1', part))
+        parts[index] = part.replace(';}', '}')
+    return ''.join(parts).strip()
+
+
+def _previous_word(out):
+    match = re.search(r'([A-Za-z_$][\w$]*)\s*$', ''.join(out[-32:]))
+    return match.group(1) if match else ''
+
+
+def minify_js(text):
+    """去掉注释和每行首尾空白、合并空行
+
+    保留换行以免改变自动分号插入的结果；字符串、模板字符串和正则表达式字面量原样保留
+    """
+    if rjsmin is not None:
+        return rjsmin.jsmin(text)
+    out = []
+    i = 0
+    length = len(text)
+    last_significant = ''
+
+    def emit_whitespace(has_newline):
+        if not out:
+            return
+        if has_newline:
+            while out and out[-1] == ' ':
+                out.pop()
+            if out and out[-1] != '\n':
+                out.append('\n')
+        elif out[-1] not in (' ', '\n'):
+            out.append(' ')
+
+    while i < length:
+        char = text[i]
+        if char in ' \t\r\n':
+            start = i
+            while i < length and text[i] in ' \t\r\n':
+                i += 1
+            emit_whitespace('\n' in text[start:i])
+            continue
+        if char == '/' and text.startswith('//', i):
+            end = text.find('\n', i)
+            i = length if end == -1 else end
+            continue
+        if char == '/' and text.startswith('/*', i):
+            end = text.find('*/', i + 2)
+            end = length if end == -1 else end + 2
+            emit_whitespace('\n' in text[i:end])
+            i = end
+            continue
+        if char in '\'"`' or (char == '/' and (last_significant in JS_REGEX_PREFIX_CHARS or not last_significant
+                                                or _previous_word(out) in JS_REGEX_PREFIX_WORDS)):
+            # 字符串、模板字符串或正则表达式：找到未转义的结束符
+            start = i
+            i += 1
+            in_class = False
+            while i < length:
+                current = text[i]
+                if current == '\\':
+                    i += 2
+                    continue
+                if char == '/':
+                    if current == '[':
+                        in_class = True
+                    elif current == ']':
+                        in_class = False
+                    elif current == '/' and not in_class:
+                        break
+                    elif current == '\n':
+                        break
+                elif current == char:
+                    break
+                i += 1
+            i += 1
+            out.append(text[start:i])
+            last_significant = char if char != '/' else 'a'
+            continue
+        out.append(char)
+        last_significant = char
+        i += 1
+    return ''.join(out).strip() + '\n'
+
+
+def compress_bytes(content):
+    """返回{扩展名: 压缩后内容}，只包含比原文件小的版本"""
+    variants = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(content, quality=11)
+    return {ext: data for ext, data in variants.items() if len(data) < len(content)}
+
+
+class PortfolioStaticStorage(ManifestStaticFilesStorage):
+    """collectstatic时压缩CSS/JS、生成带哈希的文件名和manifest，并写出.gz/.br预压缩文件"""
+
+    MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            return
+        # 压缩后的内容先写入目标目录，之后的哈希计算读取压缩后的文件
+        for name in list(paths):
+            minifier = self.MINIFIERS.get(os.path.splitext(name)[1])
+            if minifier is None or name.endswith(('.min.js', '.min.css')):
+                continue
+            source_storage, source_path = paths[name]
+            with source_storage.open(source_path) as f:
+                original = f.read().decode('utf-8')
+            if self.exists(name):
+                self.delete(name)
+            self._save(name, ContentFile(minifier(original).encode('utf-8')))
+            paths[name] = (self, name)
+
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+
+        for name in {*paths, *self.hashed_files.values()}:
+            self.write_compressed(name)
+
+    def write_compressed(self, name):
+        """为单个文件写出比原文件小的预压缩版本"""
+        if not name.endswith(COMPRESSIBLE_EXTENSIONS) or not self.exists(name):
+            return
+        with self.open(name) as f:
+            content = f.read()
+        if len(content) < MIN_COMPRESS_SIZE:
+            return
+        for extension, data in compress_bytes(content).items():
+            if self.exists(name + extension):
+                self.delete(name + extension)
+            self._save(name + extension, ContentFile(data))
+
+
+def static_serving_enabled():
+    """由Django直接提供collectstatic后的静态文件（预压缩版本和强缓存），用于没有前置Web服务器的部署"""
+    return getattr(settings, 'PORTFOLIO_SERVE_STATIC_ASSETS', False)
+
+
+def is_hashed_name(path):
+    return bool(HASHED_NAME_PATTERN.search(path))
+
+
+def serve_static_asset(request, path):
+    """
+    从STATIC_ROOT返回静态文件
+
+    客户端支持时返回.br或.gz预压缩版本（q=0表示明确拒绝该编码）；带哈希的文件名使用immutable强缓存，
+    其余文件要求浏览器每次用If-None-Match或If-Modified-Since重新验证，每个压缩版本有各自的ETag
+    """
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        full_path = safe_join(str(settings.STATIC_ROOT), path)
+    except (SuspiciousFileOperation, ValueError):
+        raise Http404('静态文件不存在')
+    if not os.path.isfile(full_path):
+        raise Http404('静态文件不存在')
+
+    accepted = accepted_encodings(request.headers.get('Accept-Encoding'))
+    encoding = None
+    served_path = full_path
+    for name, extension in ENCODINGS:
+        if (name in accepted or '*' in accepted) and os.path.isfile(full_path + extension):
+            encoding, served_path = name, full_path + extension
+            break
+
+    stat = os.stat(served_path)
+    etag = file_etag(stat)
+    if encoding:
+        # 同一文件的不同压缩版本字节不同，ETag中带上编码以免互相混用
+        etag = f'{etag[:-1]}-{encoding}"'
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        not_modified['Vary'] = 'Accept-Encoding'
+        return not_modified
+
+    content_type, _ = mimetypes.guess_type(full_path)
+    response = FileResponse(open(served_path, 'rb'), content_type=content_type or 'application/octet-stream')
+    response['Content-Length'] = stat.st_size
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Vary'] = 'Accept-Encoding'
+    if encoding:
+        response['Content-Encoding'] = encoding
+    if is_hashed_name(path):
+        response['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        response['Cache-Control'] = 'public, max-age=0, must-revalidate'
+    return response
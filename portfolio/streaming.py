@@ -0,0 +1,55 @@
+"""
+页面的流式渲染
+先渲染页面框架（把大列表所在位置替换为占位符），占位符之前的部分立即发送，
+浏览器可以开始加载CSS和脚本；列表内容按块渲染并依次发送，最后发送占位符之后的部分
+"""
+
+import uuid
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.template.loader import get_template, render_to_string
+from django.utils.safestring import mark_safe
+
+# 每个进程唯一的占位符，不会与页面内容冲突
+STREAM_SLOT = f'<!--portfolio-stream-{uuid.uuid4().hex}-->'
+
+
+def streaming_min_items():
+    """列表条目数达到该值时使用流式渲染，None表示不使用"""
+    return getattr(settings, 'PORTFOLIO_STREAMING_MIN_ITEMS', 200)
+
+
+def should_stream(item_count):
+    threshold = streaming_min_items()
+    return threshold is not None and item_count >= threshold
+
+
+def render_streaming(request, template_name, context, slot_name, chunk_template_name, chunk_contexts):
+    """
+    流式渲染页面
+
+    Args:
+        request: HTTP请求
+        template_name: 页面模板，模板中用 {{ slot_name }} 输出列表内容
+        context: 页面模板的上下文
+        slot_name: 列表内容在页面模板中的变量名
+        chunk_template_name: 列表中每一块使用的模板
+        chunk_contexts: 每一块的上下文（可迭代对象，按需生成）
+
+    Returns:
+        StreamingHttpResponse: 流式响应；页面框架在返回前渲染，模板错误仍按普通500处理
+    """
+    page = render_to_string(template_name, {**context, slot_name: mark_safe(STREAM_SLOT)}, request)
+    head, slot, tail = page.partition(STREAM_SLOT)
+    if not slot:
+        raise ValueError(f'模板 {template_name} 中没有输出 {slot_name}')
+    chunk_template = get_template(chunk_template_name)
+
+    def generate():
+        yield head
+        for chunk_context in chunk_contexts:
+            yield chunk_template.render({**context, **chunk_context}, request)
+        yield tail
+
+    return StreamingHttpResponse(generate(), content_type='text/html; charset=utf-8')
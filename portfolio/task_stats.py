@@ -0,0 +1,107 @@
+"""
+任务统计引擎
+一次遍历同时算出分类、workshop和完成情况的所有统计，模板过滤器只做O(1)查找；
+统计结果在单个请求内按输入列表缓存，同一页面多次调用过滤器不会重复遍历任务
+"""
+
+import threading
+from collections import Counter
+
+from django.core.signals import request_finished, request_started
+
+
+def get_field(item, name, default=None):
+    """同时支持对象属性和字典两种形式的取值"""
+    if hasattr(item, name):
+        return getattr(item, name)
+    if isinstance(item, dict):
+        return item.get(name, default)
+    return default
+
+
+class TaskStats:
+    """一组任务的统计结果"""
+
+    def __init__(self, tasks):
+        self.total_tasks = 0
+        self.completed_tasks = 0
+        self.by_category = Counter()
+        self.by_workshop = Counter()
+        self.completed_by_category = Counter()
+        self.completed_by_workshop = Counter()
+        self.tasks_by_category = {}
+        self.tasks_by_workshop = {}
+
+        for task in tasks:
+            category = get_field(task, 'category')
+            workshop = get_field(task, 'workshop')
+            completed = get_field(task, 'progress', 0) == 100
+
+            self.total_tasks += 1
+            self.by_category[category] += 1
+            self.by_workshop[workshop] += 1
+            self.tasks_by_category.setdefault(category, []).append(task)
+            self.tasks_by_workshop.setdefault(workshop, []).append(task)
+            if completed:
+                self.completed_tasks += 1
+                self.completed_by_category[category] += 1
+                self.completed_by_workshop[workshop] += 1
+
+    def workshop_completion_rate(self, workshop):
+        """指定workshop的完成率（百分比取整）"""
+        total = self.by_workshop.get(workshop, 0)
+        if total > 0:
+            return round((self.completed_by_workshop.get(workshop, 0) / total) * 100)
+        return 0
+
+
+def iter_project_tasks(projects):
+    """依次产出所有项目中的任务，支持项目对象和字典两种形式"""
+    for project in projects:
+        tasks = get_field(project, 'tasks') or []
+        yield from tasks
+
+
+# 请求级缓存：键为输入列表的id，值中保留列表引用，避免id在请求内被复用
+_local = threading.local()
+
+
+def _request_cache():
+    cache = getattr(_local, 'cache', None)
+    if cache is None:
+        cache = _local.cache = {}
+    return cache
+
+
+def clear_request_cache(**kwargs):
+    """请求开始和结束时清空当前线程的统计缓存"""
+    _local.cache = {}
+
+
+request_started.connect(clear_request_cache, dispatch_uid='portfolio_task_stats_started')
+request_finished.connect(clear_request_cache, dispatch_uid='portfolio_task_stats_finished')
+
+
+def _cached_stats(kind, items, tasks_iter):
+    cache = _request_cache()
+    key = (kind, id(items))
+    entry = cache.get(key)
+    if entry is None or entry[0] is not items:
+        entry = (items, TaskStats(tasks_iter(items)))
+        cache[key] = entry
+    return entry[1]
+
+
+def prime_stats(kind, items, stats):
+    """把已经算好的统计结果（例如来自版本化缓存）放入请求级缓存，kind为'projects'或'tasks'"""
+    _request_cache()[(kind, id(items))] = (items, stats)
+
+
+def stats_for_projects(projects):
+    """多个项目全部任务的统计"""
+    return _cached_stats('projects', projects, iter_project_tasks)
+
+
+def stats_for_tasks(tasks):
+    """单个任务列表的统计"""
+    return _cached_stats('tasks', tasks, iter)
@@ -1,3 +1,1007 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.http import Http404, HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from portfolio_site import settings as project_settings
+
+from . import image_handlers, views
+from .compression import CompressionMiddleware, accepted_encodings, choose_encoding
+from .data_journal import DataJournal
+from .data_store import TaskStore
+from .data_sync import SharedDataFile
+from .image_blobs import BlobStore, ImageBlob
+from .image_handlers import ImageMetadataStore, TaskImage, handle_image_deletion, image_blobs
+from .image_jobs import ImageJob, ImageJobQueue, image_job_queue
+from .instrumentation import RequestMetrics, _current_request
+from .media_serving import media_serving_enabled, parse_range, serve_media
+from .models import Task
+from .orm_store import OrmTaskStore
+from .page_cache import cached_page
+from .pagination import MAX_PAGE_SIZE, decode_cursor, encode_cursor, paginate, parse_page_size
+from .static_assets import serve_static_asset
+
+
+def sample_data():
+    """两个项目、三个任务的最小数据"""
+    return {
+        'projects': [
+            {'id': 1, 'name': '项目一', 'tasks': [
+                {'id': 101, 'title': '任务A', 'category': 'R&D', 'workshop': 1, 'process': [], 'step_images': []},
+                {'id': 102, 'title': '任务B', 'category': 'UAT', 'workshop': 2, 'process': [], 'step_images': []},
+            ]},
+            {'id': 2, 'name': '项目二', 'tasks': [
+                {'id': 201, 'title': '任务C', 'category': 'Support', 'workshop': 1, 'process': [], 'step_images': []},
+            ]},
+        ],
+        'next_task_id': 202,
+    }
+
+
+class TempDirMixin:
+    def setUp(self):
+        super().setUp()
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, ignore_errors=True)
+        self.data_file = os.path.join(self.temp_dir, 'data.json')
+
+    def write_data(self, data):
+        with open(self.data_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+
+    def read_data(self):
+        with open(self.data_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+
+class DataJournalTests(TempDirMixin, SimpleTestCase):
+    """journal模式：追加、回放和合并"""
+
+    def setUp(self):
+        super().setUp()
+        self.write_data(sample_data())
+
+    def load(self, **kwargs):
+        """模拟进程启动：加载快照并回放日志"""
+        store = TaskStore(self.read_data())
+        journal = DataJournal(self.data_file, **kwargs)
+        journal.replay(store)
+        return store, journal
+
+    def put_task(self, store, journal, task_id, **changes):
+        project = store.get_task_project(task_id)
+        task = store.get_task(project['id'], task_id)
+        task.update(changes)
+        return journal.append({'op': 'put_task', 'project_id': project['id'], 'task': task,
+                               'next_task_id': store.data['next_task_id']})
+
+    def test_replay_applies_appended_records(self):
+        store, journal = self.load(compact_threshold=1000)
+        self.assertTrue(self.put_task(store, journal, 101, title='修改后'))
+        new_task = {'id': 202, 'title': '新任务', 'category': 'UAT', 'workshop': 3, 'process': [], 'step_images': []}
+        store.data['next_task_id'] = 203
+        store.add_task(store.get_project(2), new_task)
+        journal.append({'op': 'put_task', 'project_id': 2, 'task': new_task, 'next_task_id': 203})
+        journal.append({'op': 'delete_task', 'project_id': 1, 'task_id': 102})
+
+        # 快照没有变化，修改只存在于日志中
+        self.assertEqual(self.read_data()['projects'][0]['tasks'][0]['title'], '任务A')
+
+        replayed, _ = self.load(compact_threshold=1000)
+        self.assertEqual(replayed.get_task(1, 101)['title'], '修改后')
+        self.assertIsNone(replayed.get_task(1, 102))
+        self.assertEqual(replayed.get_task(2, 202)['title'], '新任务')
+        self.assertEqual(replayed.data['next_task_id'], 203)
+        # 分类索引随回放更新
+        self.assertEqual([t['id'] for t in replayed.filter_tasks(category='UAT')], [202])
+
+    def test_replay_is_idempotent(self):
+        store, journal = self.load(compact_threshold=1000)
+        self.put_task(store, journal, 101, title='一次')
+        self.put_task(store, journal, 101, title='两次')
+        replayed, journal = self.load(compact_threshold=1000)
+        journal.replay(replayed)
+        self.assertEqual(replayed.get_task(1, 101)['title'], '两次')
+        self.assertEqual(len(replayed.get_project(1)['tasks']), 2)
+
+    def test_truncated_last_line_is_ignored(self):
+        store, journal = self.load(compact_threshold=1000)
+        self.put_task(store, journal, 101, title='完整记录')
+        with open(journal.log_file, 'a', encoding='utf-8') as f:
+            f.write('{"op": "put_task", "project_id": 1, "ta')
+        replayed, _ = self.load(compact_threshold=1000)
+        self.assertEqual(replayed.get_task(1, 101)['title'], '完整记录')
+
+    def test_compact_writes_snapshot_and_clears_journal(self):
+        store, journal = self.load(compact_threshold=1000)
+        self.put_task(store, journal, 201, title='合并前')
+        self.assertTrue(journal.compact())
+        self.assertFalse(os.path.exists(journal.log_file))
+        self.assertFalse(os.path.exists(journal.pending_file))
+        self.assertEqual(self.read_data()['projects'][1]['tasks'][0]['title'], '合并前')
+
+        # 合并之后的修改继续写入新的日志
+        self.put_task(store, journal, 201, title='合并后')
+        replayed, _ = self.load(compact_threshold=1000)
+        self.assertEqual(replayed.get_task(2, 201)['title'], '合并后')
+
+    def test_pending_log_from_interrupted_compaction_is_replayed(self):
+        store, journal = self.load(compact_threshold=1000)
+        self.put_task(store, journal, 101, title='合并中崩溃')
+        # 合并把日志改名为待合并日志之后、写出快照之前进程退出
+        os.replace(journal.log_file, journal.pending_file)
+        self.put_task(store, journal, 102, title='之后的修改')
+        replayed, _ = self.load(compact_threshold=1000)
+        self.assertEqual(replayed.get_task(1, 101)['title'], '合并中崩溃')
+        self.assertEqual(replayed.get_task(1, 102)['title'], '之后的修改')
+
+    def test_background_compaction_waits_for_write_lock(self):
+        write_lock = threading.RLock()
+        store, journal = self.load(compact_threshold=2, lock=lambda: write_lock)
+        compacted = threading.Event()
+        original_compact = journal._compact
+
+        def compact():
+            result = original_compact()
+            compacted.set()
+            return result
+
+        journal._compact = compact
+        with write_lock:
+            self.put_task(store, journal, 101, title='第一次')
+            self.put_task(store, journal, 101, title='第二次')  # 达到阈值，启动后台合并
+            # 修改尚未完成，后台合并必须等待写锁
+            self.assertFalse(compacted.wait(0.2))
+            store.get_task(1, 101)['title'] = '锁内的最终值'
+            self.put_task(store, journal, 101)
+        self.assertTrue(compacted.wait(5))
+        self.assertEqual(self.read_data()['projects'][0]['tasks'][0]['title'], '锁内的最终值')
+
+
+class SharedDataFileTests(TempDirMixin, SimpleTestCase):
+    """共享模式：按文件状态重新加载"""
+
+    def setUp(self):
+        super().setUp()
+        self.write_data(sample_data())
+        self.reloads = []
+        self.shared = SharedDataFile(self.data_file, lambda: self.reloads.append(self.read_data()))
+
+    def modify_file(self, title):
+        data = sample_data()
+        data['projects'][0]['tasks'][0]['title'] = title
+        self.write_data(data)
+        # 保证修改时间变化，不依赖文件系统的时间精度
+        stat = os.stat(self.data_file)
+        os.utime(self.data_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    def test_refresh_only_reloads_when_file_changes(self):
+        self.assertFalse(self.shared.refresh())
+        token = self.shared.version_token()
+        self.modify_file('外部修改')
+        self.assertTrue(self.shared.refresh())
+        self.assertEqual(self.reloads[-1]['projects'][0]['tasks'][0]['title'], '外部修改')
+        self.assertNotEqual(self.shared.version_token(), token)
+        self.assertFalse(self.shared.refresh())
+        self.assertEqual(len(self.reloads), 1)
+
+    def test_version_token_changes_only_after_reload_completes(self):
+        tokens = []
+        self.shared.reload_callback = lambda: tokens.append(self.shared.version_token())
+        before = self.shared.version_token()
+        self.modify_file('新版本')
+        self.shared.refresh()
+        # 加载过程中页面缓存仍使用旧版本标识
+        self.assertEqual(tokens, [before])
+        self.assertNotEqual(self.shared.version_token(), before)
+
+    def test_refresh_skips_while_another_thread_holds_the_lock(self):
+        self.modify_file('等待加载')
+        locked = threading.Event()
+        release = threading.Event()
+
+        def writer():
+            with self.shared.locked():
+                locked.set()
+                release.wait(5)
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(release.set)
+        self.assertTrue(locked.wait(5))
+        reloads = len(self.reloads)
+        self.assertFalse(self.shared.refresh())
+        self.assertEqual(len(self.reloads), reloads)
+
+    def test_locked_reloads_external_changes_and_marks_own_writes_clean(self):
+        self.modify_file('其他进程的修改')
+        with self.shared.locked():
+            self.assertEqual(self.reloads[-1]['projects'][0]['tasks'][0]['title'], '其他进程的修改')
+            self.modify_file('本进程的修改')
+        # 本进程在锁内的写入不会被当成外部修改再次加载
+        self.assertFalse(self.shared.refresh())
+
+    def test_reload_data_swaps_in_a_complete_store(self):
+        data = sample_data()
+        data['projects'][0]['tasks'][0]['title'] = '磁盘上的新数据'
+        self.write_data(data)
+        old_store = views.task_store
+        old_projects = list(old_store.projects)
+        with mock.patch.object(views, 'DATA_FILE', self.data_file), \
+                mock.patch.object(views, 'data_journal', None), \
+                mock.patch.object(views, 'task_store', old_store), \
+                mock.patch.object(views, 'global_data', old_store.data):
+            views.reload_data()
+            self.assertIsNot(views.task_store, old_store)
+            self.assertIs(views.global_data, views.task_store.data)
+            self.assertEqual(views.task_store.get_task(1, 101)['title'], '磁盘上的新数据')
+        # 正在使用旧索引的请求看到的仍是完整的旧数据
+        self.assertIs(views.task_store, old_store)
+        self.assertEqual(old_store.projects, old_projects)
+
+
+class BlobStoreTests(TempDirMixin, TestCase):
+    """内容寻址存储：引用计数和批量登记"""
+
+    def setUp(self):
+        super().setUp()
+        self.blobs = BlobStore(os.path.join(self.temp_dir, 'blobs'), '/media/blobs/')
+
+    def stage(self, content, extension='.png'):
+        return self.blobs._spool([content], extension)
+
+    def stored_files(self):
+        return sorted(
+            os.path.relpath(os.path.join(root, name), self.blobs.root_dir)
+            for root, _, names in os.walk(self.blobs.root_dir) for name in names
+        )
+
+    def test_same_content_is_stored_once(self):
+        first = self.blobs.store([b'same', b' content'], '.PNG')
+        second = self.blobs.store([b'same content'], '.jpg')
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(ImageBlob.objects.get(id=first.id).ref_count, 2)
+        self.assertEqual(self.stored_files(), [first.path.replace('/', os.sep)])
+        self.assertTrue(first.path.endswith('.png'))
+        self.assertEqual(self.blobs.url(first.path), f'/media/blobs/{first.path}')
+
+    def test_release_deletes_file_when_last_reference_is_gone(self):
+        blob = self.blobs.store([b'shared'], '.png')
+        self.blobs.store([b'shared'], '.png')
+        file_path = self.blobs.full_path(blob.path)
+        self.assertEqual(self.blobs.release_many([blob.sha256]), [])
+        self.assertTrue(os.path.exists(file_path))
+        self.assertEqual(ImageBlob.objects.get(id=blob.id).ref_count, 1)
+        self.assertEqual(self.blobs.release_many([blob.sha256]), [blob.path])
+        self.assertFalse(os.path.exists(file_path))
+        self.assertFalse(self.blobs.exists(blob.sha256))
+
+    def test_release_many_counts_repeated_hashes(self):
+        blob = self.blobs.store([b'twice'], '.png')
+        self.blobs.store([b'twice'], '.png')
+        other = self.blobs.store([b'other'], '.png')
+        self.assertEqual(self.blobs.release_many([blob.sha256, blob.sha256]), [blob.path])
+        self.assertEqual(ImageBlob.objects.get(id=other.id).ref_count, 1)
+
+    def test_commit_staged_deduplicates_within_batch(self):
+        staged = [self.stage(b'a'), self.stage(b'b'), self.stage(b'a')]
+        blobs = self.blobs.commit_staged(staged)
+        self.assertEqual([blob.sha256 for blob in blobs], [item.sha256 for item in staged])
+        self.assertEqual(blobs[0].id, blobs[2].id)
+        self.assertEqual(ImageBlob.objects.get(sha256=staged[0].sha256).ref_count, 2)
+        self.assertEqual(ImageBlob.objects.get(sha256=staged[1].sha256).ref_count, 1)
+        self.assertEqual(len(self.stored_files()), 2)
+        # 暂存的临时文件全部清理
+        self.assertFalse(any(os.path.exists(item.temp_path) for item in staged))
+
+    def test_commit_staged_increments_existing_blob(self):
+        existing = self.blobs.store([b'existing'], '.png')
+        blobs = self.blobs.commit_staged([self.stage(b'existing'), self.stage(b'new')])
+        self.assertEqual(blobs[0].id, existing.id)
+        self.assertEqual(ImageBlob.objects.get(id=existing.id).ref_count, 2)
+        self.assertEqual(ImageBlob.objects.get(id=blobs[1].id).ref_count, 1)
+        self.assertEqual(len(self.stored_files()), 2)
+
+    def test_commit_staged_retries_after_integrity_error(self):
+        staged = [self.stage(b'raced')]
+        original = ImageBlob.objects.bulk_create
+        calls = []
+
+        def bulk_create(objs, *args, **kwargs):
+            calls.append(len(objs))
+            if len(calls) == 1:
+                raise IntegrityError('UNIQUE constraint failed: portfolio_imageblob.sha256')
+            return original(objs, *args, **kwargs)
+
+        with mock.patch.object(ImageBlob.objects, 'bulk_create', side_effect=bulk_create):
+            blob = self.blobs.commit_staged(staged)[0]
+        self.assertEqual(calls, [1, 1])
+        self.assertEqual(ImageBlob.objects.get(id=blob.id).ref_count, 1)
+        self.assertTrue(os.path.exists(self.blobs.full_path(blob.path)))
+        self.assertFalse(os.path.exists(staged[0].temp_path))
+
+    def test_commit_staged_gives_up_after_repeated_integrity_errors(self):
+        staged = [self.stage(b'always raced')]
+        with mock.patch.object(ImageBlob.objects, 'bulk_create', side_effect=IntegrityError('UNIQUE')):
+            with self.assertRaises(IntegrityError):
+                self.blobs.commit_staged(staged)
+        self.assertFalse(ImageBlob.objects.exists())
+        self.assertEqual(self.stored_files(), [])
+
+
+class CursorPaginationTests(SimpleTestCase):
+    """游标的编码、解码和分页"""
+
+    def test_cursor_round_trip(self):
+        values = ['2026-01-02T03:04:05.123456+00:00', 42]
+        cursor = encode_cursor(values)
+        self.assertNotIn('=', cursor)
+        self.assertEqual(decode_cursor(cursor), values)
+        self.assertEqual(decode_cursor(encode_cursor((3, 7))), [3, 7])
+
+    def test_empty_cursor_means_first_page(self):
+        self.assertIsNone(decode_cursor(None))
+        self.assertIsNone(decode_cursor(''))
+
+    def test_invalid_cursor_raises_value_error(self):
+        for cursor in ('不是游标', '!!!', encode_cursor([1])[:-1] + '*', 'eyJhIjoxfQ', 'MTIz'):
+            with self.subTest(cursor=cursor):
+                with self.assertRaises(ValueError):
+                    decode_cursor(cursor)
+
+    def test_parse_page_size(self):
+        self.assertEqual(parse_page_size(None), 50)
+        self.assertEqual(parse_page_size('', default=10), 10)
+        self.assertEqual(parse_page_size('20'), 20)
+        self.assertEqual(parse_page_size(str(MAX_PAGE_SIZE + 1)), MAX_PAGE_SIZE)
+        for value in ('0', '-1', 'abc'):
+            with self.subTest(value=value):
+                with self.assertRaises(ValueError):
+                    parse_page_size(value)
+
+    def test_paginate_returns_cursor_only_when_more_rows_exist(self):
+        rows, cursor = paginate(iter([1, 2, 3]), 2, lambda row: [row])
+        self.assertEqual(rows, [1, 2])
+        self.assertEqual(decode_cursor(cursor), [2])
+        self.assertEqual(paginate([1, 2], 2, lambda row: [row]), ([1, 2], None))
+
+    def test_page_tasks_walks_every_task_once(self):
+        store = TaskStore(sample_data())
+        seen, after = [], None
+        while True:
+            rows = store.page_tasks(after=after, limit=2)
+            page, cursor = paginate(rows, 2, store.task_sort_key)
+            seen.extend(task['id'] for task in page)
+            if cursor is None:
+                break
+            after = decode_cursor(cursor)
+        self.assertEqual(seen, [t['id'] for t in store.filter_tasks()])
+        self.assertEqual(sorted(seen), [101, 102, 201])
+
+
+class ImageMetadataPageTests(TestCase):
+    """任务图片按(uploaded_at, id)倒序的keyset分页"""
+
+    def setUp(self):
+        tied = timezone.now().replace(microsecond=0)
+        for index in range(7):
+            image = TaskImage.objects.create(task_id=101, image=f'task_images/{index}.png')
+            # 前五张图片的上传时间相同，只能靠id区分先后
+            uploaded_at = tied if index < 5 else tied + timedelta(seconds=index)
+            TaskImage.objects.filter(id=image.id).update(uploaded_at=uploaded_at)
+        TaskImage.objects.create(task_id=102, image='task_images/other.png')
+        self.store = ImageMetadataStore()
+
+    def test_pages_cover_all_images_without_duplicates(self):
+        expected = [image['id'] for image in self.store.images_for_task(101)]
+        self.assertEqual(len(expected), 7)
+        seen, after = [], None
+        while True:
+            page, cursor = self.store.page_for_task(101, after=after, limit=3)
+            self.assertLessEqual(len(page), 3)
+            seen.extend(image['id'] for image in page)
+            if cursor is None:
+                break
+            after = decode_cursor(cursor)
+        self.assertEqual(seen, expected)
+
+    def test_invalid_sort_key_raises_value_error(self):
+        for after in (['not a date', 1], ['2026-01-01T00:00:00+00:00'], ['2026-01-01T00:00:00+00:00', 'x']):
+            with self.subTest(after=after):
+                with self.assertRaises(ValueError):
+                    self.store.page_for_task(101, after=after)
+
+    def test_images_view_rejects_invalid_cursor(self):
+        response = self.client.get('/projects/1/tasks/101/images/', {'cursor': '!!!'})
+        self.assertEqual(response.status_code, 400)
+
+
+PNG_HEADER = b'\x89PNG\r\n\x1a\n'
+
+
+@override_settings(PORTFOLIO_UPLOAD_MAX_FILE_SIZE=1024, PORTFOLIO_UPLOAD_MAX_REQUEST_SIZE=4096)
+class StreamingUploadTests(TempDirMixin, TestCase):
+    """流式上传处理器的大小限制和格式识别"""
+
+    url = '/projects/1/tasks/101/upload-image/'
+
+    def setUp(self):
+        super().setUp()
+        root_dir = os.path.join(self.temp_dir, 'blobs')
+        patcher = mock.patch.object(image_blobs, 'root_dir', root_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # 缩略图任务不在测试中执行
+        patcher = mock.patch.object(image_job_queue, '_submit')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def upload(self, content, name='photo.png'):
+        return self.client.post(self.url, {'image': SimpleUploadedFile(name, content, 'image/png')})
+
+    def temp_files(self):
+        return [
+            name for _, _, names in os.walk(image_blobs.root_dir)
+            for name in names if name.startswith('.upload-')
+        ]
+
+    def test_valid_image_is_stored(self):
+        content = PNG_HEADER + b'\0' * 100
+        response = self.upload(content)
+        self.assertEqual(response.status_code, 200)
+        task_image = TaskImage.objects.get(id=response.json()['image_id'])
+        blob = ImageBlob.objects.get(sha256=task_image.content_hash)
+        with open(image_blobs.full_path(blob.path), 'rb') as f:
+            self.assertEqual(f.read(), content)
+        self.assertEqual(self.temp_files(), [])
+
+    def test_request_over_limit_is_rejected_with_413(self):
+        response = self.upload(PNG_HEADER + b'\0' * 5000)
+        self.assertEqual(response.status_code, 413)
+        body = response.json()
+        self.assertEqual(body['status'], 'error')
+        self.assertIn('4096', body['message'])
+        self.assertTrue(body['errors'])
+        self.assertFalse(TaskImage.objects.exists())
+        self.assertEqual(self.temp_files(), [])
+
+    def test_file_over_limit_is_skipped(self):
+        response = self.upload(PNG_HEADER + b'\0' * 2000)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('photo.png', response.json()['errors'][0])
+        self.assertFalse(TaskImage.objects.exists())
+        self.assertEqual(self.temp_files(), [])
+
+    def test_non_image_is_rejected(self):
+        for content in (b'plain text pretending to be a png', b'GIF'):
+            with self.subTest(content=content):
+                response = self.upload(content)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('不是支持的图片格式', response.json()['message'])
+        self.assertFalse(TaskImage.objects.exists())
+        self.assertEqual(self.temp_files(), [])
+
+
+class StaticAssetTests(TempDirMixin, SimpleTestCase):
+    """预压缩静态文件的编码选择和条件请求"""
+
+    def setUp(self):
+        super().setUp()
+        self.factory = RequestFactory()
+        for name, content in (('app.js', b'plain'), ('app.js.br', b'brotli'), ('app.js.gz', b'gzip')):
+            with open(os.path.join(self.temp_dir, name), 'wb') as f:
+                f.write(content)
+        patcher = override_settings(STATIC_ROOT=self.temp_dir)
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+
+    def get(self, **headers):
+        response = serve_static_asset(self.factory.get('/static/app.js', headers=headers), 'app.js')
+        if response.status_code == 200:
+            self.addCleanup(response.close)
+        return response
+
+    def test_encoding_follows_accept_encoding(self):
+        cases = (
+            ('br, gzip', 'br', b'brotli'),
+            ('gzip', 'gzip', b'gzip'),
+            ('br;q=0, gzip', 'gzip', b'gzip'),
+            ('br;q=0, gzip;q=0', None, b'plain'),
+            ('*', 'br', b'brotli'),
+            ('', None, b'plain'),
+        )
+        for header, encoding, content in cases:
+            with self.subTest(header=header):
+                response = self.get(accept_encoding=header)
+                self.assertEqual(response.get('Content-Encoding'), encoding)
+                self.assertEqual(b''.join(response.streaming_content), content)
+                self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    def test_each_variant_has_its_own_etag(self):
+        etags = {self.get(accept_encoding=header)['ETag'] for header in ('br', 'gzip', '')}
+        self.assertEqual(len(etags), 3)
+
+    def test_etag_revalidation(self):
+        etag = self.get(accept_encoding='gzip')['ETag']
+        response = self.get(accept_encoding='gzip', if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+        # 另一个压缩版本的ETag不能让当前版本返回304
+        self.assertEqual(self.get(accept_encoding='br', if_none_match=etag).status_code, 200)
+
+
+class QueryTimingTests(TestCase):
+    """ORM查询计时：异步视图在线程中执行的查询也计入当前请求"""
+
+    def test_queries_in_worker_thread_are_counted(self):
+        metrics = RequestMetrics()
+        token = _current_request.set(metrics)
+        self.addCleanup(_current_request.reset, token)
+
+        def query():
+            # 新线程使用自己的数据库连接；测试事务锁住了数据表，这里不访问表
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 0')
+                    return cursor.fetchone()[0]
+            finally:
+                connection.close()
+
+        async def run():
+            return await sync_to_async(query, thread_sensitive=False)()
+
+        self.assertEqual(async_to_sync(run)(), 0)
+        self.assertEqual(metrics.db_queries, 1)
+        self.assertGreater(metrics.db_seconds, 0)
+
+    def test_async_view_reports_db_timing(self):
+        TaskImage.objects.create(task_id=101, image='task_images/a.png')
+        response = async_to_sync(self.async_client.get)('/projects/1/tasks/101/images/')
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="[1-9]\d* queries"')
+
+
+class StepImageDeletionTests(TempDirMixin, TestCase):
+    """步骤图片删除：删除键精确匹配、批量删除记录和释放文件引用"""
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(image_blobs, 'root_dir', os.path.join(self.temp_dir, 'blobs'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.legacy_dir = os.path.join(self.temp_dir, 'task_step_images')
+        os.makedirs(self.legacy_dir)
+        patcher = mock.patch.object(image_handlers, 'STEP_IMAGE_DIR', self.legacy_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.task = {'id': 101, 'step_images': []}
+
+    def add_image(self, step, file_name, content):
+        """按内容存储的步骤图片，与handle_image_upload写入的条目相同"""
+        blob = image_blobs.store([content], '.png')
+        row = TaskImage.objects.create(task_id=101, image=f'blobs/{blob.path}', content_hash=blob.sha256)
+        entry = {'step': step, 'url': image_blobs.url(blob.path), 'file_name': file_name, 'filename': file_name,
+                 'content_hash': blob.sha256, 'id': row.id}
+        self.task['step_images'].append(entry)
+        return entry
+
+    def add_legacy_image(self, step, file_name):
+        """按文件名保存在task_step_images目录中的旧图片"""
+        with open(os.path.join(self.legacy_dir, file_name), 'wb') as f:
+            f.write(PNG_HEADER)
+        TaskImage.objects.create(task_id=101, image=f'task_step_images/{file_name}')
+        entry = {'step': step, 'url': f'/media/task_step_images/{file_name}', 'file_name': file_name}
+        self.task['step_images'].append(entry)
+        return entry
+
+    def delete(self, keys):
+        return handle_image_deletion(self.task, keys, self.data_file)
+
+    def remaining_names(self):
+        return [img['file_name'] for img in self.task['step_images']]
+
+    def test_similar_names_are_not_deleted(self):
+        self.add_legacy_image(1, 'a.png')
+        self.add_legacy_image(1, 'aa.png')
+        self.add_legacy_image(1, 'a.png.png')
+        self.add_image(1, 'task_101_step1_1.png', b'one')
+        self.add_image(1, 'task_101_step1_10.png', b'ten')
+        result = self.delete(['a.png', '1_task_101_step1_1.png'])
+        self.assertEqual(result['deleted_count'], 2)
+        self.assertEqual(self.remaining_names(), ['aa.png', 'a.png.png', 'task_101_step1_10.png'])
+        self.assertEqual(sorted(os.listdir(self.legacy_dir)), ['a.png.png', 'aa.png'])
+        self.assertEqual(
+            sorted(TaskImage.objects.values_list('image', flat=True)),
+            sorted(['task_step_images/aa.png', 'task_step_images/a.png.png',
+                    f'blobs/{image_blobs.relative_path(self.task["step_images"][2]["content_hash"], ".png")}'])
+        )
+
+    def test_unknown_key_deletes_nothing(self):
+        self.add_legacy_image(1, 'a.png')
+        self.add_image(2, 'task_101_step2_1.png', b'two')
+        result = self.delete(['a', '2_task_101_step2', '1_999'])
+        self.assertEqual(result['deleted_count'], 0)
+        self.assertEqual(len(self.task['step_images']), 2)
+        self.assertEqual(TaskImage.objects.count(), 2)
+
+    def test_selected_rows_are_deleted_in_one_query(self):
+        by_id = self.add_image(1, 'task_101_step1_1.png', b'one')
+        by_step_name = self.add_image(2, 'task_101_step2_1.png', b'two')
+        by_name = self.add_image(3, 'task_101_step3_1.png', b'three')
+        self.add_legacy_image(3, 'legacy.png')
+        kept = self.add_image(3, 'task_101_step3_2.png', b'kept')
+        keys = [f'1_{by_id["id"]}', '2_task_101_step2_1.png', 'task_101_step3_1.png', 'legacy.png']
+        with CaptureQueriesContext(connection) as queries:
+            result = self.delete(keys)
+        deletes = [q['sql'] for q in queries if q['sql'].startswith('DELETE FROM "portfolio_taskimage"')]
+        self.assertEqual(len(deletes), 1)
+        self.assertEqual(result['deleted_count'], 4)
+        self.assertEqual(result['remaining_count'], 1)
+        self.assertEqual(list(TaskImage.objects.values_list('id', flat=True)), [kept['id']])
+        for entry in (by_id, by_step_name, by_name):
+            self.assertFalse(ImageBlob.objects.filter(sha256=entry['content_hash']).exists())
+
+    def test_shared_blob_is_released_per_reference(self):
+        first = self.add_image(1, 'task_101_step1_1.png', b'shared')
+        second = self.add_image(2, 'task_101_step2_1.png', b'shared')
+        blob = ImageBlob.objects.get(sha256=first['content_hash'])
+        self.assertEqual(blob.ref_count, 2)
+        file_path = image_blobs.full_path(blob.path)
+
+        self.delete([f'1_{first["id"]}'])
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 1)
+        self.assertTrue(os.path.exists(file_path))
+
+        self.delete([f'2_{second["id"]}'])
+        self.assertFalse(ImageBlob.objects.filter(id=blob.id).exists())
+        self.assertFalse(os.path.exists(file_path))
+        self.assertEqual(self.task['step_images'], [])
+
+
+class MediaServingTests(TempDirMixin, SimpleTestCase):
+    """媒体文件的Range请求、条件请求和内部文件隐藏"""
+
+    content = bytes(range(256)) * 4
+
+    def setUp(self):
+        super().setUp()
+        self.factory = RequestFactory()
+        os.makedirs(os.path.join(self.temp_dir, 'blobs', 'ab'))
+        with open(os.path.join(self.temp_dir, 'blobs', 'ab', 'abc.png'), 'wb') as f:
+            f.write(self.content)
+        with open(os.path.join(self.temp_dir, 'blobs', '.upload-x1y2'), 'wb') as f:
+            f.write(b'partial upload')
+        patcher = override_settings(MEDIA_ROOT=self.temp_dir, PORTFOLIO_MEDIA_OFFLOAD=None)
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+
+    def get(self, path='blobs/ab/abc.png', **headers):
+        response = serve_media(self.factory.get(f'/media/{path}', headers=headers), path)
+        self.addCleanup(response.close)
+        return response
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range('bytes=0-9', 1024), (0, 10))
+        self.assertEqual(parse_range('bytes=-5', 1024), (1019, 5))
+        self.assertEqual(parse_range('bytes=1000-', 1024), (1000, 24))
+        self.assertEqual(parse_range('bytes=1000-5000', 1024), (1000, 24))
+        for header in (None, '', 'bytes=-', 'bytes=0-1,5-9', 'items=0-9'):
+            with self.subTest(header=header):
+                self.assertIsNone(parse_range(header, 1024))
+        for header in ('bytes=2000-', 'bytes=9-0', 'bytes=-0'):
+            with self.subTest(header=header):
+                with self.assertRaises(ValueError):
+                    parse_range(header, 1024)
+
+    def test_full_response(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_range_requests(self):
+        response = self.get(range='bytes=0-9')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 0-9/1024')
+        self.assertEqual(self.body(response), self.content[:10])
+
+        response = self.get(range='bytes=-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 1019-1023/1024')
+        self.assertEqual(self.body(response), self.content[-5:])
+
+    def test_unsatisfiable_range_returns_416(self):
+        response = self.get(range='bytes=2000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */1024')
+
+    def test_multi_range_falls_back_to_full_response(self):
+        response = self.get(range='bytes=0-1,5-9')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.content)
+
+    def test_if_range(self):
+        etag = self.get()['ETag']
+        response = self.get(range='bytes=0-9', if_range=etag)
+        self.assertEqual(response.status_code, 206)
+        # 文件已经变化（ETag过期）时返回完整文件，而不是把新旧内容拼在一起
+        response = self.get(range='bytes=0-9', if_range='"stale-etag"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.content)
+
+    def test_conditional_request_returns_304(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(if_none_match=etag).status_code, 304)
+
+    def test_internal_files_are_hidden(self):
+        for path in ('blobs/.upload-x1y2', '.hidden', 'blobs/../blobs/.upload-x1y2', '../outside.png'):
+            with self.subTest(path=path):
+                with self.assertRaises(Http404):
+                    serve_media(self.factory.get('/media/x'), path)
+
+    def test_serving_defaults_to_debug(self):
+        self.assertEqual(project_settings.PORTFOLIO_SERVE_MEDIA, project_settings.DEBUG)
+        for debug in (False, True):
+            with self.subTest(debug=debug), override_settings(DEBUG=debug):
+                del settings.PORTFOLIO_SERVE_MEDIA
+                self.assertIs(media_serving_enabled(), debug)
+
+
+@override_settings(PORTFOLIO_COMPRESSION_ENABLED=True, PORTFOLIO_COMPRESSION_MIN_SIZE=100,
+                   PORTFOLIO_PAGE_CACHE_ALIAS='default')
+class CompressionMiddlewareTests(SimpleTestCase):
+    """响应压缩：编码协商、弱ETag和已编码的响应"""
+
+    html = '<p>任务列表</p>' * 200
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.version = 'v1'
+
+    def respond(self, view, **headers):
+        return CompressionMiddleware(view)(self.factory.get('/tasks/', headers=headers))
+
+    def page(self, request):
+        return HttpResponse(self.html, content_type='text/html; charset=utf-8')
+
+    def test_quality_zero_refuses_encoding(self):
+        self.assertEqual(accepted_encodings('gzip;q=0, br;q=0.5, deflate'), {'br', 'deflate'})
+        self.assertEqual(choose_encoding('br;q=0, gzip'), 'gzip')
+        self.assertIsNone(choose_encoding('gzip;q=0'))
+        self.assertIsNone(choose_encoding('gzip;q=0.0, identity'))
+        self.assertEqual(choose_encoding('*'), choose_encoding('br, gzip'))
+
+        response = self.respond(self.page, accept_encoding='gzip;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content.decode(), self.html)
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+        response = self.respond(self.page, accept_encoding='br;q=0, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_weak_etag_still_revalidates_through_page_cache(self):
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+        view = cached_page(lambda: self.version, lambda: None, is_enabled=lambda: True)(self.page)
+
+        response = self.respond(view, accept_encoding='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('W/"'))
+
+        response = self.respond(view, accept_encoding='gzip', if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+        # 数据版本变化后旧ETag失效
+        self.version = 'v2'
+        self.assertEqual(self.respond(view, accept_encoding='gzip', if_none_match=etag).status_code, 200)
+
+    def test_already_encoded_response_is_not_compressed_again(self):
+        body = b'\x1b' + b'precompressed' * 50
+
+        def precompressed(request):
+            response = HttpResponse(body, content_type='text/javascript')
+            response['Content-Encoding'] = 'br'
+            response['ETag'] = '"asset"'
+            return response
+
+        response = self.respond(precompressed, accept_encoding='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(response.content, body)
+        self.assertEqual(response['ETag'], '"asset"')
+
+
+class OrmTaskStoreTests(TestCase):
+    """数据库存储后端：导入、保存和新增任务"""
+
+    def setUp(self):
+        self.store = OrmTaskStore()
+        self.data = sample_data()
+        self.data['projects'][0]['tasks'][0].update(
+            process=[{'title': '第一步', 'content': '说明'}, {'title': '第二步', 'content': ''}],
+            step_images=[{'step': 1, 'file_name': 'a.png', 'url': '/media/blobs/a.png'}],
+            progress=50,
+        )
+        self.store.import_data(self.data, batch_size=2)
+
+    def test_import_data_round_trip(self):
+        self.assertEqual([p['id'] for p in self.store.projects], [1, 2])
+        task = self.store.get_task(1, 101)
+        self.assertEqual(task['process'], self.data['projects'][0]['tasks'][0]['process'])
+        self.assertEqual(task['step_images'][0]['file_name'], 'a.png')
+        self.assertEqual(task['progress'], 50)
+        self.assertIsNone(self.store.get_task(2, 101))
+
+        # 重复导入不会产生重复数据，replace=True时以导入的数据为准
+        self.assertEqual(self.store.import_data(self.data), (2, 3))
+        self.assertEqual(Task.objects.count(), 3)
+        del self.data['projects'][1]
+        self.store.import_data(self.data, replace=True)
+        self.assertEqual(sorted(Task.objects.values_list('id', flat=True)), [101, 102])
+
+    def test_save_task_and_reload(self):
+        project = self.store.get_project(1)
+        task = self.store.get_task(1, 102)
+        task['title'] = '修改后的标题'
+        task['process'] = [{'title': '新步骤', 'content': '内容'}]
+        self.assertTrue(self.store.save_task(project, task))
+        reloaded = OrmTaskStore().get_task(1, 102)
+        self.assertEqual(reloaded['title'], '修改后的标题')
+        self.assertEqual(reloaded['process'], [{'title': '新步骤', 'content': '内容'}])
+
+    def test_save_missing_task_returns_false(self):
+        project = self.store.get_project(1)
+        self.assertFalse(self.store.save_task(project, {'id': 999, 'title': '不存在'}))
+        self.assertFalse(Task.objects.filter(id=999).exists())
+
+    def test_add_task_retries_when_id_is_taken(self):
+        project = self.store.get_project(2)
+        candidate = self.store.allocate_task_id()
+        # 另一个请求在此期间用同一个ID新增了任务
+        other = {'id': candidate, 'title': '先保存的任务', 'category': 'UAT', 'workshop': 1}
+        self.store.add_task(self.store.get_project(1), other)
+
+        task = {'id': candidate, 'title': '后保存的任务', 'category': 'R&D', 'workshop': 2}
+        self.store.add_task(project, task)
+        self.assertNotEqual(task['id'], candidate)
+        self.assertEqual(self.store.get_task(1, candidate)['title'], '先保存的任务')
+        self.assertEqual(self.store.get_task(2, task['id'])['title'], '后保存的任务')
+        self.assertIn(task, project['tasks'])
+
+    def test_add_task_gives_up_after_repeated_conflicts(self):
+        project = self.store.get_project(1)
+        with mock.patch.object(self.store, 'allocate_task_id', return_value=101):
+            with self.assertRaises(IntegrityError):
+                self.store.add_task(project, {'id': 101, 'title': '冲突'})
+        self.assertEqual(self.store.get_task(1, 101)['title'], '任务A')
+
+
+class ProcessMigrationTests(TransactionTestCase):
+    """0002迁移把旧的纯文本process转换为JSON步骤列表"""
+
+    migrate_from = [('portfolio', '0001_initial')]
+    migrate_to = [('portfolio', '0002_task_storage_backend')]
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+        super().tearDown()
+
+    def test_process_text_is_converted(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_from)
+        old_apps = executor.loader.project_state(self.migrate_from).apps
+        OldTask = old_apps.get_model('portfolio', 'Task')
+        for task_id, process in ((1, ''), (2, '第一步\n\n第二步\n'), (3, '[{"title": "a", "content": "b"}]')):
+            OldTask.objects.create(id=task_id, project_id=1, title='t', category='UAT', technology='',
+                                   workshop=1, description='', process=process, results='', progress=0)
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_to)
+        new_apps = executor.loader.project_state(self.migrate_to).apps
+        NewTask = new_apps.get_model('portfolio', 'Task')
+        self.assertEqual(dict(NewTask.objects.values_list('id', 'process')), {
+            1: [],
+            2: [{'title': '第一步', 'content': ''}, {'title': '第二步', 'content': ''}],
+            3: [{'title': 'a', 'content': 'b'}],
+        })
+
+
+class ImageJobQueueTests(TestCase):
+    """图片任务队列：领取、失败任务的可见期和中断任务的恢复（同步执行模式）"""
+
+    def setUp(self):
+        self.queue = ImageJobQueue(run_async=False, stale_seconds=600, failed_visible_seconds=3600)
+        self.calls = []
+
+        @self.queue.register('ok')
+        def ok(payload):
+            self.calls.append(payload['n'])
+            return {'n': payload['n']}
+
+        @self.queue.register('broken')
+        def broken(payload):
+            raise RuntimeError('无法读取图片')
+
+    def create_job(self, kind='ok', status=ImageJob.PENDING, age=0, n=1):
+        job = ImageJob.objects.create(kind=kind, task_id=101, payload={'n': n}, status=status)
+        if age:
+            ImageJob.objects.filter(id=job.id).update(updated_at=timezone.now() - timedelta(seconds=age))
+        return job
+
+    def test_enqueue_runs_job_inline(self):
+        job = self.queue.enqueue('ok', 101, {'n': 7})
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImageJob.DONE)
+        self.assertEqual(job.result, {'n': 7})
+        self.assertEqual(job.attempts, 1)
+
+    def test_job_is_claimed_exactly_once(self):
+        job = self.create_job()
+        self.queue.run_job(job.id)
+        self.queue.run_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual(self.calls, [1])
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(job.status, ImageJob.DONE)
+
+    def test_job_claimed_elsewhere_is_skipped(self):
+        job = self.create_job(status=ImageJob.RUNNING)
+        self.queue.run_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual(self.calls, [])
+        self.assertEqual(job.status, ImageJob.RUNNING)
+        self.assertEqual(job.attempts, 0)
+
+    def test_failed_job_is_visible_until_window_expires(self):
+        job = self.queue.enqueue('broken', 101, {})
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImageJob.FAILED)
+        self.assertEqual(job.error, '无法读取图片')
+        self.assertEqual([j.id for j in self.queue.jobs_for_task(101)], [job.id])
+
+        ImageJob.objects.filter(id=job.id).update(updated_at=timezone.now() - timedelta(seconds=3601))
+        self.assertEqual(self.queue.jobs_for_task(101), [])
+
+    def test_progress_lists_pending_running_and_recent_failures(self):
+        pending = self.create_job(status=ImageJob.PENDING)
+        running = self.create_job(status=ImageJob.RUNNING)
+        failed = self.create_job(status=ImageJob.FAILED, age=60)
+        self.create_job(status=ImageJob.FAILED, age=7200)
+        self.create_job(status=ImageJob.DONE)
+        self.assertEqual([j.id for j in self.queue.jobs_for_task(101)], [pending.id, running.id, failed.id])
+        self.assertEqual(self.queue.jobs_for_task(102), [])
+
+    def test_recover_resubmits_interrupted_jobs(self):
+        interrupted = self.create_job(status=ImageJob.RUNNING, age=601, n=1)
+        in_progress = self.create_job(status=ImageJob.RUNNING, age=10, n=2)
+        pending = self.create_job(status=ImageJob.PENDING, n=3)
+        done = self.create_job(status=ImageJob.DONE, n=4)
+
+        self.assertEqual(self.queue.recover(), 2)
+        self.assertEqual(self.calls, [1, 3])
+        statuses = dict(ImageJob.objects.values_list('id', 'status'))
+        self.assertEqual(statuses[interrupted.id], ImageJob.DONE)
+        self.assertEqual(statuses[pending.id], ImageJob.DONE)
+        # 仍在其他进程中处理的任务不会被重复执行
+        self.assertEqual(statuses[in_progress.id], ImageJob.RUNNING)
+        self.assertEqual(statuses[done.id], ImageJob.DONE)
+        self.assertEqual(self.queue.recover(), 0)
@@ -0,0 +1,188 @@
+"""
+图片上传的流式处理
+上传内容按块直接写入媒体目录下的临时文件，同时计算SHA-256并根据文件头识别图片格式，
+单个文件和整个请求都有字节数上限：请求过大时在读取请求体之前就拒绝，单个文件超限或不是图片时跳过该文件
+"""
+
+import hashlib
+import os
+import tempfile
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile, StopUpload
+from django.http import JsonResponse, QueryDict
+from django.utils.datastructures import MultiValueDict
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+
+from .image_handlers import image_blobs
+from .instrumentation import record_image_io
+
+# 识别图片格式所需的文件头长度
+SNIFF_LENGTH = 12
+
+# 格式名与保存时使用的扩展名
+FORMAT_EXTENSIONS = {
+    'jpeg': '.jpg',
+    'png': '.png',
+    'gif': '.gif',
+    'webp': '.webp',
+}
+
+
+def max_file_size():
+    return getattr(settings, 'PORTFOLIO_UPLOAD_MAX_FILE_SIZE', 10 * 1024 * 1024)
+
+
+def max_request_size():
+    return getattr(settings, 'PORTFOLIO_UPLOAD_MAX_REQUEST_SIZE', 50 * 1024 * 1024)
+
+
+def sniff_image_format(head):
+    """根据文件头判断图片格式，无法识别时返回None"""
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+class HashedUploadedFile(UploadedFile):
+    """写入临时文件的上传图片，附带内容哈希和识别出的格式"""
+
+    def __init__(self, name, content_type, charset, content_type_extra, temp_dir):
+        os.makedirs(temp_dir, exist_ok=True)
+        file = tempfile.NamedTemporaryFile(prefix='.upload-', suffix='.upload', dir=temp_dir)
+        super().__init__(file, name, content_type, 0, charset, content_type_extra)
+        self.sha256 = None
+        self.image_format = None
+
+    @property
+    def image_extension(self):
+        return FORMAT_EXTENSIONS.get(self.image_format, '')
+
+    def temporary_file_path(self):
+        return self.file.name
+
+    def close(self):
+        try:
+            return self.file.close()
+        except FileNotFoundError:
+            # 临时文件已被移动到正式存储位置
+            pass
+
+
+class StreamingImageUploadHandler(FileUploadHandler):
+    """流式写入上传图片的处理器，出错的文件记录在request.upload_errors中"""
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.errors = []
+        self.request_rejected = False
+        self.total_bytes = 0
+        self.file = None
+        if request is not None:
+            request.upload_errors = self.errors
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        """请求体超过上限时直接拒绝，不再读取请求体"""
+        if content_length > max_request_size():
+            self.request_rejected = True
+            self.errors.append(f'上传内容过大（{content_length} 字节），单次请求最多 {max_request_size()} 字节')
+            return QueryDict(encoding=encoding), MultiValueDict()
+        return None
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        # 先创建临时文件再做检查：跳过文件时解析器会关闭self.file，不能让它指向上一个已完成的文件
+        self.file = HashedUploadedFile(file_name, content_type, charset, content_type_extra, image_blobs.root_dir)
+        self._digest = hashlib.sha256()
+        self._head = b''
+        self._size = 0
+        if content_length is not None and content_length > max_file_size():
+            self.errors.append(f'{file_name}: 文件超过 {max_file_size()} 字节')
+            raise SkipFile()
+
+    def receive_data_chunk(self, raw_data, start):
+        self._size += len(raw_data)
+        self.total_bytes += len(raw_data)
+        if self.total_bytes > max_request_size():
+            self.request_rejected = True
+            self.errors.append(f'上传内容过大，单次请求最多 {max_request_size()} 字节')
+            raise StopUpload()
+        if self._size > max_file_size():
+            self.errors.append(f'{self.file_name}: 文件超过 {max_file_size()} 字节')
+            raise SkipFile()
+
+        if self.file.image_format is None:
+            self._head += raw_data[:SNIFF_LENGTH]
+            if len(self._head) >= SNIFF_LENGTH:
+                self.file.image_format = sniff_image_format(self._head)
+                if self.file.image_format is None:
+                    self.errors.append(f'{self.file_name}: 不是支持的图片格式')
+                    raise SkipFile()
+
+        self._digest.update(raw_data)
+        self.file.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if self.file.image_format is None:
+            # 文件小于文件头长度
+            self.file.image_format = sniff_image_format(self._head)
+            if self.file.image_format is None:
+                self.errors.append(f'{self.file_name}: 不是支持的图片格式')
+                self.file.close()
+                return None
+        self.file.flush()
+        self.file.seek(0)
+        self.file.size = file_size
+        record_image_io('upload', file_size)
+        self.file.sha256 = self._digest.hexdigest()
+        return self.file
+
+    def upload_interrupted(self):
+        if self.file is not None:
+            self.file.close()
+
+
+def streaming_image_upload(view_func):
+    """让视图使用StreamingImageUploadHandler解析上传文件
+
+    上传处理器必须在读取request.POST之前设置，因此先跳过CSRF中间件，
+    设置处理器并解析请求后再执行CSRF校验；请求体超过上限时直接返回413。
+    异步视图的请求体在线程中解析，读取和写入临时文件不会阻塞事件循环
+    """
+    protected_view = csrf_protect(view_func)
+
+    def parse(request):
+        handler = StreamingImageUploadHandler(request)
+        request.upload_handlers = [handler]
+        if request.method == 'POST':
+            request.POST  # 触发请求体解析
+            if handler.request_rejected:
+                return JsonResponse({'status': 'error', 'message': handler.errors[-1], 'errors': handler.errors}, status=413)
+        return None
+
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def wrapper(request, *args, **kwargs):
+            rejected = await sync_to_async(parse)(request)
+            if rejected is not None:
+                return rejected
+            return await protected_view(request, *args, **kwargs)
+    else:
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            rejected = parse(request)
+            if rejected is not None:
+                return rejected
+            return protected_view(request, *args, **kwargs)
+
+    return csrf_exempt(wrapper)
@@ -1,5 +1,6 @@
 from django.urls import path
 from . import views
+from .instrumentation import metrics_view
 
 urlpatterns = [
     path('', views.home, name='home'),
@@ -18,4 +19,12 @@ urlpatterns = [
     # 图片上传和获取的URL
     path('projects/<int:project_id>/tasks/<int:task_id>/upload-image/', views.upload_task_image, name='upload_task_image'),
     path('projects/<int:project_id>/tasks/<int:task_id>/images/', views.get_task_images, name='get_task_images'),
+    # 任务详情页按需加载的片段
+    path('projects/<int:project_id>/tasks/<int:task_id>/steps/', views.task_steps_fragment, name='task_steps_fragment'),
+    path('projects/<int:project_id>/tasks/<int:task_id>/related/', views.task_related_fragment, name='task_related_fragment'),
+    # 分页的JSON接口
+    path('api/tasks/', views.task_list_api, name='task_list_api'),
+    path('api/projects/<int:project_id>/tasks/', views.task_list_api, name='project_tasks_api'),
+    # Prometheus指标，只允许本机访问
+    path('metrics/', metrics_view, name='metrics'),
 ]
\ No newline at end of file
@@ -1,12 +1,39 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.http import Http404, JsonResponse, HttpResponseBadRequest
+from django.urls import reverse
 from django.core.exceptions import ValidationError
 from django.db import IntegrityError
 from .models import Project, Task
-from .image_handlers import TaskImage, get_task_images_view, update_task_images
+from .image_handlers import TaskImage, get_task_images_view, update_task_images, process_step_image, discard_step_image, image_blobs, image_metadata
+from .image_jobs import image_job_queue
+from .upload_handlers import streaming_image_upload
+from .data_store import TaskStore
+from .data_journal import DataJournal, atomic_write_json
+from .data_sync import SharedDataFile
+from .orm_store import OrmTaskStore
+from .aggregate_cache import VersionedCache
+from .task_stats import TaskStats, iter_project_tasks, prime_stats
+from .page_cache import cached_page, page_cache_enabled
+from .pagination import decode_cursor, paginate, parse_page_size
+from .markup import markup_renderer, step_images_by_name
+from .streaming import render_streaming, should_stream
+from .instrumentation import timed_function
+from datetime import datetime, timezone
+from functools import wraps
+from django.conf import settings
+from django.core.signals import request_started
+from asgiref.sync import sync_to_async
+import asyncio
+import heapq
 import json
+import logging
 import os
 import re
+import threading
+import uuid
+import weakref
+
+logger = logging.getLogger(__name__)
 
 # 任务分类配置
 TASK_CATEGORIES = {
@@ -28,6 +55,7 @@ WORKSHOP_NUMBERS = {
 DATA_FILE = os.path.join(os.path.dirname(__file__), 'data.json')
 
 # 初始化或加载数据
+@timed_function('load_data')
 def load_data():
     """从文件加载项目和任务数据"""
     if os.path.exists(DATA_FILE):
@@ -42,8 +70,11 @@ def load_data():
         "tasks": []
     }
 
+@timed_function('save_data')
 def save_data(data):
     """保存数据到文件 - 增强的错误处理"""
+    # 内存中的数据已被修改，无论保存是否成功都让统计缓存失效
+    dashboard_cache.invalidate()
     try:
         # 确保目录存在
         os.makedirs(os.path.dirname(DATA_FILE), exist_ok=True)
@@ -52,98 +83,291 @@ def save_data(data):
         if os.path.exists(DATA_FILE):
             # 检查是否可写
             if not os.access(DATA_FILE, os.W_OK):
-                print(f"错误: 文件不可写: {DATA_FILE}")
+                logger.error('文件不可写: %s', DATA_FILE)
                 return False
         
-        # 尝试保存数据
-        with open(DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        # journal模式下由日志合并生成快照，保证快照与日志一致
+        if data_journal is not None:
+            return data_journal.compact()
+        
+        # 尝试保存数据（先写临时文件再重命名，避免产生写了一半的文件）
+        atomic_write_json(DATA_FILE, data, indent=2)
         
-        print(f"✓ 成功保存数据到: {DATA_FILE}")
+        logger.debug('成功保存数据到: %s', DATA_FILE)
         return True
     except PermissionError:
-        print(f"错误: 没有权限写入文件: {DATA_FILE}")
+        logger.error('没有权限写入文件: %s', DATA_FILE)
         return False
     except FileNotFoundError:
-        print(f"错误: 找不到目录: {os.path.dirname(DATA_FILE)}")
+        logger.error('找不到目录: %s', os.path.dirname(DATA_FILE))
         return False
     except json.JSONDecodeError:
-        print(f"错误: JSON序列化失败")
+        logger.error('JSON序列化失败')
         return False
     except Exception as e:
-        print(f"错误: 保存数据失败: {e}")
+        logger.exception('保存数据失败: %s', e)
         return False
 
+# 存储后端：'json' 使用 data.json，'database' 使用Project/Task数据表
+STORAGE_BACKEND = getattr(settings, 'PORTFOLIO_STORAGE_BACKEND', 'json')
+USE_DATABASE_STORE = STORAGE_BACKEND == 'database'
+
 # 初始化全局数据
 global_data = load_data()
+# 视图统一通过task_store查找项目和任务；json后端基于全局数据建立索引
+task_store = OrmTaskStore() if USE_DATABASE_STORE else TaskStore(global_data)
+
+# 看板统计缓存，每次保存或重新加载数据时失效；数据库可能被其他进程修改，数据库后端下不缓存
+dashboard_cache = VersionedCache(
+    maxsize=getattr(settings, 'PORTFOLIO_AGGREGATE_CACHE_SIZE', 128),
+    enabled=not USE_DATABASE_STORE
+)
+
+def reload_data():
+    """重新从磁盘加载数据
+
+    新的数据和索引（包括日志回放）在旁边建好后再整体替换task_store，
+    不持有写锁的读请求要么看到替换前的完整数据，要么看到新数据，不会看到加载了一半的状态
+    """
+    global global_data, task_store
+    fresh_store = TaskStore(load_data())
+    if data_journal is not None:
+        data_journal.replay(fresh_store)
+    task_store = fresh_store
+    global_data = fresh_store.data
+    dashboard_cache.invalidate()
+
+# 共享模式：多个worker进程共用data.json，修改时加文件锁，文件变化时才重新加载
+shared_data = None
+if not USE_DATABASE_STORE and getattr(settings, 'PORTFOLIO_SHARED_DATA', False):
+    shared_data = SharedDataFile(DATA_FILE, reload_data, watched_files=(f'{DATA_FILE}.journal',))
+
+# journal模式：修改以追加日志的方式持久化，启动时回放"快照 + 日志"
+data_journal = None
+if not USE_DATABASE_STORE and getattr(settings, 'PORTFOLIO_DATA_JOURNAL', False):
+    data_journal = DataJournal(
+        DATA_FILE,
+        compact_threshold=getattr(settings, 'PORTFOLIO_JOURNAL_COMPACT_THRESHOLD', 200),
+        # 后台合并与请求线程的修改互斥，快照中不会出现修改了一半的任务
+        lock=lambda: data_write_lock()
+    )
+    data_journal.replay(task_store)
+    if shared_data is not None:
+        shared_data.mark_clean()
+
+# 进程启动标识，保证不同进程各自递增的数据版本号不会互相混淆
+PROCESS_TOKEN = uuid.uuid4().hex[:8]
+
+def data_version():
+    """当前数据版本标识，用于页面缓存键和ETag"""
+    if shared_data is not None:
+        return shared_data.version_token()
+    return f'{PROCESS_TOKEN}-{dashboard_cache.version}'
+
+def data_last_modified():
+    """数据最后修改时间，用于Last-Modified响应头"""
+    timestamp = shared_data.last_modified() if shared_data is not None else None
+    if timestamp is None:
+        timestamp = dashboard_cache.modified_at
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc)
+
+def page_cache_active():
+    """数据库后端没有可靠的数据版本号，不使用页面缓存"""
+    return page_cache_enabled() and not USE_DATABASE_STORE
+
+# 只读页面的整页缓存，数据版本变化后自动失效
+cached_read_view = cached_page(data_version, data_last_modified, is_enabled=page_cache_active)
+
+# 单进程模式下修改数据的线程锁，保证请求线程与后台图片任务不会同时修改同一个任务
+_write_lock = threading.RLock()
+
+def data_write_lock():
+    """修改数据时持有的锁：共享模式下为跨进程的文件锁，否则为进程内的线程锁"""
+    if shared_data is not None:
+        return shared_data.locked()
+    return _write_lock
+
+def synced_data(view_func):
+    """保证视图看到最新数据：POST请求在写锁内执行，共享模式下其他请求只做stat()检查"""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if request.method == 'POST':
+            with data_write_lock():
+                return view_func(request, *args, **kwargs)
+        if shared_data is not None:
+            shared_data.refresh()
+        return view_func(request, *args, **kwargs)
+    return wrapper
+
+# 异步视图的写锁排队：每个事件循环一个asyncio锁，等待中的请求不占用线程
+_async_write_locks = weakref.WeakKeyDictionary()
+
+def _async_write_lock():
+    loop = asyncio.get_running_loop()
+    lock = _async_write_locks.get(loop)
+    if lock is None:
+        lock = _async_write_locks[loop] = asyncio.Lock()
+    return lock
+
+async def run_with_write_lock(func, *args, **kwargs):
+    """供异步视图使用：在线程中持有data_write_lock()执行func，返回其结果
 
+    同一事件循环中的写请求先在asyncio锁上排队，拿到后才占用线程等待跨进程的文件锁
+    """
+    def locked_call():
+        with data_write_lock():
+            return func(*args, **kwargs)
+    async with _async_write_lock():
+        return await sync_to_async(locked_call)()
+
+def save_task(project, task):
+    """持久化单个任务的新增或修改，journal模式下只追加一条日志记录"""
+    dashboard_cache.invalidate()
+    if USE_DATABASE_STORE:
+        return task_store.save_task(project, task)
+    if data_journal is None:
+        return save_data(task_store.data)
+    return data_journal.append({
+        'op': 'put_task',
+        'project_id': project['id'],
+        'task': task,
+        'next_task_id': task_store.data['next_task_id']
+    })
+
+def save_task_deletion(project, task_id):
+    """持久化任务删除，journal模式下只追加一条日志记录"""
+    dashboard_cache.invalidate()
+    if USE_DATABASE_STORE:
+        # 数据库后端在delete_task中已经完成删除
+        return True
+    if data_journal is None:
+        return save_data(task_store.data)
+    return data_journal.append({
+        'op': 'delete_task',
+        'project_id': project['id'],
+        'task_id': int(task_id)
+    })
+
+def find_step_image(payload):
+    """查找后台任务对应的步骤图片，返回(项目, 任务, 图片条目)，图片已被删除时返回None
+
+    按上传时创建的图片记录ID匹配；文件名按任务、步骤和原文件名生成，删除后重新上传同名文件会得到相同的文件名，
+    不能用来区分新旧图片。之前版本登记的任务没有image_id，只匹配同样还没有ID的条目
+    """
+    task_id = payload['task_id']
+    project = task_store.get_task_project(task_id)
+    if project is None:
+        return None
+    task = task_store.get_task(project['id'], task_id)
+    image_id = payload.get('image_id')
+    for image in task.get('step_images', []):
+        if image_id is not None:
+            if image.get('id') == image_id:
+                return project, task, image
+        elif 'id' not in image and image.get('file_name', image.get('filename')) == payload['file_name']:
+            return project, task, image
+    return None
+
+def apply_step_image_updates(payload, updates):
+    """把后台任务的处理结果合并进对应的step_images条目并保存，图片已被删除时返回False"""
+    with data_write_lock():
+        found = find_step_image(payload)
+        if found is None:
+            return False
+        project, task, image = found
+        image.update(updates)
+        return save_task(project, task)
+
+@image_job_queue.register('step_image')
+def run_step_image_job(payload):
+    """后台处理步骤图片：生成缩略图，再写回任务数据"""
+    if find_step_image(payload) is None:
+        # 图片在处理之前就被删除了，上传时创建的图片记录一并删除
+        discard_step_image(payload, {'id': payload.get('image_id')})
+        return {'discarded': True}
+    try:
+        updates = process_step_image(payload)
+    except FileNotFoundError:
+        # 处理期间图片被删除，原图已不存在
+        if find_step_image(payload) is None:
+            return {'discarded': True}
+        raise
+    if not apply_step_image_updates(payload, updates):
+        discard_step_image(payload, updates)
+        return {'discarded': True}
+    return updates
+
+def recover_image_jobs(**kwargs):
+    """进程收到第一个请求时重新提交上次退出时未完成的图片任务（避免在导入模块时访问数据库）"""
+    request_started.disconnect(dispatch_uid='portfolio_recover_image_jobs')
+    try:
+        count = image_job_queue.recover()
+        if count:
+            logger.info('重新提交了 %d 个未完成的图片任务', count)
+    except Exception as e:
+        logger.warning('恢复图片任务失败: %s', e)
+
+request_started.connect(recover_image_jobs, dispatch_uid='portfolio_recover_image_jobs')
+
+def get_project_workshop_stats(project):
+    """项目的workshop统计（带缓存）"""
+    return dashboard_cache.get_or_compute(
+        ('workshop_stats', project['id']),
+        lambda: task_store.workshop_stats(project, WORKSHOP_NUMBERS.keys())
+    )
+
+@synced_data
+@cached_read_view
 def home(request):
     """首页视图 - 模块化显示项目"""
-    projects = global_data['projects']
+    projects = task_store.projects
+    # 全部任务的分类、完成统计在两次修改之间只计算一次，模板过滤器直接使用
+    prime_stats('projects', projects, dashboard_cache.get_or_compute(
+        ('global_stats',), lambda: TaskStats(iter_project_tasks(projects))
+    ))
     return render(request, 'portfolio/home.html', {
         'projects': projects,
         'task_categories': TASK_CATEGORIES
     })
 
+@synced_data
+@cached_read_view
 def project_list(request):
     """项目列表视图"""
-    projects = global_data['projects']
+    projects = task_store.projects
     return render(request, 'portfolio/project_list.html', {
         'projects': projects,
         'task_categories': TASK_CATEGORIES
     })
 
+@synced_data
+@cached_read_view
 def task_list(request, project_id=None):
     """任务列表视图，支持项目筛选和分类筛选"""
-    projects = global_data['projects']
+    projects = task_store.projects
     selected_project_id = project_id
-    filtered_tasks = []
     
     # 如果指定了项目，只显示该项目的任务
     if project_id:
-        selected_project = next((p for p in projects if p['id'] == int(project_id)), None)
+        selected_project = task_store.get_project(project_id)
         if not selected_project:
             raise Http404("项目不存在")
-        filtered_tasks = selected_project['tasks']
-    else:
-        # 显示所有项目的任务
-        for project in projects:
-            filtered_tasks.extend(project['tasks'])
     
     # 获取筛选参数
     category = request.GET.get('category')
     workshop = request.GET.get('workshop')
     
-    # 应用筛选
-    if category and category != 'all':
-        filtered_tasks = [t for t in filtered_tasks if t['category'] == category]
-    if workshop and workshop != 'all':
-        filtered_tasks = [t for t in filtered_tasks if t['workshop'] == int(workshop)]
-    
-    # 按项目分组任务
-    projects_with_tasks = []
-    task_project_map = {}
-    
-    # 构建任务到项目的映射
-    for project in projects:
-        task_project_map.update({task['id']: project for task in project['tasks']})
+    # 通过索引应用筛选
+    filtered_tasks = task_store.filter_tasks(
+        project_id=project_id or None,
+        category=category if category and category != 'all' else None,
+        workshop=int(workshop) if workshop and workshop != 'all' else None
+    )
     
     # 按项目分组显示任务
-    project_tasks = {}
-    for task in filtered_tasks:
-        project = task_project_map.get(task['id'])
-        if project:
-            if project['id'] not in project_tasks:
-                project_tasks[project['id']] = {
-                    'id': project['id'],
-                    'name': project['name'],
-                    'tasks': []
-                }
-            project_tasks[project['id']]['tasks'].append(task)
-    
-    projects_with_tasks = list(project_tasks.values())
-    
-    return render(request, 'portfolio/task_list.html', {
+    projects_with_tasks = task_store.group_by_project(filtered_tasks)
+    
+    context = {
         'all_projects': projects,
         'selected_project': selected_project_id,
         'selected_category': category,
@@ -155,67 +379,153 @@ def task_list(request, project_id=None):
         'workshop_numbers': WORKSHOP_NUMBERS,
         'selected_category': category,
         'selected_workshop': workshop
+    }
+    
+    # 任务很多时先发送页面框架，再按项目分组逐块渲染发送
+    if should_stream(len(filtered_tasks)):
+        return render_streaming(
+            request, 'portfolio/task_list.html', context, 'streamed_groups',
+            'portfolio/task_list_group.html', ({'project': project} for project in projects_with_tasks)
+        )
+    return render(request, 'portfolio/task_list.html', context)
+
+@synced_data
+def task_list_api(request, project_id=None):
+    """任务列表的JSON接口，筛选参数与task_list相同，使用limit和cursor参数分页"""
+    if project_id and not task_store.has_project(project_id):
+        return JsonResponse({'status': 'error', 'message': '项目不存在'}, status=404)
+    
+    category = request.GET.get('category')
+    workshop = request.GET.get('workshop')
+    try:
+        limit = parse_page_size(request.GET.get('limit'))
+        after = decode_cursor(request.GET.get('cursor'))
+        rows = task_store.page_tasks(
+            project_id=project_id or None,
+            category=category if category and category != 'all' else None,
+            workshop=int(workshop) if workshop and workshop != 'all' else None,
+            after=after,
+            limit=limit
+        )
+    except (TypeError, ValueError) as e:
+        return JsonResponse({'status': 'error', 'message': f'无效的分页或筛选参数: {e}'}, status=400)
+    
+    tasks, next_cursor = paginate(rows, limit, task_store.task_sort_key)
+    
+    def summary(task):
+        task_project_id = task.get('project_id') or task_store.get_task_project(task['id'])['id']
+        return {
+            'id': task['id'],
+            'project_id': task_project_id,
+            'title': task['title'],
+            'category': task['category'],
+            'workshop': task['workshop'],
+            'progress': task.get('progress', 0),
+            'url': reverse('task_detail', args=[task_project_id, task['id']]),
+        }
+    
+    return JsonResponse({
+        'status': 'success',
+        'tasks': [summary(task) for task in tasks],
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None,
     })
 
+@synced_data
 def task_detail(request, project_id, task_id):
     """任务详情视图"""
-    project = next((p for p in global_data['projects'] if p['id'] == int(project_id)), None)
+    project = task_store.get_project(project_id)
     if not project:
         raise Http404("项目不存在")
     
-    task = next((t for t in project['tasks'] if t['id'] == int(task_id)), None)
+    task = task_store.get_task(project_id, task_id)
     if not task:
         raise Http404("任务不存在")
     
+    # 页面使用任务的浅拷贝，展示用的字段不写回全局数据
+    task = dict(task)
+    
     # 获取workshop中文表示
     task['workshop_text'] = f"第{WORKSHOP_NUMBERS.get(task['workshop'], 'N/A')}次workshop"
     
-    # 确保step_images字段存在，即使为空也设置为数组
-    if 'step_images' not in task:
-        task['step_images'] = []
-    
-    # 从数据库获取该任务的所有图片并添加到task中
+    # 从图片元数据存储读取该任务的所有图片（一条索引查询）
     try:
-        db_images = TaskImage.objects.filter(task_id=task_id).order_by('-uploaded_at')
-        
-        # 将QuerySet转换为可JSON序列化的字典列表
-        task['db_images'] = [{
-            'id': img.id,
-            'task_id': img.task_id,
-            'image_url': img.image.url,
-            'description': img.description or '',
-            'uploaded_at': img.uploaded_at.strftime('%Y-%m-%d %H:%M:%S')
-        } for img in db_images]
-        
-        # 如果JSON文件中没有step_images数据，尝试从数据库添加
-        if not task['step_images'] and db_images:
-            for img in db_images:
-                task['step_images'].append({
-                    'step': 1,  # 默认步骤为1
-                    'url': img.image.url,
-                    'image_url': img.image.url,
-                    'description': img.description or '',
-                    'file_name': os.path.basename(img.image.name)
-                })
-        
-        print(f"任务 {task_id} 图片数据: JSON中{len(task['step_images'])}张，数据库中{len(db_images)}张")
+        task['db_images'] = image_metadata.images_for_task(task_id)
     except Exception as e:
-        print(f"获取图片数据时出错: {e}")
+        logger.warning('获取任务 %s 的图片数据时出错: %s', task_id, e)
         task['db_images'] = []
     
-    # 相关任务逻辑 - 获取同一项目中除了当前任务外的其他任务
-    related_tasks = [t for t in project['tasks'] if t['id'] != int(task_id)]
+    # 确保step_images字段存在；JSON中没有步骤图片时用数据库中的图片展示
+    task['step_images'] = image_metadata.step_images_for_task(task, task['db_images'])
+    logger.debug('任务 %s 图片数据: 步骤图片%d张，数据库中%d张', task_id, len(task['step_images']), len(task['db_images']))
     
+    # 步骤正文和相关任务在滚动到可视区域时通过片段接口加载，页面本身只包含步骤标题
     return render(request, 'portfolio/task_detail.html', {
         'project': project,
         'task': task,
         'task_categories': TASK_CATEGORIES,
-        'related_tasks': related_tasks
+        'step_batch_size': STEP_FRAGMENT_BATCH_SIZE,
+    })
+
+# 相关任务最多显示的数量
+RELATED_TASKS_LIMIT = getattr(settings, 'PORTFOLIO_RELATED_TASKS_LIMIT', 6)
+# 步骤片段接口每次最多返回的步骤数
+STEP_FRAGMENT_BATCH_SIZE = getattr(settings, 'PORTFOLIO_STEP_FRAGMENT_BATCH_SIZE', 5)
+
+def rank_related_tasks(tasks, task, limit=RELATED_TASKS_LIMIT):
+    """同一项目中与task最相关的limit个任务：同分类优先，其次workshop越接近越靠前，最后按任务ID"""
+    def rank(other):
+        return (
+            other.get('category') != task.get('category'),
+            abs((other.get('workshop') or 0) - (task.get('workshop') or 0)),
+            other['id'],
+        )
+    return heapq.nsmallest(limit, (t for t in tasks if t['id'] != task['id']), key=rank)
+
+@synced_data
+@cached_read_view
+def task_steps_fragment(request, project_id, task_id):
+    """任务步骤正文的JSON片段，start为起始步骤序号（从1开始），count为步骤数"""
+    task = task_store.get_task(project_id, task_id)
+    if not task:
+        return JsonResponse({'status': 'error', 'message': '任务不存在'}, status=404)
+    
+    try:
+        start = max(int(request.GET.get('start', 1)), 1)
+        count = min(max(int(request.GET.get('count', STEP_FRAGMENT_BATCH_SIZE)), 1), STEP_FRAGMENT_BATCH_SIZE * 4)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'start和count必须是整数'}, status=400)
+    
+    process = task.get('process') or []
+    images = step_images_by_name(task)
+    steps = [
+        {
+            'step': number,
+            'title': step.get('title', ''),
+            'html': markup_renderer.render(step['content'], images) if isinstance(step.get('content'), str) else '',
+        }
+        for number, step in enumerate(process[start - 1:start - 1 + count], start)
+    ]
+    return JsonResponse({'status': 'success', 'total': len(process), 'steps': steps})
+
+@synced_data
+@cached_read_view
+def task_related_fragment(request, project_id, task_id):
+    """相关任务列表的HTML片段"""
+    project = task_store.get_project(project_id)
+    task = task_store.get_task(project_id, task_id) if project else None
+    if not task:
+        raise Http404("任务不存在")
+    
+    return render(request, 'portfolio/task_related.html', {
+        'project': project,
+        'related_tasks': rank_related_tasks(project['tasks'], task),
     })
 
+@synced_data
 def add_task(request, project_id):
     """新增任务视图"""
-    projects = global_data['projects']
+    projects = task_store.projects
     
     # 处理POST请求
     if request.method == 'POST':
@@ -225,7 +535,7 @@ def add_task(request, project_id):
             project_id = form_project_id
         
         # 查找对应的项目
-        project = next((p for p in projects if p['id'] == int(project_id)), None)
+        project = task_store.get_project(project_id)
         if not project:
             return render(request, 'portfolio/add_task.html', {
                 'project': None,
@@ -251,7 +561,7 @@ def add_task(request, project_id):
                     process_steps.append({'title': title})
             
             new_task = {
-                'id': global_data['next_task_id'],
+                'id': None,
                 'title': request.POST.get('title', '').strip(),
                   'category': request.POST.get('category'),
                   'workshop': int(request.POST.get('workshop')),
@@ -266,12 +576,12 @@ def add_task(request, project_id):
             if not new_task['title'] or not new_task['category']:
                 raise ValidationError("请填写必要字段")
             
-            # 添加到项目
-            project['tasks'].append(new_task)
-            global_data['next_task_id'] += 1
+            # 验证通过后再分配任务ID，并添加到项目
+            new_task['id'] = task_store.allocate_task_id()
+            task_store.add_task(project, new_task)
             
             # 保存数据
-            if save_data(global_data):
+            if save_task(project, new_task):
                 # 重定向到新创建的任务详情页
                 return redirect('task_detail', project_id=project_id, task_id=new_task['id'])
             else:
@@ -294,7 +604,7 @@ def add_task(request, project_id):
             })
     else:
         # GET请求 - 使用URL参数中的project_id
-        project = next((p for p in projects if p['id'] == int(project_id)), None)
+        project = task_store.get_project(project_id)
         if not project:
             raise Http404("项目不存在")
     
@@ -307,32 +617,26 @@ def add_task(request, project_id):
         'workshop_range': range(1, 6)
     })
 
+@synced_data
+@cached_read_view
 def project_detail(request, project_id):
     """项目详情视图"""
-    project = next((p for p in global_data['projects'] if p['id'] == int(project_id)), None)
+    project = task_store.get_project(project_id)
     if not project:
         raise Http404("项目不存在")
     
+    # 项目任务的分类、完成统计（带缓存），模板过滤器直接使用
+    project_stats = dashboard_cache.get_or_compute(('project_stats', project['id']), lambda: TaskStats(project['tasks']))
+    prime_stats('tasks', project['tasks'], project_stats)
+    
     # 按分类分组任务
-    tasks_by_category = {}
-    for category in TASK_CATEGORIES.keys():
-        tasks_by_category[category] = [t for t in project['tasks'] if t['category'] == category]
-    
-    # 计算workshop统计数据
-    workshop_stats = {}
-    for i in range(1, 6):
-        workshop_tasks = [task for task in project['tasks'] if task.get('workshop') == i]
-        completed_tasks = [task for task in workshop_tasks if task.get('progress') == 100]
-        total = len(workshop_tasks)
-        completed = len(completed_tasks)
-        completion_rate = round((completed / total) * 100) if total > 0 else 0
-        
-        workshop_stats[i] = {
-            'total_tasks': total,
-            'completed_tasks': completed,
-            'completion_rate': completion_rate,
-            'tasks': workshop_tasks
-        }
+    tasks_by_category = {
+        category: project_stats.tasks_by_category.get(category, [])
+        for category in TASK_CATEGORIES.keys()
+    }
+    
+    # 计算workshop统计数据（数据库后端由GROUP BY查询完成）
+    workshop_stats = get_project_workshop_stats(project)
     
     return render(request, 'portfolio/project_detail.html', {
         'project': project,
@@ -355,18 +659,20 @@ from django.http import HttpResponse
 import os
 from django.conf import settings
 
+@streaming_image_upload
+@synced_data
 def edit_task(request, project_id, task_id):
     """编辑任务功能"""
     global global_data
     
     
     # 查找项目
-    project = next((p for p in global_data['projects'] if p['id'] == int(project_id)), None)
+    project = task_store.get_project(project_id)
     if not project:
         return HttpResponse('项目不存在', status=404)
     
     # 查找任务
-    task = next((t for t in project['tasks'] if t['id'] == int(task_id)), None)
+    task = task_store.get_task(project_id, task_id)
     if not task:
         return HttpResponse('任务不存在', status=404)
     
@@ -416,6 +722,8 @@ def edit_task(request, project_id, task_id):
             task['progress'] = progress
             task['description'] = description
             task['pain_points'] = pain_points  # 保存挑战点字段
+            # 分类或workshop可能变化，同步更新索引
+            task_store.update_task(task)
             
             # 处理process字段，将字符串转换为对象数组格式
             if process.strip():
@@ -439,7 +747,7 @@ def edit_task(request, project_id, task_id):
                 task['process'] = []
             
             # 保存数据到文件
-            if save_data(global_data):
+            if save_task(project, task):
                 # 重定向到任务详情页
                 return redirect('task_detail', project_id=project_id, task_id=task_id)
             else:
@@ -468,6 +776,7 @@ def edit_task(request, project_id, task_id):
     })
 
 
+@synced_data
 def delete_task(request, project_id, task_id):
     """删除任务功能"""
     global global_data
@@ -475,20 +784,16 @@ def delete_task(request, project_id, task_id):
     if request.method == 'POST':
         try:
             # 查找项目
-            project = next((p for p in global_data['projects'] if p['id'] == int(project_id)), None)
+            project = task_store.get_project(project_id)
             if not project:
                 return HttpResponse('项目不存在', status=404)
             
-            # 检查任务是否存在
-            task_exists = any(t['id'] == int(task_id) for t in project['tasks'])
-            if not task_exists:
+            # 删除任务（同时更新索引），任务不存在时返回404
+            if not task_store.delete_task(project, task_id):
                 return HttpResponse('任务不存在', status=404)
             
-            # 删除任务
-            project['tasks'] = [t for t in project['tasks'] if t['id'] != int(task_id)]
-            
             # 保存数据到文件
-            if save_data(global_data):
+            if save_task_deletion(project, task_id):
                 # 重定向到项目详情页
                 return redirect('project_detail', project_id=project_id)
             else:
@@ -499,42 +804,42 @@ def delete_task(request, project_id, task_id):
     # GET请求不允许删除
     return HttpResponse('Method not allowed', status=405)
 
+@synced_data
 def test_workshop_stats(request):
     """测试workshop统计功能的视图"""
     # 获取第一个项目进行测试
-    if global_data['projects']:
-        project = global_data['projects'][0]
+    projects = task_store.projects
+    if projects:
+        project = projects[0]
         
         # 计算workshop统计数据
         workshop_stats = {}
-        for i in range(1, 6):
-            workshop_tasks = [task for task in project['tasks'] if task.get('workshop') == i]
-            completed_tasks = [task for task in workshop_tasks if task.get('progress') == 100]
-            total = len(workshop_tasks)
-            completed = len(completed_tasks)
-            completion_rate = round((completed / total) * 100) if total > 0 else 0
-            
+        for i, stats in get_project_workshop_stats(project).items():
             workshop_stats[i] = {
-                'total_tasks': total,
-                'completed_tasks': completed,
-                'completion_rate': completion_rate,
-                'tasks_count': len(workshop_tasks)
+                'total_tasks': stats['total_tasks'],
+                'completed_tasks': stats['completed_tasks'],
+                'completion_rate': stats['completion_rate'],
+                'tasks_count': len(stats['tasks'])
             }
         
         return JsonResponse({'project': project.get('title', 'Unknown Project'), 'workshop_stats': workshop_stats})
     
     return JsonResponse({'error': 'No projects found'})
 
-def upload_task_image(request, project_id, task_id):
-    """上传任务图片的视图函数"""
+@streaming_image_upload
+async def upload_task_image(request, project_id, task_id):
+    """上传任务图片的视图函数（异步，写文件在线程中进行，数据库使用异步接口）"""
     if request.method == 'POST':
         try:
             # 验证任务ID是否有效（这里可以添加更严格的验证）
             if not isinstance(task_id, int) or task_id <= 0:
                 return JsonResponse({'status': 'error', 'message': '无效的任务ID'}, status=400)
             
-            # 检查是否有文件上传
+            # 检查是否有文件上传（超过大小限制或不是图片的文件已在上传处理器中被跳过）
             if 'image' not in request.FILES:
+                upload_errors = getattr(request, 'upload_errors', [])
+                if upload_errors:
+                    return JsonResponse({'status': 'error', 'message': upload_errors[0], 'errors': upload_errors}, status=400)
                 return JsonResponse({'status': 'error', 'message': '没有上传文件'}, status=400)
             
             # 获取上传的文件
@@ -546,24 +851,31 @@ def upload_task_image(request, project_id, task_id):
             if file_extension not in valid_extensions:
                 return JsonResponse({'status': 'error', 'message': '不支持的文件类型'}, status=400)
             
+            # 按内容哈希保存文件，相同内容的图片只保存一份
+            blob = await sync_to_async(image_blobs.store_upload)(image_file, file_extension)
+            
             # 创建TaskImage实例
-            task_image = TaskImage(
+            task_image = await TaskImage.objects.acreate(
                 task_id=task_id,
-                image=image_file,
-                description=request.POST.get('description', '')
+                image=f'blobs/{blob.path}',
+                description=request.POST.get('description', ''),
+                content_hash=blob.sha256
             )
-            task_image.save()
             
             # 返回成功响应，包含图片URL和文件名
             # 获取文件名（从存储路径中提取）
             file_name = os.path.basename(task_image.image.name)
             
+            # 缩略图在后台生成，处理进度通过get_task_images查询
+            job = await image_job_queue.aenqueue('task_image', task_id, {'image_id': task_image.id, 'file_name': file_name})
+            
             return JsonResponse({
                 'status': 'success',
                 'message': '图片上传成功',
                 'image_url': task_image.image.url,
                 'image_id': task_image.id,
-                'file_name': file_name
+                'file_name': file_name,
+                'job_id': job.id
             })
             
         except IntegrityError as e:
@@ -573,159 +885,185 @@ def upload_task_image(request, project_id, task_id):
     
     return JsonResponse({'status': 'error', 'message': '不支持的请求方法'}, status=405)
 
-def update_task_process(request, project_id, task_id):
-    """更新任务的实现过程，只更新步骤的title字段"""
-    global global_data
-    
+async def update_task_process(request, project_id, task_id):
+    """更新任务的实现过程，只更新步骤的title字段（异步视图，修改和保存数据在线程中持有写锁执行）"""
     if request.method == 'POST':
-        try:
-            print(f"开始处理项目 {project_id} 任务 {task_id} 的步骤标题更新请求")
-            
-            # 查找项目和任务
-            project = next((p for p in global_data['projects'] if p['id'] == int(project_id)), None)
-            if not project:
-                return JsonResponse({'status': 'error', 'message': '项目不存在'}, status=404)
-            
-            task = next((t for t in project['tasks'] if t['id'] == int(task_id)), None)
-            if not task:
-                return JsonResponse({'status': 'error', 'message': '任务不存在'}, status=404)
-            
-            # 获取过程内容 - 支持新的对象数组格式
-            process_content = request.POST.get('process', '')
-            
-            # 将textarea内容按行分割，并更新content字段
-            if process_content.strip():
-                # 分割行但保留空行，确保空内容也能被保存
-                lines = [line.strip() for line in process_content.strip().split('\n')]
-                print(f"process分割后得到 {len(lines)} 行")
-                print(f"分割后的前几行: {lines[:3]}")
-                
-                # 准备新的步骤数组，保留原有content值，更新title
-                updated_process = []
-                # 获取原有的步骤，用于保留content
-                original_steps = {i: step for i, step in enumerate(task.get('process', []))}
-                print(f"原有步骤数量: {len(original_steps)}")
-                
-                # 创建更新后的步骤对象
-                for i, title in enumerate(lines):
-                    # 如果有对应位置的原步骤，保留其content值，否则content设为空
-                    content = original_steps.get(i, {}).get('content', '')
-                    updated_process.append({'title': title, 'content': content})
-                    
-                task['process'] = updated_process
-                print(f"成功更新process对象数组的title字段，包含{len(task['process'])}个步骤")
-            else:
-                # 空内容处理为空数组
-                task['process'] = []
-                print("process为空，设置为空数组")
-            
-            # 保存数据到文件
-            if save_data(global_data):
-                print("数据成功保存到 JSON 文件")
-                return JsonResponse({
-                    'status': 'success', 
-                    'message': '实现过程标题更新成功',
-                    'steps_count': len(task['process'])
-                })
-            else:
-                print("警告: 保存数据到 JSON 文件失败")
-                return JsonResponse({
-                    'status': 'error', 
-                    'message': '保存数据失败，请重试'
-                })
-        except Exception as e:
-            print(f"处理请求时发生错误: {e}")
-            return JsonResponse({'status': 'error', 'message': f'处理请求时出错: {str(e)}'}, status=500)
+        return await run_with_write_lock(_update_task_process, request, project_id, task_id)
     
     return JsonResponse({'status': 'error', 'message': 'Method not allowed'}, status=405)
 
-def update_task_process_content(request, project_id, task_id):
-    """更新任务的实现过程内容，包括步骤的content字段和图片处理（上传与删除）"""
+def _update_task_process(request, project_id, task_id):
+    """update_task_process中修改数据的部分，调用时已持有写锁"""
     global global_data
     
-    if request.method == 'POST':
-        try:
-            print(f"开始处理项目 {project_id} 任务 {task_id} 的步骤内容和图片更新请求")
-            
-            # 查找项目和任务
-            project = next((p for p in global_data['projects'] if p['id'] == int(project_id)), None)
-            if not project:
-                return JsonResponse({'status': 'error', 'message': '项目不存在'}, status=404)
-            
-            task = next((t for t in project['tasks'] if t['id'] == int(task_id)), None)
-            if not task:
-                return JsonResponse({'status': 'error', 'message': '任务不存在'}, status=404)
+    try:
+        logger.debug('开始处理步骤标题更新请求', extra={'project_id': project_id, 'task_id': task_id})
+        
+        # 查找项目和任务
+        project = task_store.get_project(project_id)
+        if not project:
+            return JsonResponse({'status': 'error', 'message': '项目不存在'}, status=404)
+        
+        task = task_store.get_task(project_id, task_id)
+        if not task:
+            return JsonResponse({'status': 'error', 'message': '任务不存在'}, status=404)
+        
+        # 获取过程内容 - 支持新的对象数组格式
+        process_content = request.POST.get('process', '')
+        
+        # 将textarea内容按行分割，并更新content字段
+        if process_content.strip():
+            # 分割行但保留空行，确保空内容也能被保存
+            lines = [line.strip() for line in process_content.strip().split('\n')]
+            logger.debug('process分割后得到 %d 行', len(lines))
             
-            # 获取过程内容
-            process_content = request.POST.get('process_content', '')
+            # 准备新的步骤数组，保留原有content值，更新title
+            updated_process = []
+            # 获取原有的步骤，用于保留content
+            original_steps = {i: step for i, step in enumerate(task.get('process', []))}
+            logger.debug('原有步骤数量: %d', len(original_steps))
             
-            # 将textarea内容按行分割，并更新content字段
-            if process_content.strip():
-                # 分割行但保留空行
-                lines = [line.strip() for line in process_content.split('\n')]
-                print(f"process_content分割后得到 {len(lines)} 行")
-                print(f"分割后的前几行: {lines[:3]}")
+            # 创建更新后的步骤对象
+            for i, title in enumerate(lines):
+                # 如果有对应位置的原步骤，保留其content值，否则content设为空
+                content = original_steps.get(i, {}).get('content', '')
+                updated_process.append({'title': title, 'content': content})
                 
-                # 准备新的步骤数组，保留原有title值，更新content
-                updated_process = []
-                # 获取原有的步骤，用于保留title
-                original_steps = {i: step for i, step in enumerate(task.get('process', []))}
-                print(f"原有步骤数量: {len(original_steps)}")
-                
-                # 创建更新后的步骤对象
-                for i, content in enumerate(lines):
-                    # 如果有对应位置的原步骤，保留其title值，否则title设为默认值
-                    title = original_steps.get(i, {}).get('title', f'步骤 {i+1}')
-                    updated_process.append({'title': title, 'content': content})
-                    
-                # 对于原有步骤中超出新内容行数的部分，也添加到更新后的数组中
-                for i in range(len(lines), len(original_steps)):
-                    if i in original_steps:
-                        updated_process.append(original_steps[i])
-                        
-                task['process'] = updated_process
-                print(f"成功更新process对象数组的content字段，包含{len(task['process'])}个步骤")
-            else:
-                # 保留原有步骤结构，只清空content
-                if 'process' in task and task['process']:
-                    # 遍历现有步骤，保留title，清空content
-                    for step in task['process']:
-                        step['content'] = ''
-                    print(f"保留了{len(task['process'])}个步骤，清空了所有content")
-                else:
-                    # 如果原本就没有步骤，保持为空数组
-                    task['process'] = []
-                    print("process_content为空，且原本没有步骤，保持为空数组")
+            task['process'] = updated_process
+            logger.debug('更新了process的title字段，包含%d个步骤', len(task['process']))
+        else:
+            # 空内容处理为空数组
+            task['process'] = []
+            logger.debug('process为空，设置为空数组')
+        
+        # 保存数据到文件
+        if save_task(project, task):
+            logger.debug('数据已保存', extra={'project_id': project_id, 'task_id': task_id})
+            return JsonResponse({
+                'status': 'success', 
+                'message': '实现过程标题更新成功',
+                'steps_count': len(task['process'])
+            })
+        else:
+            logger.warning('保存数据失败', extra={'project_id': project_id, 'task_id': task_id})
+            return JsonResponse({
+                'status': 'error', 
+                'message': '保存数据失败，请重试'
+            })
+    except Exception as e:
+        logger.exception('处理请求时发生错误: %s', e, extra={'project_id': project_id, 'task_id': task_id})
+        return JsonResponse({'status': 'error', 'message': f'处理请求时出错: {str(e)}'}, status=500)
+
+@streaming_image_upload
+async def update_task_process_content(request, project_id, task_id):
+    """更新任务的实现过程内容，包括步骤的content字段和图片处理（上传与删除）
+
+    异步视图：上传文件在线程中解析，修改和保存数据在线程中持有写锁执行，后台图片任务在锁外登记
+    """
+    if request.method == 'POST':
+        try:
+            result = await run_with_write_lock(_update_task_process_content, request, project_id, task_id)
+            if isinstance(result, JsonResponse):
+                return result
+            task, uploaded_count, queued_images, saved = result
             
-            # 使用集中式的图片处理函数
-            image_update_result = update_task_images(task, request, DATA_FILE)
-            uploaded_count = image_update_result['uploaded_count']
+            # 任务数据保存后再提交后台任务，缩略图等处理进度通过get_task_images查询
+            jobs = await image_job_queue.aenqueue_many('step_image', task['id'], queued_images)
+            job_ids = [job.id for job in jobs]
             
-            # 保存数据到文件
-            if save_data(global_data):
-                print("数据成功保存到 JSON 文件")
+            if saved:
+                logger.debug('数据已保存', extra={'project_id': project_id, 'task_id': task_id})
                 return JsonResponse({
                     'status': 'success', 
                     'message': f'实现过程内容和图片更新成功，成功上传 {uploaded_count} 张图片',
                     'steps_count': len(task['process']),
-                    'remaining_images': len(task['step_images'])
+                    'remaining_images': len(task['step_images']),
+                    'image_jobs': job_ids,
+                    'upload_errors': getattr(request, 'upload_errors', [])
                 })
             else:
                 # 即使JSON保存失败，也返回成功状态，因为实际的数据修改（图片上传/删除）已经成功
-                print("警告: 保存数据到 JSON 文件失败，但图片操作已完成")
+                logger.warning('保存数据失败，但图片操作已完成', extra={'project_id': project_id, 'task_id': task_id})
                 return JsonResponse({
                     'status': 'success', 
                     'message': '实现过程内容和图片更新成功',
                     'steps_count': len(task['process']),
-                    'remaining_images': len(task['step_images'])
+                    'remaining_images': len(task['step_images']),
+                    'image_jobs': job_ids,
+                    'upload_errors': getattr(request, 'upload_errors', [])
                 })
         except Exception as e:
-            print(f"处理请求时发生错误: {e}")
+            logger.exception('处理请求时发生错误: %s', e, extra={'project_id': project_id, 'task_id': task_id})
             return JsonResponse({'status': 'error', 'message': f'处理请求时出错: {str(e)}'}, status=500)
     
     return JsonResponse({'status': 'error', 'message': 'Method not allowed'}, status=405)
 
+def _update_task_process_content(request, project_id, task_id):
+    """update_task_process_content中修改数据的部分，调用时已持有写锁
+
+    出错时返回JsonResponse，否则返回(task, 上传数量, 待登记的图片任务, 是否保存成功)
+    """
+    global global_data
+    
+    logger.debug('开始处理步骤内容和图片更新请求', extra={'project_id': project_id, 'task_id': task_id})
+    
+    # 查找项目和任务
+    project = task_store.get_project(project_id)
+    if not project:
+        return JsonResponse({'status': 'error', 'message': '项目不存在'}, status=404)
+    
+    task = task_store.get_task(project_id, task_id)
+    if not task:
+        return JsonResponse({'status': 'error', 'message': '任务不存在'}, status=404)
+    
+    # 获取过程内容
+    process_content = request.POST.get('process_content', '')
+    
+    # 将textarea内容按行分割，并更新content字段
+    if process_content.strip():
+        # 分割行但保留空行
+        lines = [line.strip() for line in process_content.split('\n')]
+        logger.debug('process_content分割后得到 %d 行', len(lines))
+    
+        # 准备新的步骤数组，保留原有title值，更新content
+        updated_process = []
+        # 获取原有的步骤，用于保留title
+        original_steps = {i: step for i, step in enumerate(task.get('process', []))}
+        logger.debug('原有步骤数量: %d', len(original_steps))
+    
+        # 创建更新后的步骤对象
+        for i, content in enumerate(lines):
+            # 如果有对应位置的原步骤，保留其title值，否则title设为默认值
+            title = original_steps.get(i, {}).get('title', f'步骤 {i+1}')
+            updated_process.append({'title': title, 'content': content})
+    
+        # 对于原有步骤中超出新内容行数的部分，也添加到更新后的数组中
+        for i in range(len(lines), len(original_steps)):
+            if i in original_steps:
+                updated_process.append(original_steps[i])
+    
+        task['process'] = updated_process
+        logger.debug('更新了process的content字段，包含%d个步骤', len(task['process']))
+    else:
+        # 保留原有步骤结构，只清空content
+        if 'process' in task and task['process']:
+            # 遍历现有步骤，保留title，清空content
+            for step in task['process']:
+                step['content'] = ''
+            logger.debug('保留了%d个步骤，清空了所有content', len(task['process']))
+        else:
+            # 如果原本就没有步骤，保持为空数组
+            task['process'] = []
+            logger.debug('process_content为空，且原本没有步骤，保持为空数组')
+    
+    # 使用集中式的图片处理函数
+    image_update_result = update_task_images(task, request, DATA_FILE)
+    
+    # 保存数据到文件
+    saved = save_task(project, task)
+    return task, image_update_result['uploaded_count'], image_update_result['queued_images'], saved
+
 # 使用image_handlers.py中的视图函数
-def get_task_images(request, project_id, task_id):
+async def get_task_images(request, project_id, task_id):
     """获取任务相关的所有图片（代理到image_handlers中的函数）"""
-    return get_task_images_view(request, project_id, task_id)
+    return await get_task_images_view(request, project_id, task_id)
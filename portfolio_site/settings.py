@@ -49,7 +49,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # 请求耗时统计放在最前面，包含其他中间件的耗时
+    'portfolio.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # 压缩需要在其他中间件修改完响应之后进行，放在靠前的位置
+    'portfolio.compression.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -124,12 +128,147 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = 'static/'
+# collectstatic的输出目录：CSS/JS压缩后按内容哈希命名，并生成manifest和.gz/.br预压缩文件
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    # DEBUG模式下模板仍使用源文件名；关闭DEBUG前需要先执行 python manage.py collectstatic
+    'staticfiles': {
+        'BACKEND': 'portfolio.static_assets.PortfolioStaticStorage',
+    },
+}
+# 由Django直接提供STATIC_ROOT中的文件：按Accept-Encoding返回预压缩版本，带哈希的文件名使用一年的强缓存；
+# 有Nginx等前置服务器时应由其提供静态文件并关闭此项
+PORTFOLIO_SERVE_STATIC_ASSETS = False
 
 # 媒体文件配置
 # 媒体文件存储路径
 MEDIA_ROOT = BASE_DIR / 'media'
 # 媒体文件URL前缀
 MEDIA_URL = '/media/'
+# 由Django提供媒体文件（支持Range、ETag/Last-Modified条件请求）；默认只在DEBUG模式下开启，
+# 生产环境由前置服务器提供媒体文件，需要由Django提供时显式设为True（可配合PORTFOLIO_MEDIA_OFFLOAD）
+PORTFOLIO_SERVE_MEDIA = DEBUG
+# 交给前置服务器发送文件：None为Django直接发送，'x-sendfile'用于Apache/lighttpd，'x-accel-redirect'用于Nginx
+PORTFOLIO_MEDIA_OFFLOAD = None
+# X-Accel-Redirect使用的Nginx internal location前缀，该location应指向MEDIA_ROOT，例如:
+#   location /protected-media/ { internal; alias /path/to/media/; }
+PORTFOLIO_MEDIA_ACCEL_PREFIX = '/protected-media/'
+# 非按内容寻址的媒体文件的缓存时间（秒），0表示每次用条件请求验证；media/blobs/下的文件固定使用一年的强缓存
+PORTFOLIO_MEDIA_MAX_AGE = 0
+
+# 任务数据存储配置
+# 'json' 使用 portfolio/data.json；'database' 使用Project/Task数据表
+# （先执行 migrate 和 import_data_json 导入数据），以下journal和共享模式只对json后端生效
+PORTFOLIO_STORAGE_BACKEND = 'json'
+# 启用后每次修改只向 data.json.journal 追加记录，由后台线程定期合并为 data.json 快照
+PORTFOLIO_DATA_JOURNAL = False
+# 日志累计多少条记录后触发一次后台合并
+PORTFOLIO_JOURNAL_COMPACT_THRESHOLD = 200
+# 多个worker进程共用data.json时启用：修改时加文件锁，文件变化时才重新加载
+PORTFOLIO_SHARED_DATA = False
+# 看板统计缓存最多保留的条目数，数据保存后整体失效（数据库后端下不启用）
+PORTFOLIO_AGGREGATE_CACHE_SIZE = 128
+
+# 缓存配置
+# pages 用于整页缓存；首页不再单独缓存分类区块的模板片段，
+# 片段只在整页缓存未命中时才会渲染，命中率为零，统一由整页缓存负责；
+# 多个进程共享缓存时可以改用文件缓存，例如:
+#   'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+#   'LOCATION': BASE_DIR / 'cache' / 'pages',
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'portfolio-default',
+    },
+    'pages': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'portfolio-pages',
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    },
+}
+# 首页、项目列表、任务列表、项目详情的整页缓存（含ETag/Last-Modified和304处理）
+PORTFOLIO_PAGE_CACHE_ENABLED = True
+PORTFOLIO_PAGE_CACHE_ALIAS = 'pages'
+# 页面缓存过期时间（秒），None表示直到数据被修改前一直有效
+PORTFOLIO_PAGE_CACHE_TIMEOUT = None
+
+# 性能统计：每个请求的耗时、数据文件读写、模板过滤器调用、ORM查询和图片读写，
+# 通过Server-Timing响应头返回，并以Prometheus文本格式从 /metrics/ 导出
+PORTFOLIO_INSTRUMENTATION_ENABLED = True
+# 是否在响应中加入Server-Timing头（会暴露服务器内部耗时）
+PORTFOLIO_SERVER_TIMING = True
+# 允许访问 /metrics/ 的客户端地址
+PORTFOLIO_METRICS_ALLOWED_IPS = ('127.0.0.1', '::1')
+
+# 响应压缩：按Accept-Encoding使用brotli（需安装brotli包）或gzip，小于阈值（字节）的响应不压缩
+PORTFOLIO_COMPRESSION_ENABLED = True
+PORTFOLIO_COMPRESSION_MIN_SIZE = 1024
+# 任务列表的任务数达到该值时流式渲染：先发送页面框架，再按项目分组逐块发送，None表示不使用
+PORTFOLIO_STREAMING_MIN_ITEMS = 200
+
+# 步骤图片上传时生成的多尺寸版本宽度（像素），只生成比原图窄的版本
+PORTFOLIO_IMAGE_VARIANT_WIDTHS = (320, 640, 1280)
+# 缩略图的最大边长（像素）
+PORTFOLIO_IMAGE_THUMBNAIL_SIZE = 240
+
+# 任务详情页：步骤正文和相关任务滚动到可视区域时再加载
+# 步骤片段接口每批返回的步骤数
+PORTFOLIO_STEP_FRAGMENT_BATCH_SIZE = 5
+# 相关任务最多显示的数量（同分类、workshop相近的任务优先）
+PORTFOLIO_RELATED_TASKS_LIMIT = 6
+
+# 任务文本中 [image:文件名] 标记的渲染结果缓存条目数（按文本内容哈希缓存）
+PORTFOLIO_MARKUP_CACHE_SIZE = 1024
+
+# 图片后处理任务队列：上传请求只保存原图，缩略图等处理由后台线程池完成，任务状态保存在数据库的ImageJob表中
+# 处理线程数
+PORTFOLIO_IMAGE_JOB_WORKERS = 2
+# 设为False时在请求中同步处理，便于调试
+PORTFOLIO_IMAGE_JOBS_ASYNC = True
+# 处于running状态超过该时间（秒）的任务视为进程退出时中断，启动时重新执行
+PORTFOLIO_IMAGE_JOB_STALE_SECONDS = 600
+# 失败的任务在图片进度查询（get_task_images）中保留的时间（秒）
+PORTFOLIO_IMAGE_JOB_FAILED_VISIBLE_SECONDS = 3600
+
+# 图片上传的流式处理：上传内容直接写入媒体目录下的临时文件，超过以下字节数的文件或请求会被拒绝
+PORTFOLIO_UPLOAD_MAX_FILE_SIZE = 10 * 1024 * 1024
+PORTFOLIO_UPLOAD_MAX_REQUEST_SIZE = 50 * 1024 * 1024
+# 一次请求上传多个文件时，并行写入文件的线程数；图片记录在所有文件写完后一次批量写入
+PORTFOLIO_UPLOAD_WORKERS = 4
+
+# 日志配置
+# portfolio的日志以JSON行的形式输出到stdout；请求线程只把记录放入队列，格式化和写出由后台线程完成，
+# 队列已满（stdout输出跟不上）时丢弃记录，丢弃数可在 /metrics/ 的 portfolio_log_records_dropped_total 中查看
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'portfolio.log_handlers.JsonFormatter'},
+    },
+    'filters': {
+        # DEBUG日志按调用位置每10条保留1条，INFO及以上全部保留
+        'sample_debug': {'()': 'portfolio.log_handlers.SamplingFilter', 'rate': 10, 'level': 'INFO'},
+    },
+    'handlers': {
+        'async_json': {
+            'class': 'portfolio.log_handlers.AsyncQueueHandler',
+            'stream': 'ext://sys.stdout',
+            'maxsize': 10000,
+            'formatter': 'json',
+            'filters': ['sample_debug'],
+        },
+    },
+    'loggers': {
+        'portfolio': {'handlers': ['async_json'], 'level': 'INFO', 'propagate': False},
+        # 按模块调整日志级别，例如排查图片上传问题时把以下模块设为DEBUG
+        'portfolio.views': {'level': 'INFO'},
+        'portfolio.image_handlers': {'level': 'INFO'},
+        'portfolio.image_jobs': {'level': 'INFO'},
+    },
+}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
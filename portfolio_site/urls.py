@@ -18,14 +18,30 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from django.urls import re_path
+
+from portfolio.static_assets import serve_static_asset, static_serving_enabled
+from portfolio.media_serving import media_serving_enabled, serve_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('portfolio.urls')),
 ]
 
-# 开发环境下提供静态文件访问
-if settings.DEBUG:
+# 启用静态资源分发时返回collectstatic生成的压缩文件（带预压缩版本和强缓存），
+# 否则只在开发环境下直接提供源文件
+if static_serving_enabled():
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % settings.STATIC_URL.lstrip('/'), serve_static_asset),
+    ]
+elif settings.DEBUG:
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATICFILES_DIRS[0])
+
+# 媒体文件：支持Range和条件请求，可以交给前置服务器发送
+if media_serving_enabled():
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % settings.MEDIA_URL.lstrip('/'), serve_media),
+    ]
+elif settings.DEBUG:
     # 添加媒体文件的访问支持
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)